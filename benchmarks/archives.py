@@ -0,0 +1,86 @@
+"""
+Synthetic archives for the benchmarks.
+
+    python benchmarks/archives.py FOLDER [--size MB] [--members N] [--format zip|zip-stored|tar|tar.gz|tar.xz|tar.bz2]
+
+Members are spread over a few levels of folders, under one top-level folder like a well-behaved package,
+and vary in size around the average. Their contents are half random bytes and half text, so they
+compress to about half, like a typical dataset rather than the best or worst case.
+The same arguments always make the same archive, byte for byte.
+"""
+
+import argparse
+import io
+import os
+import random
+import tarfile
+import zipfile
+
+FORMATS = ("zip", "zip-stored", "tar", "tar.gz", "tar.xz", "tar.bz2")
+
+
+def members(size, count, seed=0):
+    """
+    Yield (name, contents) for count members that add up to about size bytes.
+    """
+    rng = random.Random(seed)
+    words = [bytes(rng.choice(b"abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 10))) for _ in range(500)]
+    left = size
+    for i in range(count):
+        n = left // (count - i)
+        n = max(0, min(left, round(n * rng.uniform(0.5, 1.5)))) if i < count - 1 else left
+        left -= n
+        text = b" ".join(rng.choice(words) for _ in range(n // 12 + 1))[:n - n//2]
+        data = rng.randbytes(n - len(text)) + text
+        name = f"pkg/d{i % 7}/e{i % 43}/m{i:06d}.bin"
+        yield name, data
+
+
+def make(path, format, size, count, seed=0):
+    """
+    Write an archive of count members adding up to about size bytes to path, in format (one of FORMATS).
+
+    Returns path. If it's already there, it's assumed to have been made with the same arguments, and kept.
+    """
+    if os.path.exists(path):
+        return path
+    tmp = path + ".tmp"
+    if format.startswith("zip"):
+        compression = zipfile.ZIP_STORED if format == "zip-stored" else zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(tmp, "w", compression) as z:
+            for name, data in members(size, count, seed):
+                z.writestr(zipfile.ZipInfo(name, (2020, 1, 1, 0, 0, 0)), data, compress_type=compression)
+    else:
+        mode = "w" if format == "tar" else "w:" + format.split(".")[1]
+        with tarfile.open(tmp, mode) as tar:
+            for name, data in members(size, count, seed):
+                info = tarfile.TarInfo(name)
+                info.size, info.mtime, info.mode = len(data), 1577836800, 0o644
+                tar.addfile(info, io.BytesIO(data))
+    os.replace(tmp, path)
+    return path
+
+
+def name(format, size, count, seed=0):
+    """
+    A file name for the archive make() makes with these arguments.
+    """
+    suffix = {"zip": ".zip", "zip-stored": "-stored.zip"}.get(format, "." + format)
+    return f"synthetic-{size}-{count}-{seed}{suffix}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder")
+    parser.add_argument("--size", type=int, default=64, help="MB")
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--format", choices=FORMATS, default="zip")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    os.makedirs(args.folder, exist_ok=True)
+    path = os.path.join(args.folder, name(args.format, args.size << 20, args.members, args.seed))
+    print(make(path, args.format, args.size << 20, args.members, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+How fast does humbugga checksum a cached archive, compared to the 8KiB read loop it used to have?
+
+    python benchmarks/bench_checksum.py [--size MB] [--repeat N]
+
+Writes a file of random bytes to a temporary folder and hashes it with both, once with just sha256 and once
+with sha256, blake2b and md5 together (which the old loop had to do in three passes).
+The file is read once first, so this measures hashing out of the page cache, not the disk.
+Prints one JSON object per case, with the best throughput in MB/s.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import isolate, best
+
+isolate()
+import humbugga
+
+
+def old_loop(file, algorithm):
+    # what _hash_file() did before
+    C = hashlib.new(algorithm)
+    with open(file, 'rb') as f:
+        while buf := f.read(2<<12):
+            C.update(buf)
+    return C.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=256, help="MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file = os.path.join(tmp, "archive.bin")
+        with open(file, "wb") as f:
+            for _ in range(args.size):
+                f.write(os.urandom(2<<19))
+        humbugga.checksums(file) # warm the page cache
+        mb = os.path.getsize(file) / (2<<19)
+
+        cases = {
+            "sha256": (lambda: {'sha256': old_loop(file, 'sha256')},
+                       lambda: humbugga.checksums(file, 'sha256')),
+            "sha256+blake2b+md5": (lambda: {a: old_loop(file, a) for a in ('sha256', 'blake2b', 'md5')},
+                                   lambda: humbugga.checksums(file, 'sha256', 'blake2b', 'md5')),
+        }
+        for case, (old, new) in cases.items():
+            old_time, old_result = best(old, args.repeat)
+            new_time, new_result = best(new, args.repeat)
+            if old_result != new_result:
+                sys.exit(f"{case}: checksums disagree: {old_result} != {new_result}")
+            print(json.dumps({
+                "benchmark": "checksum",
+                "case": case,
+                "size_mb": mb,
+                "old_mb_per_s": round(mb / old_time, 1),
+                "new_mb_per_s": round(mb / new_time, 1),
+                "speedup": round(old_time / new_time, 2),
+                "cpus": os.cpu_count(),
+            }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+How fast does download() go, against a local server that can be made to behave like a slow or far-away one?
+
+    python benchmarks/bench_download.py [--size MB] [--bandwidth MB/s] [--latency MS] [--repeat N]
+
+Cases:
+    plain: one stream from a server that's as fast as it goes, so this is humbugga's own overhead.
+    throttled: the server limits each connection to --bandwidth, as many do; with and without segments=4.
+    latency: --latency before every response, with remote_filenames=True, which costs a HEAD first.
+    resume: the connection drops halfway and download() picks it back up (with no backoff, so this is the
+            protocol's overhead, not the wait); and the same against a server without Range: support, which has to start over.
+Prints one JSON object per case, with the best time, throughput in MB/s, and how many requests and bytes the server handled.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import isolate, best
+from server import serve
+isolate()
+import humbugga
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=64, help="MB")
+    parser.add_argument("--bandwidth", type=float, default=25, help="MB/s per connection, for the throttled case")
+    parser.add_argument("--latency", type=float, default=50, help="milliseconds, for the latency case")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        www, out = os.path.join(tmp, "www"), os.path.join(tmp, "out")
+        os.makedirs(www)
+        with open(os.path.join(www, "file.bin"), "wb") as f:
+            for _ in range(args.size):
+                f.write(os.urandom(2<<19))
+        size = os.path.getsize(os.path.join(www, "file.bin"))
+        mb = size / (2<<19)
+
+        cases = [
+            ("plain", {}, {}),
+            ("plain, segments=4", {}, {'segments': 4}),
+            (f"throttled to {args.bandwidth:g}MB/s", {'bandwidth': args.bandwidth * 1e6}, {}),
+            (f"throttled to {args.bandwidth:g}MB/s, segments=4", {'bandwidth': args.bandwidth * 1e6}, {'segments': 4}),
+            (f"latency {args.latency:g}ms, remote_filenames", {'latency': args.latency / 1000, 'disposition': True}, {'remote_filenames': True}),
+            ("resume", {'fail_after': size // 2}, {}),
+            ("resume, no ranges", {'fail_after': size // 2, 'ranges': False}, {}),
+        ]
+        humbugga.configure_transport(backoff=0)
+        with serve(www) as server:
+            for case, settings, kwargs in cases:
+                settings = {'bandwidth': None, 'latency': 0, 'ranges': True, 'disposition': False, 'fail_after': None, **settings}
+                def setup():
+                    shutil.rmtree(out, ignore_errors=True)
+                    server.reset(**settings)
+                seconds, file = best(lambda: humbugga.download(server.url + "/file.bin", out, progress=False, **kwargs),
+                                     args.repeat, setup)
+                if os.path.getsize(file) != size:
+                    sys.exit(f"{case}: downloaded {os.path.getsize(file)} bytes of {size}")
+                print(json.dumps({
+                    "benchmark": "download",
+                    "case": case,
+                    "size_mb": mb,
+                    "seconds": round(seconds, 4),
+                    "mb_per_s": round(mb / seconds, 1),
+                    "requests": server.stats['requests'],
+                    "bytes_sent": server.stats['bytes'],
+                    "overhead_bytes": server.stats['bytes'] - size,
+                }))
+
+
+if __name__ == "__main__":
+    main()
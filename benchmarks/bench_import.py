@@ -0,0 +1,76 @@
+"""
+How long does `import humbugga` take, and does it drag in the network stack?
+
+    python benchmarks/bench_import.py [--repeat N] [--budget MS]
+
+Imports humbugga in fresh interpreters under `python -X importtime` and reports its cumulative
+import time. Exits non-zero if the median is over budget, or if importing humbugga loaded any
+of the modules that should only be loaded once a download or unpack actually happens.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+# only needed to download or unpack something
+HEAVY = ["requests", "urllib3", "tqdm", "tarfile", "zipfile", "sqlite3", "concurrent.futures", "hashlib", "json"]
+
+
+def run(code):
+    env = dict(os.environ, PYTHONPATH=SRC + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    env.pop("PYTHONDONTWRITEBYTECODE", None) # measure what users get, which is with .pycs
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          env=env, capture_output=True, text=True, check=True)
+
+
+def import_time_us():
+    """
+    humbugga's cumulative import time, in microseconds, from -X importtime's report.
+    """
+    for line in run("import humbugga").stderr.splitlines():
+        fields = [f.strip() for f in line.split("|")]
+        if len(fields) == 3 and fields[2] == "humbugga":
+            return int(fields[1])
+    raise RuntimeError("humbugga missing from -X importtime output")
+
+
+def loaded(code):
+    return set(json.loads(run(code + "; import sys, json; print(json.dumps(sorted(sys.modules)))").stdout))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--budget", type=float, default=25, help="milliseconds")
+    args = parser.parse_args()
+
+    run("import humbugga") # warm up: write the .pycs
+    times = [import_time_us() / 1000 for _ in range(args.repeat)]
+
+    # some interpreters import a few of these at startup already; only count what humbugga added
+    heavy = sorted((loaded("import humbugga") - loaded("pass")) & set(HEAVY))
+
+    result = {
+        "benchmark": "import",
+        "case": "import humbugga",
+        "median_ms": statistics.median(times),
+        "min_ms": min(times),
+        "max_ms": max(times),
+        "budget_ms": args.budget,
+        "heavy_modules": heavy,
+    }
+    print(json.dumps(result))
+
+    if heavy:
+        sys.exit(f"import humbugga imported {', '.join(heavy)}; these should be imported lazily")
+    if result["median_ms"] > args.budget:
+        sys.exit(f"import humbugga took {result['median_ms']:.1f}ms, over the {args.budget}ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+How long does path() take to find a package, with the memo warm, and cold?
+
+    python benchmarks/bench_lookup.py [--packages N] [--calls N]
+
+Installs one small package from a local server, and records --packages more from the same archive so the index
+is a realistic size. Then times:
+    warm: path(pkg) over and over, which is what a training loop does; a stat() and a dict lookup.
+    cold: path(pkg) with the memo emptied first, as after another process installs something; a query of the index.
+    missing: installed() for a package that isn't there.
+Prints one JSON object per case, with the median and 99th percentile latency in microseconds.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import isolate
+from server import serve
+isolate()
+import humbugga
+
+
+def latencies(f, calls, setup=None):
+    times = []
+    for _ in range(calls):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        f()
+        times.append((time.perf_counter() - t) * 1e6)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packages", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as www:
+        with zipfile.ZipFile(os.path.join(www, "pkg.zip"), "w") as z:
+            z.writestr("pkg/data.txt", "hello")
+        with open(os.path.join(www, "pkg.zip"), "rb") as f:
+            checksum = "sha256:" + hashlib.sha256(f.read()).hexdigest()
+        with serve(www) as server:
+            pkg = humbugga.install(server.url + "/pkg.zip", checksum)
+    archive = humbugga._get(pkg)['archive']
+    for i in range(args.packages):
+        humbugga._record_install(f"http://example.com/pkg{i}.zip", f"pkg{i}", archive)
+
+    def cold():
+        humbugga._lookups.clear()
+
+    cases = {
+        "warm": (lambda: humbugga.path(pkg), None),
+        "cold": (lambda: humbugga.path(pkg), cold),
+        "missing": (lambda: humbugga.installed("nope"), None),
+    }
+    for case, (f, setup) in cases.items():
+        median, p99 = latencies(f, args.calls if setup is None else args.calls // 10, setup)
+        print(json.dumps({
+            "benchmark": "lookup",
+            "case": case,
+            "packages": args.packages + 1,
+            "median_us": round(median, 2),
+            "p99_us": round(p99, 2),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+How fast does unpack() extract archives of different shapes: a few big members, or lots of small ones?
+
+    python benchmarks/bench_unpack.py [--size MB] [--members N,N,...] [--formats zip,tar.gz,...] [--repeat N] [--workdir DIR]
+
+Makes synthetic archives (see archives.py) of --size MB in total, split into each of --members members, in each format,
+and unpacks each one the way install() does: with a per-file manifest, hashed along the way.
+Archives are kept in --workdir, if given, so later runs don't have to make them again.
+Prints one JSON object per case, with the best time, files/s and MB/s (of unpacked data).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import isolate, best
+import archives
+isolate()
+import humbugga
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=64, help="MB")
+    parser.add_argument("--members", default="10,1000,10000")
+    parser.add_argument("--formats", default="zip,zip-stored,tar.gz")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workdir")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="humbugga-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    out = os.path.join(workdir, "unpacked")
+    try:
+        for format in args.formats.split(","):
+            for count in map(int, args.members.split(",")):
+                size = args.size << 20
+                archive = archives.make(os.path.join(workdir, archives.name(format, size, count)), format, size, count)
+                manifest = {}
+                def setup():
+                    shutil.rmtree(out, ignore_errors=True)
+                    manifest.clear()
+                seconds, _ = best(lambda: humbugga.unpack(archive, out, progress=False, manifest=manifest), args.repeat, setup)
+                if len(manifest) != count:
+                    sys.exit(f"{format} with {count} members: unpacked {len(manifest)}")
+                mb = sum(size for size, _, _ in manifest.values()) / (2<<19)
+                print(json.dumps({
+                    "benchmark": "unpack",
+                    "case": f"{format}, {count} members",
+                    "size_mb": round(mb, 1),
+                    "archive_mb": round(os.path.getsize(archive) / (2<<19), 1),
+                    "seconds": round(seconds, 4),
+                    "files_per_s": round(count / seconds),
+                    "mb_per_s": round(mb / seconds, 1),
+                    "cpus": os.cpu_count(),
+                }))
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
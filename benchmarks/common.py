@@ -0,0 +1,42 @@
+"""
+Bits the benchmarks share.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+
+def isolate():
+    """
+    Point humbugga at a fresh, temporary data and cache folder, so benchmarks neither see nor touch yours.
+
+    Call this before importing humbugga: the XDG folders are read when it's imported. Returns the folder.
+    """
+    home = tempfile.mkdtemp(prefix="humbugga-bench-")
+    os.environ["XDG_DATA_HOME"] = os.path.join(home, "data")
+    os.environ["XDG_CACHE_HOME"] = os.path.join(home, "cache")
+    os.environ.pop("HUMBUGGA_SHARED_CACHES", None)
+    os.environ.pop("HUMBUGGA_TRACE", None)
+    sys.path.insert(0, SRC)
+    import humbugga
+    humbugga.APP = "humbugga-bench"
+    humbugga.SHARED_CACHES[:] = []
+    return home
+
+
+def best(f, repeat, setup=None):
+    """
+    Run f() repeat times, each after setup() if given, and return the fastest time and the last result.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        result = f()
+        times.append(time.perf_counter() - t)
+    return min(times), result
@@ -0,0 +1,74 @@
+"""
+Compare two sets of benchmark results from run.py, e.g. from before and after a change.
+
+    python benchmarks/compare.py BEFORE.jsonl AFTER.jsonl
+
+Matches results up by benchmark and case, and prints each of their measurements side by side,
+with how many times bigger or smaller the second is. If a file has several results for
+the same case (from running run.py more than once into it), the last one is used.
+"""
+
+import argparse
+import json
+import sys
+
+# measurements where bigger is better; for the rest (times, bytes, requests), smaller is
+HIGHER_IS_BETTER = ("mb_per_s", "files_per_s")
+# what run.py adds, and other things that aren't measurements
+IGNORE = {"benchmark", "case", "commit", "dirty", "python", "implementation", "platform", "machine", "cpus",
+          "timestamp", "budget_ms", "size_mb", "archive_mb", "packages"}
+
+
+def load(file):
+    results = {}
+    with open(file) as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                results[(result["benchmark"], result.get("case", ""))] = result
+    return results
+
+
+def describe(results):
+    commits = {r.get("commit") for r in results.values()}
+    commit = commits.pop() if len(commits) == 1 else None
+    r = next(iter(results.values()), {})
+    return f"{(commit or '?')[:10]}{'+' if r.get('dirty') else ''} python {r.get('python', '?')} on {r.get('machine', '?')}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    print(f"before: {describe(before)}")
+    print(f"after:  {describe(after)}")
+    print()
+
+    rows = []
+    for key in before.keys() | after.keys():
+        if key not in before or key not in after:
+            print(f"{key[0]}: {key[1]}: only {'after' if key in after else 'before'}", file=sys.stderr)
+            continue
+        old, new = before[key], after[key]
+        for metric in old:
+            if metric in IGNORE or metric not in new:
+                continue
+            a, b = old[metric], new[metric]
+            if not isinstance(a, (int, float)) or not isinstance(b, (int, float)) or isinstance(a, bool):
+                continue
+            ratio = b / a if a else float("inf") if b else 1.0
+            better = ratio > 1 if metric in HIGHER_IS_BETTER else ratio < 1
+            mark = "" if abs(ratio - 1) < 0.05 else " (better)" if better else " (worse)"
+            rows.append((f"{key[0]}: {key[1]}", metric, f"{a:g}", f"{b:g}", f"{ratio:.2f}x{mark}"))
+
+    rows.sort()
+    widths = [max([len(r[i]) for r in rows] + [0]) for i in range(4)]
+    for row in rows:
+        print("  ".join(c.ljust(w) for c, w in zip(row, widths)) + "  " + row[4])
+
+
+if __name__ == "__main__":
+    main()
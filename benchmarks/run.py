@@ -0,0 +1,93 @@
+"""
+Run all the benchmarks, and save their results in one file, to compare later with compare.py.
+
+    python benchmarks/run.py [--out FILE] [--only NAME,NAME,...] [-- ARGS...]
+
+Runs each bench_*.py here (or just --only those, like --only download,unpack) in its own process, so one
+can't warm up caches for the next, and writes one JSON object per line to --out (default: stdout):
+each benchmark's results, with when and where they were measured added on, so results from different
+commits or machines can be told apart. Anything after -- is passed on to every benchmark, e.g. -- --size 16
+(so only use options they all have, with --only).
+A benchmark that fails is reported and skipped; the exit status says whether any did.
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """
+    Where and when these results come from.
+    """
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--", "src")),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def main():
+    argv = sys.argv[1:]
+    extra = []
+    if "--" in argv:
+        argv, extra = argv[:argv.index("--")], argv[argv.index("--") + 1:]
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", help="file to write results to (appended to)")
+    parser.add_argument("--only", help="comma-separated benchmark names, like download,unpack")
+    args = parser.parse_args(argv)
+
+    scripts = sorted(glob.glob(os.path.join(HERE, "bench_*.py")))
+    if args.only:
+        wanted = set(args.only.split(","))
+        scripts = [s for s in scripts if os.path.basename(s)[len("bench_"):-len(".py")] in wanted]
+        if not scripts:
+            sys.exit(f"No benchmarks named {args.only}")
+
+    env = environment()
+    out = open(args.out, "a") if args.out else sys.stdout
+    failed = []
+    try:
+        for script in scripts:
+            name = os.path.basename(script)
+            print(f"Running {name}...", file=sys.stderr)
+            proc = subprocess.run([sys.executable, script, *extra], stdout=subprocess.PIPE, text=True)
+            for line in proc.stdout.splitlines():
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue # not a result
+                out.write(json.dumps({**result, **env}) + "\n")
+                out.flush()
+            if proc.returncode != 0:
+                print(f"{name} failed (exit status {proc.returncode})", file=sys.stderr)
+                failed.append(name)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if failed:
+        sys.exit(f"Failed: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
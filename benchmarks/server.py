@@ -0,0 +1,225 @@
+"""
+A local stand-in for the servers humbugga downloads from, for the benchmarks.
+
+    python benchmarks/server.py FOLDER [--port N] [--bandwidth MB/s] [--latency MS] [--no-ranges] [--no-conditional] [--disposition]
+
+Serves the files in FOLDER over HTTP/1.1 with keep-alive, ETags and Last-Modified, and as much of real
+servers' behaviour as humbugga cares about, every bit of it adjustable:
+
+    bandwidth: bytes/s per connection (None: as fast as it goes); servers often throttle each connection
+    latency: seconds before each response, like a round trip to somewhere far away
+    ranges: whether to honour Range: (and If-Range:) requests
+    conditional: whether to answer If-None-Match: and If-Modified-Since: with 304 Not Modified when they match
+    disposition: whether to send Content-Disposition: attachment; filename="..."
+    fail_after: drop the connection after sending this many bytes of a body, once (for resuming)
+    unavailable: answer this many requests with 503 Service Unavailable first (for retrying)
+
+Used as a library, serve() runs it on a background thread:
+
+    with serve(folder, bandwidth=10e6) as server:
+        humbugga.download(server.url + "/file.zip", ...)
+        server.stats  # {'requests': ..., 'bytes': ...}
+"""
+
+import argparse
+import email.utils
+import http.server
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def do_GET(self):
+        self.respond(body=True)
+
+    def respond(self, body):
+        server = self.server
+        with server.lock:
+            server.stats['requests'] += 1
+            unavailable = server.unavailable > 0
+            if unavailable:
+                server.unavailable -= 1
+        if unavailable:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if server.latency:
+            time.sleep(server.latency)
+
+        file = os.path.join(server.root, os.path.normpath("/" + self.path.split("?")[0]).lstrip("/"))
+        if not os.path.isfile(file):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        st = os.stat(file)
+        size = st.st_size
+        etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+        modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+
+        if server.conditional and self.not_modified(etag, int(st.st_mtime)):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", modified)
+            self.end_headers()
+            return
+
+        start, end, status = 0, size - 1, 200
+        requested = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if server.ranges and requested and (if_range is None or if_range in (etag, modified)):
+            m = re.fullmatch(r"bytes=(\d*)-(\d*)", requested.strip())
+            if m and (m[1] or m[2]):
+                if m[1]:
+                    start, end = int(m[1]), min(int(m[2]) if m[2] else size - 1, size - 1)
+                else:
+                    start, end = max(0, size - int(m[2])), size - 1 # the last N bytes
+                if start >= size:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", modified)
+        self.send_header("Accept-Ranges", "bytes" if server.ranges else "none")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        if server.disposition:
+            self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(file)}"')
+        self.end_headers()
+        if body:
+            self.send_body(file, start, end + 1)
+
+    def not_modified(self, etag, mtime):
+        # If-None-Match wins over If-Modified-Since when there's both: https://www.rfc-editor.org/rfc/rfc9110#section-13.2.2
+        if (tags := self.headers.get("If-None-Match")) is not None:
+            tags = [t.strip() for t in tags.split(",")]
+            return "*" in tags or etag in [t[2:] if t.startswith("W/") else t for t in tags] # a weak comparison
+        if (since := self.headers.get("If-Modified-Since")) is not None:
+            try:
+                return mtime <= email.utils.parsedate_to_datetime(since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def send_body(self, file, start, end):
+        server = self.server
+        chunk = 2<<15
+        began = time.perf_counter()
+        sent = 0
+        with open(file, "rb") as f:
+            f.seek(start)
+            while start + sent < end:
+                data = f.read(min(chunk, end - start - sent))
+                with server.lock:
+                    if server.fail_after is not None and sent + len(data) > server.fail_after:
+                        data = data[:server.fail_after - sent]
+                        server.fail_after = None # only once
+                        drop = True
+                    else:
+                        drop = False
+                    server.stats['bytes'] += len(data)
+                self.wfile.write(data)
+                sent += len(data)
+                if drop:
+                    self.close_connection = True
+                    self.wfile.flush()
+                    self.connection.shutdown(2)
+                    return
+                if server.bandwidth:
+                    # sleep off however far ahead of the allowed rate we are
+                    ahead = sent / server.bandwidth - (time.perf_counter() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root, port=0, bandwidth=None, latency=0, ranges=True, conditional=True, disposition=False, fail_after=None, unavailable=0):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.root = os.fspath(root)
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.ranges = ranges
+        self.conditional = conditional
+        self.disposition = disposition
+        self.fail_after = fail_after
+        self.unavailable = unavailable
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'bytes': 0}
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError): # clients hanging up early is part of the job
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset(self, **settings):
+        """
+        Zero the stats, and change any of the settings.
+        """
+        with self.lock:
+            for k, v in settings.items():
+                if not hasattr(self, k):
+                    raise TypeError(f"Unknown setting: {k}")
+                setattr(self, k, v)
+            self.stats = {'requests': 0, 'bytes': 0}
+
+
+@contextmanager
+def serve(root, **settings):
+    """
+    Run a Server for the files in root on a background thread, for as long as the with block.
+    """
+    server = Server(root, **settings)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--bandwidth", type=float, help="MB/s per connection")
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds")
+    parser.add_argument("--no-ranges", action="store_true")
+    parser.add_argument("--no-conditional", action="store_true")
+    parser.add_argument("--disposition", action="store_true")
+    args = parser.parse_args()
+    server = Server(args.root, port=args.port, bandwidth=args.bandwidth and args.bandwidth * 1e6,
+                    latency=args.latency / 1000, ranges=not args.no_ranges, conditional=not args.no_conditional, disposition=args.disposition)
+    print(f"Serving {args.root} at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,48 @@
 
 
-import importlib.resources
-
+import importlib, sys
 import pathlib, os.path
 from string import hexdigits
 from urllib.parse import urlparse
-import hashlib
-import tarfile, zipfile, tempfile, shutil
 import warnings
+import io, stat, time, re, posixpath, bisect
+import threading, contextvars, itertools, heapq
 
 import xdg.BaseDirectory
-import requests
-from tqdm import tqdm
+
+
+class _LazyModule:
+    """
+    Stands in for a module, and imports it the first time something is used from it.
+
+    Most processes only ever call path(), so they shouldn't have to pay for importing the network stack.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        try:
+            return getattr(module, attr)
+        except AttributeError:
+            return importlib.import_module(f"{self._name}.{attr}") # a submodule, like concurrent.futures
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+
+tarfile, zipfile, tempfile, shutil = map(_LazyModule, ['tarfile', 'zipfile', 'tempfile', 'shutil'])
+json, sqlite3, mmap = map(_LazyModule, ['json', 'sqlite3', 'mmap'])
+fcntl, socket = map(_LazyModule, ['fcntl', 'socket'])
+concurrent, queue = map(_LazyModule, ['concurrent', 'queue'])
+hashlib, zlib = map(_LazyModule, ['hashlib', 'zlib'])
+gzip, bz2, lzma, ctypes = map(_LazyModule, ['gzip', 'bz2', 'lzma', 'ctypes'])
+logging = _LazyModule('logging')
+requests = _LazyModule('requests')
+tqdm = _LazyModule('tqdm')
 
 
 def cgi_parse_header(line):
@@ -88,7 +119,6 @@ def cgi_parse_header(line):
             if s[i] == '\\':
                 # backslashes quote the following characters
                 # maybe we want .decode('string_escape') here?
-                print(f"skipping |{s[i:i+2]}|")
                 i+=2
             elif s[i] == '"':
                 i+=1
@@ -139,7 +169,6 @@ def cgi_parse_header(line):
                 value, line = parse_quotedstring(line)
             else:
                 value, line = parse_token(line)
-            print(param, value, line)
             line = line.lstrip()
 
             param = param.lower() # case insensitive
@@ -150,8 +179,6 @@ def cgi_parse_header(line):
     type = type.lower() # case insensitive
     return type, dict(params())
 
-import cgi
-cgi.parse_header = cgi_parse_header
 
 
 def tokenize_content_disp(disp):
@@ -265,11 +292,11 @@ def tokenize_content_range(resp_range):
         raise ValueError("Both Content-Range:'s region and size are unknown. This is supposed to be disallowed.")
 
     # integrity check
+    # the region doesn't have to run to the end of the file: segmented downloads ask for regions in the middle.
+    # callers that asked for an open-ended range notice a short region by the file size not adding up at the end.
     if range_size is not None and range_region is not None:
-        if not (range_region[1] == range_size - 1):
+        if not (0 <= range_region[0] <= range_region[1] < range_size):
             raise ValueError(f"Inconsistent Content-Range: region={range_region} vs size={range_size}")
-            # TODO: in theory we can handle the case where the server wants to send us a partial region and not the whole region
-            # butttt that's hard.
 
     return range_unit, range_region, range_size
 
@@ -292,10 +319,7 @@ def resp_attachment_filename(resp):
     #
 
     if v := resp.headers.get('Content-Disposition'):
-        print(v)
-        import time; time.sleep(1)
-        print()
-        type, params = cgi.parse_header(v)
+        type, params = cgi_parse_header(v)
         if type == "attachment":
             if 'filename' in params:
                 params['filename'] = os.path.basename(sanitize_path(params['filename']))
@@ -303,408 +327,4041 @@ def resp_attachment_filename(resp):
             # XXX what about filename*=UTF-8 ??
 
 
-def download(url, path, remote_filenames=False, progress=True, overwrite='skip'):
+# Instrumentation, for finding out whether installs are slow because of the network, the CPU or the disk.
+#
+# The steps of an install are timed as spans, and every span that finishes is passed to the functions registered
+# with observe(), as a dict:
+#   span:       'install', around the rest of them;
+#               'lock', waiting for other installs of the same url or package;
+#               'head' and 'connect', HTTP requests up until the response headers are in (so including DNS, TCP and TLS,
+#               unless the connection was already open, and the server's time to first byte);
+#               'transfer', the body of a download; 'retry', waiting to retry a request, with the attempt and the reason;
+#               'hash', checksumming a file that's already on disk; 'unpack'; 'rename', moving the package into place;
+#               'metadata', writing the install to the index; 'transform', building an artifact (with transform and version).
+#   start, duration: when it started (time.time()) and how long it took, in seconds.
+#   id, parent: ids of the span and the one it's inside of (in the same thread or asyncio task), if any.
+#   pid, url, pkg, and whichever of these apply: bytes, throughput (bytes/s), retries, status (HTTP),
+#   cache ('hit' or 'miss', or 'installed' if there was nothing to do), files, error (the exception's type, if it failed).
+# With nobody observing, spans are a shared do-nothing object, so all this costs next to nothing.
+
+_observers = []
+_current_span = contextvars.ContextVar('humbugga span', default=None)
+_span_ids = itertools.count(1)
+
+
+def observe(observer):
     """
-    Download the file from url to folder path
+    Call observer(span) with every span that finishes, from whichever thread it finished in. See above for what's in a span.
 
-    Supports HTTP resuming and a progress bar.
+    Returns observer, so this can be used as a decorator.
     """
+    _observers.append(observer)
+    return observer
 
-    
-    path = pathlib.Path(path)
 
-    # make an HEAD request in order to figure out the filename the server wants to use
-    # this is like curl -O
-    # TODO: make this optional? we can just extract it from the input url
-    filename = None
-    if remote_filenames:
-        with requests.head(url, allow_redirects=True) as resp:
-            resp.raise_for_status()
-            filename = resp_attachment_filename(resp)
-    if filename is None:
-        # if the remote server
-        filename = os.path.basename(urlparse(url).path)
+def unobserve(observer):
+    """
+    Stop calling observer.
+    """
+    try:
+        _observers.remove(observer)
+    except ValueError:
+        pass
 
 
-    # we download to .part, and only move it to the real name when it's finished
-    target_file = (path/filename)
-    partial_file = pathlib.Path(str(path/filename)+(".part"))
+class _Span:
+    """
+    A span being timed. Use it as a context manager; set() and add() fill in its fields along the way.
+    """
+    def __init__(self, name, fields):
+        self.fields = {'span': name, **fields}
+        self._lock = threading.Lock() # worker threads can add() to the span they were started in
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def add(self, field, n=1):
+        with self._lock:
+            self.fields[field] = self.fields.get(field, 0) + n
+
+    def __bool__(self):
+        return True
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.fields['id'] = next(_span_ids)
+        if parent is not None:
+            self.fields['parent'] = parent.fields['id']
+            for k in ('url', 'pkg'):
+                if k in parent.fields:
+                    self.fields.setdefault(k, parent.fields[k])
+        self.fields['pid'] = os.getpid()
+        self._token = _current_span.set(self)
+        self.fields['start'] = time.time()
+        self._t = time.perf_counter()
+        return self
+
+    def __exit__(self, type, e, tb):
+        fields = self.fields
+        fields['duration'] = time.perf_counter() - self._t
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            _current_span.set(None) # exited in a different context than it was entered in
+        if type is not None:
+            fields['error'] = type.__name__
+        if fields.get('bytes') and fields['duration'] > 0:
+            fields['throughput'] = fields['bytes'] / fields['duration']
+        for observer in tuple(_observers):
+            try:
+                observer(fields)
+            except Exception as oops:
+                warnings.warn(f"Observer {observer!r} failed: {oops!r}")
 
-    if os.path.exists(target_file):
-        if overwrite == True:
-            pass
-        if overwrite == 'skip':
-            return target_file
-        elif overwrite == False:
-            raise ValueError(f"File exists: {target_file}. Pass overwrite=True to redownload, or overwrite='skip' to ignore this.") # IOError? or something?
-        else:
-            raise ValueError(f"Invalid parameter: overwrite={overwrite}")
 
-    os.makedirs(path, exist_ok=True)
-    with open(partial_file, "ab") as f:
-        if f.tell() > 0:
-            # resumption: https://stackoverflow.com/a/22894873/2898673
-            headers = {'Range': f'bytes={f.tell():d}-'}
-        else:
-            headers = {}
+class _NoSpan:
+    def set(self, **fields):
+        pass
 
-        with requests.get(url, headers=headers, stream=True) as resp:
-            range_size = None
+    def add(self, field, n=1):
+        pass
 
-            if (resp_range := resp.headers.get('Content-Range', None)) is not None:
-                _, range_region, range_size = tokenize_content_range(resp_range)
-            elif (range_size := resp.headers.get('Content-Length', None)) is not None:
-                # server doesn't support Range: or we didn't ask for it, so fall back on Content-Length
-                if f.tell() > 0:
-                    warnings.warn(f"{urlparse(resp.url).netloc} doesn't support byte ranges. Cannot resume.")
-                    f.truncate(0) # and erase any previous work
+    def __bool__(self):
+        return False # so callers can skip working out fields nobody will see
 
-                range_size = int(range_size)
-                range_region = 0, range_size-1
-            else:
-                # we have no idea how much we're downloading
-                range_region = None
+    def __enter__(self):
+        return self
 
-            if range_region is not None and range_region[0] != f.tell():
-                # a malicious server could be trying to get us to write somewhere we're not expecting
-                # or    
-                # XXX this error is can be misleading: if a server responds with Content-Range when we didn't *ask* for it
-                #     in that case, this will read 'we requested 0- but the server tried to write to (N,M)'
-                raise ValueError(f"Range mismatch: we requested {f.tell()}- but the server tried to write to {range_region}")
-
-            with tqdm(
-                desc=filename,
-                unit="B",
-                unit_scale=True,
-                unit_divisor=1024, # why is 1024 the right number here??
-                initial=range_region[0] if range_region else 0,
-                total=range_size,
-                disable=not progress,
-            ) as bar:
-                for chunk in resp.iter_content(chunk_size=(2<<12)):
-                    size=f.write(chunk)
-                    bar.update(size) # tqdm doesn't count bytes right unless via .update()
+    def __exit__(self, *exc):
+        pass
 
-        # 
-        if os.stat(partial_file).st_size == range_size or range_size is None:
-            os.rename(partial_file, target_file)
+_NO_SPAN = _NoSpan()
 
 
-    return target_file
+def _span(name, **fields):
+    """
+    Time a step called name. fields go into the span as they are; url and pkg are taken from the enclosing span if not given.
+    """
+    if not _observers:
+        return _NO_SPAN
+    return _Span(name, fields)
 
 
-# This file is gigabytes large, too large to include directly in the package.
-# track https://github.com/pypa/warehouse/issues/7852 for better ideas.
-#download('http://www.nltk.org/images/authors.png', '.')
-download('https://www.dropbox.com/s/pwokjjnrexg0zl6/cohenadad_cv__20190424.pdf?dl=1', '.')
- # sha256:4a3bdc0e81e30be9e91603bf4395e1dc17beb469c33dc563795391f382a1904b
-download('https://github.com/sct-data/PAM50/releases/download/r20201104/PAM50-r20201104.zip', '.')
+def _annotate(**fields):
+    """
+    Add fields to the innermost span around the caller, if there is one.
+    """
+    if _observers and (span := _current_span.get()) is not None:
+        span.set(**fields)
 
 
-def unpack(archive, path):
-    formats = {'.zip': zipfile.ZipFile,
-               '.tar.gz': tarfile.open,
-               '.tgz': tarfile.open,
-               '.tar.xz': tarfile.open,
-               '.tar.bz2': tarfile.open}
-    _, format = os.path.splitext(archive)
-    # TODO: https://docs.python.org/3/library/shutil.html#shutil.unpack_archive
-    
-    try:
-        format = formats[format]
-    except KeyError:
-        raise ValueError(f"Unsupported archive format: {format}")
+def _count(field, n=1):
+    """
+    Add n to field of the innermost span around the caller, if there is one.
+    """
+    if _observers and (span := _current_span.get()) is not None:
+        span.add(field, n)
 
-    with format(archive) as archive:
-        archive.extractall(path)
 
-# ---------------
+# prefetch() installs run with their Prefetch here, so downloads can report their progress to it
+_prefetching = contextvars.ContextVar('humbugga prefetch', default=None)
 
-APP = None
 
-if APP is None:
-    warnings.warn("You should set humbugga.APP = 'your-app-name'; or, set humbugga.APP = '_auto' to take the app name from how it is called by the OS (sys.argv[0]).")
-if APP == '_auto':
-    import sys
-    APP = sys.argv[0]
+def _expect(total, have=0):
+    """
+    Say that a download of total bytes (None if unknown), of which we already have `have`, is starting.
+    """
+    if (handle := _prefetching.get()) is not None:
+        with handle._lock:
+            handle._bytes, handle._total = have, total
 
 
-def install(url, checksum=None, pkg=None):
+def _transferred(n):
     """
-    
+    Count n more bytes downloaded, in the span around the caller and in the prefetch() it's part of, if any.
+    """
+    _count('bytes', n)
+    if (handle := _prefetching.get()) is not None:
+        with handle._lock:
+            handle._bytes += n
 
-    
+
+class JSONLinesSink:
     """
+    An observer that appends every span to file as a line of JSON.
 
-    # TODO:
-    # - if given pkg= then we can support versioning:
-    # - check metadata/"pkg"/pkg/source; is it the same as URL? if not, download the new one
-    #   - probably wanna be careful to not *uninstall* the old one until the new one is downloaded and checksummed
+        humbugga.observe(humbugga.JSONLinesSink("spans.jsonl"))
 
-    # 1. Check if url is already installed. If so, skip.
-    # 2. If not, download it
-    #   -> check the *cache* first, and check for partially downloaded files too.
-    #   -> there 
-    #  downloading means:
-    #  1. do
-    #  2. check the checksum
-    #  
-    # why is the flow so tangly here?
-    # download:
-    # -> if the file doesn't exist in the cache, call download()
-        # -> difficult case: there's more than one cache to check
-    # -> assert the file does exist in the cache now (or else download() gave an exception)
-    # -> check its checksum (if bad give an exception)
-       # -> if no checksum: assume good?
-    # 
-    # 3. unpack and install
-    # -> 
-    # -> write to the database
-    #   -> catch: there's more than one database to check
+    Each line goes out in a single write to a file opened for appending, so several processes can share one file.
+    Setting $HUMBUGGA_TRACE to a file name does this when humbugga is imported.
+    """
+    def __init__(self, file):
+        self.file = os.fspath(file)
+        self._fd = None
+        self._lock = threading.Lock()
 
-    # how do I know if I file is installed from its URL?
-    # -> by looking in the database for something marked from this specific URL
+    def __call__(self, span):
+        if self._fd is None:
+            with self._lock:
+                if self._fd is None:
+                    self._fd = os.open(self.file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        os.write(self._fd, (json.dumps(span) + "\n").encode())
 
-    # the error messages could be better
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
 
-    # 
+    def __repr__(self):
+        return f"JSONLinesSink({self.file!r})"
 
-    # argument parsing
-    # TODO: validate url? or should we just leave that up to requests?
-    if checksum is not None:
-        if ':' not in checksum:
-            raise ValueError(f"Invalid checksum: missing 'algorithm:' specifier: '{checksum}'")
-        
-        algorithm, checksum = checksum.split(":", 1)
-        try:
-            algorithm = getattr(hashlib, algorithm) # ...?hackable?
-        except AttributeError:
-            raise ValueError(f"Invalid checksum: unknown algorithm {algorithm}")
 
-        if not (len(checksum) == len(algorithm().hexdigest()) and all(c in hexdigits for c in checksum)):
-            raise ValueError(f"Invalid checksum: incorrect checksum format for '{algorithm}': {C}. I")
+class LoggingSink:
+    """
+    An observer that logs every span, to the 'humbugga' logger by default, at DEBUG level (errors at WARNING).
 
-        checksum = checksum.lower() # case-insensitive
+        logging.basicConfig(level=logging.DEBUG)
+        humbugga.observe(humbugga.LoggingSink())
 
-    # skip if installed
-    if (pkg is not None and installed(pkg)) or (pkg is None and installed(url)):
-        if _get(pkg or url)['source'] == url:
-            warnings.warn(f"{url} already installed.")
+    The span itself is attached to each record as record.span, for handlers that want the numbers.
+    """
+    def __init__(self, logger='humbugga', level=None):
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.level = logging.DEBUG if level is None else level
+
+    def __call__(self, span):
+        level = logging.WARNING if 'error' in span else self.level
+        if not self.logger.isEnabledFor(level):
             return
+        message = f"{span['span']} {span.get('pkg') or span.get('url') or ''}: {span['duration']*1000:.1f}ms"
+        if 'bytes' in span:
+            message += f", {span['bytes']} bytes"
+        if 'throughput' in span:
+            message += f" ({span['throughput']/(2<<19):.1f}MiB/s)"
+        for k in ('cache', 'retries', 'status', 'error'):
+            if k in span:
+                message += f", {k}={span[k]}"
+        self.logger.log(level, message, extra={'span': span})
+
+    def __repr__(self):
+        return f"LoggingSink({self.logger.name!r})"
+
+
+if os.environ.get('HUMBUGGA_TRACE'):
+    observe(JSONLinesSink(os.environ['HUMBUGGA_TRACE']))
+
+
+# all HTTP goes through one shared requests.Session, so connections (and TLS handshakes) get reused
+# across HEADs, GETs, segments and packages.
+_transport = {
+    'connections': 8,  # per host
+    'hosts': {},       # {host: connections}, for hosts that need a different limit
+    'retries': 5,
+    'backoff': 0.5,    # seconds before the first retry; doubled every time after
+    'timeout': 60,     # seconds to wait on a silent server before retrying
+}
+_RETRY_STATUSES = (408, 429, 500, 502, 503, 504) # worth trying again
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure_transport(connections=None, hosts=None, retries=None, backoff=None, timeout=None):
+    """
+    Set how humbugga talks to servers. Anything not given is left as it is.
 
-    # set up the cache
-    cache = xdg.BaseDirectory.save_cache_path(os.path.join(APP,'humbugga')) # TODO: add /var/lib/$APP or /var/cache to the cache paths, and use it if we have write access to it
-    encoded_url = urlkey(url)
-    subcache = encoded_url
-    subcache = os.path.join(subcache[:2], subcache[2:4], subcache[4:])
-    cache = os.path.join(cache, subcache)
-    os.makedirs(subcache, exist_ok=True)
+    connections: how many connections to keep open to each host (default 8). Beyond that, downloads wait their turn.
+    hosts: {host: connections} for hosts that need a different limit, e.g. {'osf.io': 2}.
+    retries: how many times to retry a failed request, or resume a download whose connection dropped (default 5).
+    backoff: seconds to wait before the first retry (default 0.5); it doubles every time after.
+    timeout: seconds to wait on a server that has gone quiet before giving up on the connection and retrying (default 60).
+    """
+    global _session
+    with _session_lock:
+        for k, v in dict(connections=connections, hosts=hosts, retries=retries, backoff=backoff, timeout=timeout).items():
+            if v is not None:
+                _transport[k] = v
+        _session = None # rebuilt on next use; requests already in flight keep the old one
 
-    # download the package to the cache
-    file = download(url, cache)
 
-    if checksum is not None:
-        C = algorithm() # initialize the checksum algorithm
-        with open(file,'rb') as f:
-            print("checksumming",file) # DEBUG
-            while buf := f.read(2<<12):
-                C.update(buf) # this is probably really really slow
-        if C.hexdigest() != checksum:
-            raise ValueError(f"Invalid checksum: {file}")
-    else:
-        warnings.warn(f"Integrity check disabled for {url}.")
+def _http():
+    """
+    The shared requests.Session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            # connection failures and these statuses are retried by urllib3, before we ever see a response;
+            # connections that drop mid-download are download()'s business, since it has to resume them
+            retry = requests.adapters.Retry(
+                total=_transport['retries'],
+                backoff_factor=_transport['backoff'],
+                status_forcelist=_RETRY_STATUSES,
+                allowed_methods=('HEAD', 'GET'),
+                raise_on_status=False) # hand back the last response, for raise_for_status()
+            def adapter(connections):
+                # pool_block: hold extra requests back, rather than opening connections beyond the limit
+                return requests.adapters.HTTPAdapter(pool_maxsize=connections, pool_block=True, max_retries=retry)
+            session = requests.Session()
+            session.headers['User-Agent'] = 'humbugga'
+            session.mount('http://', adapter(_transport['connections']))
+            session.mount('https://', adapter(_transport['connections']))
+            for host, connections in _transport['hosts'].items():
+                session.mount(f'http://{host}/', adapter(connections))
+                session.mount(f'https://{host}/', adapter(connections))
+            _session = session
+        return _session
+
+
+def _request(method, url, **kwargs):
+    """
+    _http().request(), timed as a 'head' or 'connect' span: the response comes back once its headers are in.
+    """
+    with _span('head' if method == 'HEAD' else 'connect', url=url) as span:
+        resp = _http().request(method, url, timeout=_transport['timeout'], **kwargs)
+        if span:
+            retries = getattr(resp.raw, 'retries', None) # urllib3's, from before we ever saw a response
+            span.set(status=resp.status_code, retries=len(retries.history) if retries is not None else 0)
+    return resp
 
-    # unpack
-    # *if* the folder contained a single folder, like a polite package, use that folder as its package name; but if it doesn't, use its archive name
-    # we unpack to a temporary folder *first* and then rename instead of deciding which mode to use and unpacking directly because zipfile lacks
-    # a clean API to determine what's in each folder: https://stackoverflow.com/questions/58888465/python-zipfile-get-top-level-directory-within-the-zipfile
-    # (plus this way avoids buggy partial installs)
 
-    data = pathlib.Path(xdg.BaseDirectory.save_data_path(APP)) # TODO: consider .load_data_paths(APP)
-    subdata = pathlib.Path(tempfile.mkdtemp(suffix=".part", dir=data))
+def _is_transient(e):
+    # a dropped or stalled connection, which is worth resuming
+    return isinstance(e, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
 
-    # TODO: if we just don't do this we could maybe support non-archive files too, like a large image or something
-    unpack(file, subdata)
 
-    if len(os.listdir(subdata))==1 and os.path.isdir(subdata/(os.listdir(subdata)[0])):
-        if pkg is None:
-            pkg = os.listdir(subdata)[0]
-        # uninstall the previous version
-        # at this point we know, either:
-        # - pkg is None and not installed(url) or
-        # - pkg is not None and installed(pkg) # -> need to uninstall
-        if (pkg is not None and installed(pkg)):
-            uninstall(pkg)
-        os.rename(subdata/(os.listdir(subdata)[0]), data/pkg) # this should be atomic since it's on the same filesystem since one is a subdir of the other.
-        os.rmdir(subdata)
-    else:
-        if pkg is None:
-            pkg = os.path.basename(file) # name for the pkg; used as a shortname, later; sort of janky that the *server* gets to pick this.
-            pkg, _ = os.path.splitext(pkg)
+def _backoff(attempt, url, e):
+    """
+    Wait before retrying url after error e, or re-raise e if we're out of retries.
+    """
+    delay = _retry_delay(attempt, url, e)
+    with _span('retry', url=url, attempt=attempt+1, reason=type(e).__name__):
+        time.sleep(delay)
 
-        # uninstall the previous version
-        # at this point we know, either:
-        # - pkg is None and not installed(url) or
-        # - pkg is not None and installed(pkg) # -> need to uninstall
-        # TODO: merge
-        if (pkg is not None and installed(pkg)):
-            uninstall(pkg)
 
-        os.rename(subdata, data/pkg)
+def _retry_delay(attempt, url, e):
+    """
+    How long _backoff() waits, or re-raise e if we're out of retries.
+    """
+    if attempt >= _transport['retries']:
+        raise e
+    delay = _transport['backoff'] * 2**attempt
+    warnings.warn(f"{urlparse(url).netloc}: {e}. Retrying in {delay:g}s.")
+    _count('retries')
+    return delay
 
 
-    # write record of installation
-    metadata = pathlib.Path(xdg.BaseDirectory.save_data_path(os.path.join(APP, 'humbugga')))
-    
-    os.makedirs(metadata/"pkgs"/pkg, exist_ok=True)
-    with open(metadata/"pkgs"/pkg/"source","w") as source:
-        print(url, file=source)
-    
-    # index by source url
-    os.makedirs(metadata/"sources", exist_ok=True)
-    with open(metadata/"sources"/encoded_url,"w") as s:
-        print(pkg, file=s)
+class _NoRanges(Exception):
+    """
+    The server ignored our Range: request.
+    """
+
 
-    # TODO: walk the installed files and checksum each of them individually, the way pip does.
-    # and add a .integrity(pkg) call that
-    # maybe slip it into .path() to autoprotect everything.
+def _download_segmented(url, partial_file, segments, desc=None, progress=True):
+    """
+    Download url into partial_file as `segments` byte ranges fetched concurrently, one connection each.
 
+    partial_file is preallocated to the full size and each segment writes its own region of it.
+    Per-segment progress is kept in partial_file.json, so an interrupted download resumes every segment;
+    if that exists, its plan is reused and `segments` is ignored.
 
-def urlkey(url):
+    Every segment is requested with If-Range:, so if the file changes partway through, the server stops
+    sending byte ranges, and that is handled the same as a server that doesn't support them.
+
+    Returns the file's HTTP validators (see _validators()) when partial_file is complete,
+    or None if the server doesn't support byte ranges, in which case partial_file has been emptied
+    and the caller should fall back to a single stream.
     """
-    Get an encoded key from a URL
-    This is used to index downloads on disk safely.
+    state_file = pathlib.Path(str(partial_file)+".json")
+    target_file = str(partial_file)[:-len(".part")]
+
+    if state_file.exists():
+        with open(state_file) as s:
+            state = json.load(s)
+    else:
+        with _request('HEAD', url, allow_redirects=True) as resp:
+            resp.raise_for_status()
+            size = resp.headers.get('Content-Length', None)
+            if resp.headers.get('Accept-Ranges', 'none').lower() != 'bytes' or size is None:
+                return None
+            size = int(size)
+            validators = _validators(resp, size)
+
+        # if a single-stream download was interrupted, keep what it got and split up the rest
+        done = os.path.getsize(partial_file) if os.path.exists(partial_file) else 0
+        partial = _load_record(target_file).get('partial', {})
+        if done > size or not partial or any(partial.get(k) != validators.get(k) for k in partial):
+            done = 0 # can't be the same file, or there's no telling
+        bounds = [done + (size-done)*i//segments for i in range(segments+1)]
+        # each segment is [start, end, pos]: an inclusive byte range and the next byte we need in it
+        state = {'size': size,
+                 'validators': validators,
+                 'segments': [[a, b-1, a] for a, b in zip(bounds, bounds[1:]) if b > a]}
+
+        with open(partial_file, "ab") as f:
+            if done == 0:
+                f.truncate(0)
+            f.truncate(size)
+            if hasattr(os, 'posix_fallocate') and size > 0:
+                os.posix_fallocate(f.fileno(), 0, size) # reserve the space now rather than finding out we're out of it halfway
+        with open(state_file, "w") as s:
+            json.dump(state, s)
+
+    size = state['size']
+    validators = state.get('validators', {})
+    headers = {'If-Range': if_range} if (if_range := _if_range(validators)) else {}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def save():
+        with lock:
+            with open(str(state_file)+".tmp", "w") as s:
+                json.dump(state, s)
+            os.replace(str(state_file)+".tmp", state_file)
+
+    def fetch(segment):
+        attempt = 0
+        while True:
+            try:
+                return fetch_once(segment)
+            except Exception as e:
+                if not _is_transient(e) or stop.is_set():
+                    raise
+                _backoff(attempt, url, e) # and then pick up from wherever the segment got to
+                attempt += 1
+
+    def fetch_once(segment):
+        start, end, pos = segment
+        if pos > end:
+            return
+        with _request('GET', url, headers={'Range': f'bytes={pos:d}-{end:d}', **headers}, stream=True) as resp:
+            resp.raise_for_status()
+            if resp.status_code != 206 or (resp_range := resp.headers.get('Content-Range', None)) is None:
+                raise _NoRanges(url)
+            _, range_region, range_size = tokenize_content_range(resp_range)
+            if range_region is None or range_region[0] != pos or (range_size is not None and range_size != size):
+                raise ValueError(f"Range mismatch: we requested {pos}-{end} of {size} but the server sent {resp_range}")
+
+            with open(partial_file, "r+b") as f:
+                f.seek(pos)
+                unsaved = 0
+                try:
+                    for chunk in resp.iter_content(chunk_size=(2<<15)):
+                        chunk = chunk[:end+1-pos] # never spill into the next segment
+                        pos += f.write(chunk)
+                        bar.update(len(chunk))
+                        _transferred(len(chunk))
+                        unsaved += len(chunk)
+                        if unsaved >= (2<<22) or pos > end:
+                            # only record progress that's actually made it out of our buffers
+                            f.flush()
+                            segment[2] = pos
+                            unsaved = 0
+                            save()
+                        if pos > end or stop.is_set():
+                            break
+                finally:
+                    f.flush()
+                    segment[2] = pos # so a retry resumes from here
+        if pos <= end and not stop.is_set():
+            raise ValueError(f"Short read: {url} ended at byte {pos} of segment {start}-{end}")
+
+    _annotate(segments=len(state['segments']))
+    _expect(size, sum(pos-start for start, _, pos in state['segments']))
+    with tqdm.tqdm(
+        desc=desc,
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        initial=sum(pos-start for start, _, pos in state['segments']),
+        total=size,
+        disable=not progress,
+    ) as bar:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(state['segments']) or 1) as pool:
+            # each in a copy of our context, so what they do is counted in the span around this
+            futures = [pool.submit(contextvars.copy_context().run, fetch, segment) for segment in state['segments']]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+            except _NoRanges:
+                stop.set()
+                concurrent.futures.wait(futures)
+                warnings.warn(f"{urlparse(url).netloc} doesn't support byte ranges, or {url} changed partway through. Downloading in a single stream.")
+                os.unlink(state_file)
+                with open(partial_file, "r+b") as f:
+                    f.truncate(0) # the preallocated file would otherwise look like a resumable download
+                _record_validators(target_file, 'partial', None)
+                return None
+            except BaseException:
+                stop.set() # tell the other segments to wrap up; their progress is saved below
+                concurrent.futures.wait(futures)
+                save()
+                raise
+
+    os.unlink(state_file)
+    return validators
+
+
+class _CRC32:
     """
-    return hashlib.sha256(url.encode("utf-8")).hexdigest() # uhhh is this what I want? this seems kind of nasty
+    zlib.crc32 dressed up as a hashlib object, so _hash_into() can compute it alongside the real hashes.
+    """
+    name = 'crc32'
 
+    def __init__(self):
+        self.value = 0
 
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
 
-def _get(pkg):
+
+_hash_local = threading.local()
+
+
+def _hash_into(file, hashes, size=None):
     """
-    Find if pkg is installed
+    Feed file (or just its first size bytes) to every hash object in hashes, in a single pass.
 
-    pkg can be:
-    - the installed pkg name
-    - the source url
-    - the *encoded* source url
-        # check both by URL
-        # XXX is there a risk of namespace collisions here? could someone exploit it by crafting a URL to look a certain way?
+    Reads go into a handful of preallocated buffers with readinto(), on their own thread, so the disk
+    (or the network filesystem) and the hashing overlap. With several hashes, each gets its own thread.
+    hashlib and zlib let go of the GIL on big buffers, so this really does run in parallel.
+    Small files aren't worth the threads, and just get a plain loop.
+
+    Returns how many bytes were hashed.
     """
-    metadatas = xdg.BaseDirectory.load_data_paths(os.path.join(APP, 'humbugga'))
-    for metadata in metadatas:
-        metadata = pathlib.Path(metadata)
+    with open(file, 'rb', buffering=0) as f:
+        length = os.fstat(f.fileno()).st_size
+        if size is not None:
+            length = min(length, size)
+
+        if length <= 4*_HASH_CHUNK:
+            if not hasattr(_hash_local, 'buf'):
+                _hash_local.buf = memoryview(bytearray(_HASH_CHUNK))
+            buf, left = _hash_local.buf, length
+            while left > 0 and (n := f.readinto(buf[:min(left, _HASH_CHUNK)])):
+                for C in hashes:
+                    C.update(buf[:n])
+                left -= n
+            return length - left
+
+        free, full = queue.Queue(), queue.Queue()
+        for _ in range(4):
+            free.put(memoryview(bytearray(_HASH_CHUNK)))
+        stop = threading.Event()
+
+        def read():
+            try:
+                left = length
+                while left > 0 and not stop.is_set():
+                    buf = free.get()
+                    if not (n := f.readinto(buf[:min(left, _HASH_CHUNK)])):
+                        break
+                    full.put((buf, n))
+                    left -= n
+                full.put(None)
+            except BaseException as e:
+                full.put(e)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(hashes)-1) if len(hashes) > 1 else None
+        total = 0
+        try:
+            while (item := full.get()) is not None:
+                if isinstance(item, BaseException):
+                    raise item
+                buf, n = item
+                if pool is not None:
+                    # the first hash runs here, the others on the pool
+                    futures = [pool.submit(C.update, buf[:n]) for C in hashes[1:]]
+                    hashes[0].update(buf[:n])
+                    for future in futures:
+                        future.result()
+                else:
+                    hashes[0].update(buf[:n])
+                total += n
+                free.put(buf)
+        finally:
+            stop.set()
+            free.put(memoryview(bytearray(0))) # in case the reader is waiting for a buffer; it reads nothing into it and quits
+            reader.join()
+            if pool is not None:
+                pool.shutdown()
+        return total
+
+
+_HASH_CHUNK = 2<<19
+
+
+def _hash_file(file, algorithm, C=None):
+    """
+    Checksum a file.
 
-        if (metadata/"pkgs"/pkg).exists():
-            # pkg specified as package name
-            with open(metadata/"pkgs"/pkg/"source") as s:
-                source = s.readline().strip()
-            encoded_url = urlkey(source)
+    algorithm: a hashlib algorithm name, e.g. 'sha256'
+    C: an already-started hash object to keep feeding, instead of starting a new one.
 
-            # integrity check
-            with open(metadata/"sources"/encoded_url) as s:
-                pkg_ = s.readline().strip()
-                assert pkg == pkg_
+    Returns the hash object.
+    """
+    if C is None:
+        C = hashlib.new(algorithm)
+    with _span('hash', file=os.fspath(file), algorithm=algorithm) as span:
+        span.set(bytes=_hash_into(file, [C]))
+    return C
 
-        elif (metadata/"sources"/(encoded_url:=pkg)).exists():
-            # pkg specified as encoded source url
-            with open(metadata/"sources"/encoded_url) as s:
-                pkg = s.readline().strip()
 
-            # integrity check
-            with open(metadata/"pkgs"/pkg/"source") as s:
-                source = s.readline().strip()
-                assert urlkey(source) == encoded_url
-        elif (metadata/"sources"/(encoded_url:=urlkey(pkg))).exists():
-            # pkg specified as source url
-            source = pkg
-            with open(metadata/"sources"/encoded_url) as s:
-                pkg = s.readline().strip()
-
-            # integrity check
-            with open(metadata/"pkgs"/pkg/"source") as s:
-                source_ = s.readline().strip()
-                assert source == source_
-        else:
-            continue
+def checksums(file, *algorithms):
+    """
+    Checksum file with several algorithms at once, reading it only once.
 
-        data = pathlib.Path(xdg.BaseDirectory.save_data_path(APP)) # TODO: consider .load_data_paths(APP)
-        path = data / pkg
-        
-        return {'name': pkg, 'source': source, 'encoded_url': encoded_url, 'path': path}
-    raise KeyError(f'{pkg} is not installed')
-    
-    
-def installed(pkg):
+        humbugga.checksums(file, 'sha256', 'blake2b', 'md5')
+
+    algorithms are hashlib names (default: sha256), or 'crc32'.
+    Returns {algorithm: hexdigest}.
     """
+    hashes = [_CRC32() if a == 'crc32' else hashlib.new(a) for a in (algorithms or ('sha256',))]
+    with _span('hash', file=os.fspath(file), algorithm="+".join(algorithms or ('sha256',))) as span:
+        span.set(bytes=_hash_into(file, hashes))
+    return {a: (f"{C.value:08x}" if a == 'crc32' else C.hexdigest()) for a, C in zip(algorithms or ('sha256',), hashes)}
+
+
+def _recorded_digest(file, algorithm):
+    """
+    Look up the digest of file recorded by _record_digest().
+
+    The record is only trusted if the file's size and mtime haven't changed since.
+    Returns None if there isn't one.
     """
     try:
-         _get(pkg)
-         return True
-    except KeyError:
-        return False
+        with open(str(file)+".json") as r:
+            record = json.load(r)
+        st = os.stat(file)
+    except (OSError, ValueError):
+        return None
+    if (record.get('size'), record.get('mtime_ns')) != (st.st_size, st.st_mtime_ns):
+        return None
+    return record.get('digests', {}).get(algorithm)
 
 
-def clean(unused=True):
+def _record_digest(file, algorithm, digest):
     """
-    Erase cache
+    Remember that file has been verified to have the given digest, so we don't need to re-read it next time.
 
-    unused: if True, keep installed packages. If False, erase everything.
+    The record is kept next to the file in file.json, along with the file's size and mtime at the time.
     """
-    raise NotImplemented
+    st = os.stat(file)
+    record = _load_record(file)
+    if (record.get('size'), record.get('mtime_ns')) != (st.st_size, st.st_mtime_ns):
+        # the old digests are for some other version of the file; the HTTP validators are looked after by download()
+        record = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'digests': {},
+                  **{k: record[k] for k in ('http', 'partial') if k in record}}
+    record.setdefault('digests', {})[algorithm] = digest
+    _save_record(file, record)
 
 
-def uninstall(pkg):
+def _load_record(file):
+    try:
+        with open(str(file)+".json") as r:
+            return json.load(r)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_record(file, record):
+    record_file = str(file)+".json"
+    tmp = f"{record_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as r:
+        json.dump(record, r)
+    os.replace(tmp, record_file)
+
+
+# HTTP validators: what the server said identifies the version of a file we have.
+# file.json keeps them under 'http' for file itself and under 'partial' for the download in file.part, if any;
+# a segmented download keeps them in its .part.json instead.
+
+def _validators(resp, size=None):
     """
-    pkg: either the package name or the pkg's original source url
+    The validators in response resp, for a file that's size bytes long in all.
     """
-    p = _get(pkg)
+    return {k: v for k, v in (('etag', resp.headers.get('ETag')),
+                              ('last_modified', resp.headers.get('Last-Modified')),
+                              ('size', size)) if v is not None}
 
-    data = pathlib.Path(xdg.BaseDirectory.save_data_path(APP)) # TODO: consider .load_data_paths(APP)
-    shutil.rmtree(data/p['name'])
-    metadata = pathlib.Path(xdg.BaseDirectory.save_data_path(os.path.join(APP, 'humbugga')))
-    shutil.rmtree(metadata/"pkgs"/p['name'])
-    os.unlink(metadata/"sources"/p['encoded_url'])
 
+def _record_validators(file, key, validators):
+    record = _load_record(file)
+    if validators is None:
+        record.pop(key, None)
+    else:
+        record[key] = validators
+    _save_record(file, record)
 
-def path(pkg):
+
+def _if_range(validators):
     """
-    Get the path to the given package.
+    What to send as If-Range: when resuming the version described by validators, or None if there's nothing usable.
+    """
+    # If-Range needs a strong validator; a weak ETag doesn't promise the bytes are the same
+    if (etag := validators.get('etag')) and not etag.startswith('W/'):
+        return etag
+    return validators.get('last_modified')
 
-    This is analogous to importlib.resources in python. It is a lot simpler though, because our packages only ever have one root folder.
+
+def _revalidate(url, file):
     """
-    # this is in *most* 
-    p = _get(pkg)
-    return pathlib.Path(p['path'])
+    Whether the file downloaded from url is still what the server has, going by the validators recorded for it.
 
+    This costs one conditional request, which the server should answer with a bodyless 304 Not Modified.
+    Without any validators to go on, the answer is False.
+    Returns (current, resp): if there's a new version, resp is the server's (still open) response with it, to download
+    instead of asking again; the caller has to close it.
+    """
+    validators = _load_record(file).get('http')
+    if not validators or not ('etag' in validators or 'last_modified' in validators):
+        return False, None
+    headers = {}
+    if 'etag' in validators:
+        headers['If-None-Match'] = validators['etag']
+    if 'last_modified' in validators:
+        headers['If-Modified-Since'] = validators['last_modified']
+    resp = _request('GET', url, headers=headers, stream=True)
+    try:
+        if resp.status_code == 304:
+            resp.close()
+            return True, None
+        resp.raise_for_status()
+        # the server may have ignored the conditions; compare for ourselves, without reading the body
+        size = resp.headers.get('Content-Length')
+        fresh = _validators(resp, int(size) if size is not None else None)
+        if 'etag' in validators:
+            current = fresh.get('etag') == validators['etag']
+        else:
+            current = (fresh.get('last_modified'), fresh.get('size')) == (validators['last_modified'], validators.get('size'))
+    except BaseException:
+        resp.close()
+        raise
+    if current:
+        resp.close()
+        return True, None
+    return False, resp
 
-def list(): # XXX namespace collision oops
+
+def _replay(file, C=None, sink=None, size=None):
     """
-    Get the list of packages installed for the current app.
+    Read the first size bytes of file (or all of it) into hash object C and/or the sink function.
+    """
+    if sink is None:
+        if C is not None:
+            _hash_into(file, [C], size)
+        return
+    with open(file, 'rb') as f:
+        while buf := f.read(2<<15 if size is None else min(2<<15, size)):
+            if C is not None:
+                C.update(buf)
+            if sink is not None:
+                sink(buf)
+            if size is not None:
+                size -= len(buf)
+
+
+def _finish_download(partial_file, target_file):
+    """
+    Move a finished download from partial_file to target_file, along with what's recorded about it.
+    """
+    os.rename(partial_file, target_file)
+    # what described the download now describes the file
+    record = _load_record(target_file)
+    if 'partial' in record:
+        record['http'] = record.pop('partial')
+    else:
+        record.pop('http', None)
+    _save_record(target_file, record)
+
+
+def _stream(url, f, target_file, C=None, sink=None, state=None, desc=None, progress=True, resp=None):
+    """
+    Download url onto the end of the open file f (which is target_file.part), resuming from however much of it is there.
+    If f is empty, resp can be a response to a plain GET of url already on its way, to download from (and close) instead of asking again.
+
+    Unless state['caught_up'], what's already in the file is fed to C and sink first, and then state['caught_up'] is set;
+    so if this fails partway, a retry knows not to do that again.
+    If the server answers a resume with all of the file, that's downloaded instead, into a new hash object,
+    which is left in state['C']; unless there's a sink, which can't be started over, and then _NoRanges is raised.
+    Returns the size of the whole file, if the server said.
+    """
+    state = {} if state is None else state
+    partial_file = str(target_file)+".part"
+    validators = _load_record(target_file).get('partial') if f.tell() > 0 else None
+    if f.tell() > 0 and not validators:
+        # a .part we know nothing about (e.g. from an older version): there's no telling whether the server
+        # still has the same file, and resuming a different one would splice two versions together
+        if state.get('caught_up'):
+            raise _NoRanges(url)
+        warnings.warn(f"Nothing recorded about which version of {url} {partial_file} is. Starting over.")
+        f.truncate(0)
+        f.seek(0)
+    if f.tell() > 0:
+        # resumption: https://stackoverflow.com/a/22894873/2898673
+        headers = {'Range': f'bytes={f.tell():d}-'}
+        if validators and (if_range := _if_range(validators)):
+            # only if it's still the same file; otherwise the server sends all of the new one, instead of
+            # a piece of it that we'd splice onto a piece of the old one
+            headers['If-Range'] = if_range
+    else:
+        headers = {}
+
+    changed = False
+    with resp if resp is not None else _request('GET', url, headers=headers, stream=True) as resp:
+        range_size = None
+
+        if resp.status_code == 416 and f.tell() > 0 and (resp_range := resp.headers.get('Content-Range', None)) is not None:
+            # "bytes */size": we asked to start past the end. if it's right at the end, we already have all of it
+            _, _, range_size = tokenize_content_range(resp_range)
+            if range_size == f.tell():
+                if not state.get('caught_up') and (C is not None or sink is not None):
+                    _replay(partial_file, C, sink, f.tell())
+                state['caught_up'] = True
+                return range_size
+        resp.raise_for_status()
+
+        if (resp_range := resp.headers.get('Content-Range', None)) is not None:
+            _, range_region, range_size = tokenize_content_range(resp_range)
+            if validators and validators.get('size') not in (None, range_size):
+                changed = True # no usable If-Range, but the size gives it away
+        else:
+            # server doesn't support Range:, or the file changed under If-Range:, or we didn't ask for it;
+            # so fall back on Content-Length
+            if f.tell() > 0:
+                if state.get('caught_up'):
+                    # C and sink have already seen what we'd be erasing. C can start over on this response, sink can't
+                    if sink is not None:
+                        raise _NoRanges(url)
+                    C = state['C'] = hashlib.new(C.name) if C is not None else None
+                    state['caught_up'] = False
+                if 'If-Range' in headers and resp.headers.get('Accept-Ranges', 'none').lower() == 'bytes':
+                    warnings.warn(f"{url} has changed since this download started. Starting over.")
+                else:
+                    warnings.warn(f"{urlparse(resp.url).netloc} doesn't support byte ranges. Cannot resume.")
+                f.truncate(0) # and erase any previous work
+                f.seek(0) # truncate() doesn't move the position, and tell() is what we check the server against
+
+            if (range_size := resp.headers.get('Content-Length', None)) is not None:
+                range_size = int(range_size)
+                range_region = 0, range_size-1
+            else:
+                # we have no idea how much we're downloading
+                range_region = None
+
+        if range_region is not None and range_region[0] != f.tell():
+            # a malicious server could be trying to get us to write somewhere we're not expecting
+            # or    
+            # XXX this error is can be misleading: if a server responds with Content-Range when we didn't *ask* for it
+            #     in that case, this will read 'we requested 0- but the server tried to write to (N,M)'
+            raise ValueError(f"Range mismatch: we requested {f.tell()}- but the server tried to write to {range_region}")
+
+        if not changed:
+            if f.tell() == 0 or not validators:
+                # remember which version of the file this is, for resuming it, and later for _revalidate()
+                _record_validators(target_file, 'partial', _validators(resp, range_size))
+
+            if not state.get('caught_up') and f.tell() > 0 and (C is not None or sink is not None):
+                _replay(partial_file, C, sink, f.tell()) # catch up on what we already have
+            state['caught_up'] = True
+
+            _copy(resp, f, C, sink, desc, range_size, progress)
+
+    if changed:
+        if state.get('caught_up'):
+            raise _NoRanges(url)
+        warnings.warn(f"{url} has changed since this download started. Starting over.")
+        f.truncate(0)
+        f.seek(0)
+        _record_validators(target_file, 'partial', None)
+        return _stream(url, f, target_file, C, sink, state, desc, progress)
+
+    return range_size
+
+
+def _copy(resp, f, C, sink, desc, range_size, progress):
+    """
+    Write the body of resp onto f, and feed it to hash object C and the sink function too, with a progress bar.
+    """
+    _expect(range_size, f.tell())
+    with tqdm.tqdm(
+        desc=desc,
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024, # why is 1024 the right number here??
+        initial=f.tell(),
+        total=range_size,
+        disable=not progress,
+    ) as bar:
+        for chunk in resp.iter_content(chunk_size=(2<<15)):
+            size=f.write(chunk)
+            if C is not None:
+                C.update(chunk)
+            if sink is not None:
+                sink(chunk)
+            bar.update(size) # tqdm doesn't count bytes right unless via .update()
+            _transferred(size)
+
+
+def download(url, path, remote_filenames=False, progress=True, overwrite='skip', segments=1, algorithm=None, sink=None):
+    """
+    Download the file from url to folder path
+
+    Supports HTTP resuming and a progress bar.
+
+    segments: if more than 1, split the file into that many byte ranges and download them concurrently,
+              for servers that throttle each connection. Falls back to a single stream if the server
+              doesn't honour Range:. An interrupted segmented download resumes all of its segments.
+    algorithm: a hashlib algorithm name, e.g. 'sha256'. If given, the file is checksummed as it is
+               written, and (file, hexdigest) is returned instead of just file. The digest is None if
+               the download didn't complete.
+    sink: a function that is called with each chunk of the file, in order, as it arrives.
+          Whatever was already downloaded is passed to it first, including the whole file if
+          it was already there.
+    overwrite: what to do if the file is already there: 'skip' it, overwrite it (True), raise an error (False),
+               or 'update' it if the server has a different version now, which only costs a 304 if it doesn't.
     """
-    def _list():
-        metadatas = xdg.BaseDirectory.load_data_paths(os.path.join(APP, 'humbugga'))
-        for metadata in metadatas:
-            metadata = pathlib.Path(metadata)
-            for pkg in os.listdir(metadata/"pkgs"):
-                yield pkg
-    return sorted(_list())
-
-
-APP='glove'
-#install('http://nlp.stanford.edu/data/glove.840B.300d.zip', 'sha256:c06db255e65095393609f19a4cfca20bf3a71e20cc53e892aafa490347e3849f')
-#install('https://github.com/sct-data/PAM50/releases/download/r20201104/PAM50-r20201104.zip', 'sha256:db50286e268f4886335fb1edc83b431cae40a9e05487360628c46b3002dd0918')
-install('https://github.com/sct-data/PAM50/releases/download/r20201104/PAM50-r20201104.zip', pkg='PAM50')
-install('https://github.com/sct-data/PAM50/releases/download/r20191029/20191029_pam50.zip', pkg='PAM50')
-#install('http://www.nltk.org/images/authors.png')
-#install('https://www.dropbox.com/s/pwokjjnrexg0zl6/cohenadad_cv__20190424.pdf?dl=1', '.')
-p = path('https://github.com/sct-data/PAM50/releases/download/r20201104/PAM50-r20201104.zip')
-os.system(f'ls -l {p}')
-p = path('sct-data-PAM50-13be1fe')
-os.system(f'ls -l {p}')
-
-import pprint; pprint.pprint(list())
-
-raise SystemExit(1)
+
+    
+    path = pathlib.Path(path)
+
+    # make an HEAD request in order to figure out the filename the server wants to use
+    # this is like curl -O
+    # TODO: make this optional? we can just extract it from the input url
+    filename = None
+    if remote_filenames:
+        with _request('HEAD', url, allow_redirects=True) as resp:
+            resp.raise_for_status()
+            filename = resp_attachment_filename(resp)
+    if filename is None:
+        # if the remote server
+        filename = os.path.basename(urlparse(url).path)
+
+
+    # we download to .part, and only move it to the real name when it's finished
+    target_file = (path/filename)
+    partial_file = pathlib.Path(str(path/filename)+(".part"))
+
+    resp = None # the new version, if asking whether there is one got it
+    if os.path.exists(target_file):
+        if overwrite == 'update':
+            current, resp = _revalidate(url, target_file)
+            overwrite = 'skip' if current else True
+        if overwrite == True:
+            pass
+        elif overwrite == 'skip':
+            if sink is not None:
+                digest = _recorded_digest(target_file, algorithm) if algorithm is not None else None
+                C = hashlib.new(algorithm) if algorithm is not None and digest is None else None
+                _replay(target_file, C, sink)
+                digest = digest or (C.hexdigest() if C is not None else None)
+            elif algorithm is not None:
+                digest = _recorded_digest(target_file, algorithm) or _hash_file(target_file, algorithm).hexdigest()
+            if algorithm is not None:
+                return target_file, digest
+            return target_file
+        elif overwrite == False:
+            raise ValueError(f"File exists: {target_file}. Pass overwrite=True to redownload, or overwrite='skip' to ignore this.") # IOError? or something?
+        else:
+            raise ValueError(f"Invalid parameter: overwrite={overwrite}")
+
+    os.makedirs(path, exist_ok=True)
+
+    with _span('transfer', url=url):
+        if resp is not None:
+            # it's on its way already, so take it in one stream, from the start, instead of whatever's left of a previous try
+            if os.path.exists(str(partial_file)+".json"):
+                os.unlink(str(partial_file)+".json")
+            open(partial_file, "wb").close()
+            _record_validators(target_file, 'partial', None)
+        elif segments > 1 or os.path.exists(str(partial_file)+".json"):
+            if (validators := _download_segmented(url, partial_file, segments, desc=filename, progress=progress)) is not None:
+                os.rename(partial_file, target_file)
+                _record_validators(target_file, 'http', validators or None)
+                _record_validators(target_file, 'partial', None)
+                # segments arrive out of order, so they can't be hashed (or passed on) as they come in
+                C = hashlib.new(algorithm) if algorithm is not None else None
+                if C is not None or sink is not None:
+                    _replay(target_file, C, sink)
+                if algorithm is not None:
+                    return target_file, C.hexdigest()
+                return target_file
+
+        with open(partial_file, "ab") as f:
+            # C is the hash; caught_up is whether it and sink have been fed what was in the .part before we started
+            state = {'C': hashlib.new(algorithm) if algorithm is not None else None, 'caught_up': False}
+            range_size = None
+            attempt = 0
+            try:
+                while True:
+                    given, resp = resp, None # only the first try can use it
+                    try:
+                        range_size = _stream(url, f, target_file, state['C'], sink, state, filename, progress, given)
+                        break
+                    except _NoRanges:
+                        # resuming a dropped connection, but this time the server ignored our Range:, or the file changed
+                        if sink is not None:
+                            raise ConnectionError(f"{urlparse(url).netloc} stopped honouring byte ranges, so {url} can't be resumed; and what's been passed on can't be taken back.")
+                        warnings.warn(f"{url} can't be resumed. Starting over.")
+                        f.truncate(0)
+                        f.seek(0)
+                        state['C'] = hashlib.new(algorithm) if algorithm is not None else None
+                        state['caught_up'] = False
+                    except Exception as e:
+                        if not _is_transient(e):
+                            raise
+                        f.flush()
+                        _backoff(attempt, url, e) # and then resume from wherever we got to
+                        attempt += 1
+            except BaseException:
+                f.flush()
+                if f.tell() == 0:
+                    os.unlink(partial_file) # nothing worth resuming, e.g. a 404
+                raise
+
+            f.flush() # so the size check sees everything we wrote
+            C = state['C']
+            if os.stat(partial_file).st_size == range_size or range_size is None:
+                _finish_download(partial_file, target_file)
+            else:
+                C = None
+
+
+        if algorithm is not None:
+            return target_file, (C.hexdigest() if C is not None else None)
+        return target_file
+
+
+
+
+def _zip_member_path(path, name):
+    """
+    Where zipfile.extractall() would put member name under path:
+    with absolute paths, drive letters, '.' and '..' components dropped.
+    """
+    name = name.replace('/', os.path.sep)
+    if os.path.altsep:
+        name = name.replace(os.path.altsep, os.path.sep)
+    name = os.path.splitdrive(name)[1]
+    name = os.path.sep.join(x for x in name.split(os.path.sep) if x not in ('', os.path.curdir, os.path.pardir))
+    return os.path.join(path, name)
+
+
+def _unpack_zip(archive, path, jobs=None, progress=True, manifest=None, reuse=None, members=None):
+    """
+    Extract a zip, spreading its members over a pool of threads.
+
+    Each thread has its own handle on the archive and its own copy buffer.
+    zlib lets go of the GIL while it decompresses, so threads are enough to use all the cores.
+    If manifest is a dict, each file is also hashed on its way to disk; see unpack().
+    A member that the central directory says has the same name, size and CRC-32 as a file in reuse might be that file;
+    a CRC-32 is easy to forge, so the member is hashed, and only linked to the file if its digest matches too.
+    """
+    with zipfile.ZipFile(archive) as z:
+        infos = z.infolist()
+    if members is not None:
+        infos = [info for info in infos if info.filename in members]
+
+    # make all the folders up front, in one pass, so the workers don't fight over makedirs()
+    folders = set()
+    files = []
+    for info in infos:
+        target = _zip_member_path(path, info.filename)
+        if info.is_dir():
+            folders.add(target)
+        else:
+            folders.add(os.path.dirname(target))
+            files.append((info, target))
+    for folder in sorted(folders):
+        os.makedirs(folder, exist_ok=True)
+
+    previous = {(entry[5], entry[1], entry[4]): entry for entry in reuse or () if entry[4] is not None}
+    files = [(info, target, previous.get((_relpath(target, path), info.file_size, info.CRC))) for info, target in files]
+
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def extract(batch):
+        if not hasattr(local, 'zip'):
+            local.zip = zipfile.ZipFile(archive)
+            local.buf = memoryview(bytearray(2<<19))
+            with handles_lock:
+                handles.append(local.zip)
+        for info, target, entry in batch:
+            if entry is not None:
+                # hashing it is still cheaper than writing it out
+                C = hashlib.new(_MANIFEST_ALGORITHM)
+                with local.zip.open(info) as src:
+                    while n := src.readinto(local.buf):
+                        C.update(local.buf[:n])
+                digest = f"{_MANIFEST_ALGORITHM}:{C.hexdigest()}"
+                if digest == entry[3] and _link_installed(entry, target):
+                    if manifest is not None:
+                        manifest[_relpath(target, path)] = (info.file_size, digest, info.CRC)
+                    bar.update(1)
+                    continue
+            C = hashlib.new(_MANIFEST_ALGORITHM) if manifest is not None else None
+            with local.zip.open(info) as src, open(target, "wb") as dst:
+                while n := src.readinto(local.buf):
+                    dst.write(local.buf[:n])
+                    if C is not None:
+                        C.update(local.buf[:n])
+            if C is not None:
+                # zipfile has already checked the data against info.CRC, so that's the file's crc32 too
+                manifest[_relpath(target, path)] = (info.file_size, f"{_MANIFEST_ALGORITHM}:{C.hexdigest()}", info.CRC)
+            bar.update(1)
+
+    # hand out members in batches of about 4MiB, so small files don't drown in per-task overhead.
+    # biggest first, so one huge member doesn't get started last and hold everything up
+    batches, batch, batch_size = [], [], 0
+    for info, target, entry in sorted(files, key=lambda f: -f[0].file_size):
+        batch.append((info, target, entry))
+        batch_size += info.file_size
+        if batch_size >= (2<<21):
+            batches.append(batch)
+            batch, batch_size = [], 0
+    if batch:
+        batches.append(batch)
+
+    with tqdm.tqdm(desc=os.path.basename(archive), unit="file", total=len(files), disable=not progress) as bar:
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+                for future in concurrent.futures.as_completed([pool.submit(extract, batch) for batch in batches]):
+                    future.result()
+        finally:
+            for handle in handles:
+                handle.close()
+
+
+def _unpack_tar(archive, path, jobs=None, progress=True, manifest=None, reuse=None, members=None):
+    """
+    Extract a (possibly compressed) tarball in a single streaming pass, without seeking back.
+
+    With reuse, members that turn out to be on disk already are linked instead, but big ones that only
+    looked like they might be (see _extract_tar()) take a second pass.
+    """
+    with tqdm.tqdm(desc=os.path.basename(archive), unit="file", disable=not progress) as bar:
+        with tarfile.open(archive, "r|*") as tar:
+            redo = _extract_tar(tar, path, jobs=jobs, bar=bar, manifest=manifest, reuse=reuse, only=members)
+        if redo:
+            with tarfile.open(archive, "r|*") as tar:
+                _extract_tar(tar, path, jobs=jobs, bar=bar, manifest=manifest, only=redo)
+
+
+def _extract_tar(tar, path, jobs=None, bar=None, manifest=None, reuse=None, only=None):
+    """
+    tar.extractall(path), and if manifest is a dict, fill it in as described in unpack().
+
+    tarfile extracts one member at a time, so each file is hashed by a pool of threads
+    while tarfile gets on with the next ones; it is still in the page cache by then.
+
+    reuse is as in unpack(). Tarballs don't carry checksums, so a member the same size as a file in reuse
+    is hashed as it's read, instead of written out, and linked to the file with the same digest, if any.
+    If there isn't one, and the member was too big to hold on to, its data has gone by and can't be read again
+    in this pass; the names of those members are returned, to extract in another pass with only=.
+    """
+    on_disk = {}
+    for entry in reuse or ():
+        if entry[1]:
+            on_disk.setdefault(entry[1], {})[entry[3]] = entry
+    redo = set()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        hashed = []
+        def members():
+            for member in tar:
+                if only is not None and member.name not in only:
+                    continue
+                if member.islnk() and member.linkname in redo:
+                    redo.add(member.name) # it'd be a link to a file that isn't there yet
+                    continue
+                if member.isreg() and member.size in on_disk:
+                    if not _reuse_tar_member(tar, member, path, on_disk[member.size], manifest):
+                        redo.add(member.name)
+                        continue
+                else:
+                    yield member
+                    # we only get here once tarfile has extracted member
+                    if manifest is not None and member.isreg():
+                        target = _zip_member_path(path, member.name)
+                        hashed.append((target, pool.submit(_manifest_entry, target)))
+                if bar is not None:
+                    bar.update(1)
+        tar.extractall(path, members=members())
+        for target, future in hashed:
+            manifest[_relpath(target, path)] = future.result()
+    return redo
+
+
+_TAR_KEEP = 2<<20 # members up to this big are held in memory while they're checked, see _reuse_tar_member()
+
+
+def _reuse_tar_member(tar, member, path, candidates, manifest=None):
+    """
+    Read tar's current member, and if it's one of candidates ({digest: entry in reuse}), link that into path in its place.
+
+    If it isn't, and it's small enough to have been held on to, write it out like tarfile would have.
+    Returns False if it had to be let go of unwritten.
+    """
+    C, crc = hashlib.new(_MANIFEST_ALGORITHM), _CRC32()
+    kept = [] if member.size <= _TAR_KEEP else None
+    with tar.extractfile(member) as f:
+        while chunk := f.read(2<<19):
+            C.update(chunk)
+            crc.update(chunk)
+            if kept is not None:
+                kept.append(chunk)
+    digest = f"{_MANIFEST_ALGORITHM}:{C.hexdigest()}"
+    target = _zip_member_path(path, member.name)
+    if (entry := candidates.get(digest)) is None or not _link_installed(entry, target, member.mode):
+        if kept is None:
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.writelines(kept)
+        os.chmod(target, member.mode & 0o7777)
+        os.utime(target, (member.mtime, member.mtime))
+    if manifest is not None:
+        manifest[_relpath(target, path)] = (member.size, digest, crc.value)
+    return True
+
+
+def _link_installed(entry, target, mode=None):
+    """
+    Hardlink the installed file in reuse entry (see unpack()) to target, if it's still the way it was installed.
+
+    mode is the permissions the file is meant to have; if given, they have to agree on whether it's executable.
+    Returns whether it did.
+    """
+    file, size, mtime_ns = entry[:3]
+    try:
+        st = os.stat(file)
+        if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+            return False # someone's been editing it
+        if mode is not None and (st.st_mode ^ mode) & stat.S_IXUSR:
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.link(file, target)
+    except OSError: # it's gone, or it's on another filesystem
+        return False
+    return True
+
+
+_MANIFEST_ALGORITHM = 'sha256'
+
+
+def _manifest_entry(file):
+    """
+    (size, 'algorithm:hexdigest', crc32) of file, for the per-file manifest.
+    """
+    C, crc = hashlib.new(_MANIFEST_ALGORITHM), _CRC32()
+    size = _hash_into(file, [C, crc])
+    return size, f"{_MANIFEST_ALGORITHM}:{C.hexdigest()}", crc.value
+
+
+def _relpath(target, path):
+    # manifest paths are always /-separated
+    return os.path.relpath(target, path).replace(os.path.sep, '/')
+
+
+def unpack(archive, path, jobs=None, progress=True, manifest=None, reuse=None, members=None):
+    """
+    Extract archive into folder path.
+
+    Zips are extracted by `jobs` threads (default: one per cpu); tarballs are streamed.
+
+    manifest: if a dict, it is filled with {path relative to path: (size, 'algorithm:hexdigest', crc32)}
+              for every regular file extracted, hashed in parallel with the extraction.
+    reuse: files already on disk, as [(file, size, mtime_ns, 'algorithm:hexdigest', crc32, name)]; members with the same
+           contents are hardlinked to them instead of being extracted again. A file that's been changed since
+           (going by its size and mtime) isn't used. name is where the file would be under path; zip members are
+           only checked against the file with their own name, tar members against any file the same size.
+    members: if given, only extract the members with these names (as the archive lists them).
+    """
+    formats = {'.zip': _unpack_zip,
+               '.tar.gz': _unpack_tar,
+               '.tgz': _unpack_tar,
+               '.tar.xz': _unpack_tar,
+               '.tar.bz2': _unpack_tar}
+    # TODO: https://docs.python.org/3/library/shutil.html#shutil.unpack_archive
+
+    for format in formats:
+        if str(archive).endswith(format):
+            break
+    else:
+        _, format = os.path.splitext(archive)
+        raise ValueError(f"Unsupported archive format: {format}")
+
+    with _span('unpack', archive=os.fspath(archive)) as span:
+        formats[format](archive, path, jobs=jobs, progress=progress, manifest=manifest, reuse=reuse, members=members)
+        if span and manifest is not None:
+            span.set(files=len(manifest), bytes=sum(size for size, _, _ in manifest.values()))
+
+
+_OPEN_ARCHIVES = 64 # zips _Archive keeps open (a file descriptor and a mapping each); the least recently used are closed
+
+
+class _Archive:
+    """
+    The table of contents of a zip or tar archive, for ArchivePath.
+
+    Members are read on demand. Zips are also mmap'd, so that STORED (uncompressed) members
+    can be handed out as views of the mapping without copying them.
+    """
+
+    _cache = {} # file -> _Archive, least recently used first
+    _cache_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, file):
+        """
+        Get the (shared) _Archive for file, re-reading it if the file has changed since.
+        """
+        file = os.fspath(file)
+        st = os.stat(file)
+        stamp = (st.st_size, st.st_mtime_ns)
+        with cls._cache_lock:
+            archive = cls._cache.pop(file, None)
+            if archive is not None and archive.stamp != stamp:
+                archive.close() # replaced, e.g. by an upgrade
+                archive = None
+            if archive is None:
+                archive = cls(file, stamp)
+            cls._cache[file] = archive
+            while len(cls._cache) > _OPEN_ARCHIVES:
+                cls._cache.pop(next(iter(cls._cache))).close()
+            return archive
+
+    def __init__(self, file, stamp=None):
+        self.file = os.fspath(file)
+        self.stamp = stamp
+        self.lock = threading.Lock()
+        self.members = {} # name -> ZipInfo or TarInfo; names have no trailing /
+        self.children = {"": set()} # directory name -> names of its entries
+        self._zip = self._map = None
+
+        if zipfile.is_zipfile(self.file):
+            self.tar = None
+            infos = self._zipped()[0].infolist()
+            names = [info.filename for info in infos]
+        else:
+            self.tar = _TarIndex.open(self.file) # so members can be read without decompressing everything before them
+            infos = self.tar.members
+            names = [info.name for info in infos]
+
+        for name, info in zip(names, infos):
+            name = sanitize_path(name)
+            if name == ".":
+                continue
+            self.members[name] = info
+            # make sure every parent directory exists, even if the archive doesn't list it
+            while name:
+                parent = os.path.dirname(name)
+                self.children.setdefault(parent, set()).add(name)
+                name = parent
+        for name in self.children:
+            if name and name not in self.members:
+                self.members[name] = None # an implied directory
+
+    def _zipped(self):
+        """
+        The zip's ZipFile and mmap, opening them (again, if close() has been called since) if need be.
+        """
+        with self.lock:
+            if self._zip is None:
+                zip = zipfile.ZipFile(self.file)
+                st = os.fstat(zip.fp.fileno())
+                if self.stamp is not None and (st.st_size, st.st_mtime_ns) != self.stamp:
+                    zip.close()
+                    raise FileNotFoundError(f"{self.file} has been replaced since it was opened")
+                self.stamp = (st.st_size, st.st_mtime_ns)
+                self._map = mmap.mmap(zip.fp.fileno(), 0, access=mmap.ACCESS_READ)
+                self._zip = zip
+            return self._zip, self._map
+
+    def _retry(self, read):
+        """
+        read(zip, map), again if another thread closed them in the meantime.
+        """
+        zip, map = self._zipped()
+        try:
+            return read(zip, map)
+        except ValueError: # what reading a closed ZipFile or mmap raises
+            if zip.fp is not None and not map.closed:
+                raise
+            return read(*self._zipped())
+
+    def close(self):
+        """
+        Close the zip's file and mapping. Using this _Archive again reopens them.
+
+        Members open for reading keep the file open until they're closed, and views of the mapping keep it mapped.
+        """
+        with self.lock:
+            zip, map, self._zip, self._map = self._zip, self._map, None, None
+        if zip is not None:
+            zip.close()
+            try:
+                map.close()
+            except BufferError:
+                pass # unmapped when the last view of it goes away
+
+    def is_dir(self, name):
+        return name in self.children or (name in self.members and self.members[name] is not None
+                                         and (self.members[name].isdir() if self.tar else self.members[name].is_dir()))
+
+    def is_stored(self, name):
+        """
+        Whether member name is a zip member stored uncompressed (and unencrypted), which view() can hand out without copying.
+        """
+        info = self.members[name]
+        return self.tar is None and info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1 # 0x1 = encrypted
+
+    def stat(self, name):
+        info = self.members[name]
+        if info is None:
+            mode, size, mtime = stat.S_IFDIR | 0o555, 0, 0
+        elif self.tar is None:
+            mode = info.external_attr >> 16
+            if not stat.S_IFMT(mode):
+                mode |= stat.S_IFDIR if info.is_dir() else stat.S_IFREG
+            mode &= ~0o222 # read-only
+            size = info.file_size
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+        else:
+            mode = (stat.S_IFDIR if info.isdir() else stat.S_IFREG) | (info.mode & 0o555)
+            size = info.size
+            mtime = info.mtime
+        return os.stat_result((mode, 0, 0, 1, os.getuid() if hasattr(os, 'getuid') else 0, 0, size, mtime, mtime, mtime))
+
+    def view(self, name):
+        """
+        The contents of member name, as a memoryview.
+
+        For STORED zip members this is a view straight into the mmap'd archive, so nothing is copied.
+        Anything else is decompressed whole; use stream() for those where that's too much.
+        """
+        info = self.members[name]
+        if self.is_stored(name):
+            def read(zip, map):
+                # find the data by skipping the local file header: https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT section 4.3.7
+                header = map[info.header_offset:info.header_offset+30]
+                if header[:4] != b"PK\x03\x04":
+                    raise zipfile.BadZipFile(f"Bad local file header for {name} in {self.file}")
+                n, m = int.from_bytes(header[26:28], "little"), int.from_bytes(header[28:30], "little")
+                start = info.header_offset + 30 + n + m
+                return memoryview(map)[start:start+info.file_size]
+            return self._retry(read)
+        with self.stream(name) as f:
+            return memoryview(f.read())
+
+    def stream(self, name):
+        """
+        Member name, as a binary file that's read as it goes, rather than all at once like view().
+        """
+        info = self.members[name]
+        if self.tar is None:
+            # ZipFile's members can be read from several threads at once; each decompresses on its own
+            return self._retry(lambda zip, map: zip.open(info))
+        return self.tar.extractfile(info)
+
+
+class _ViewIO(io.RawIOBase):
+    """
+    A read-only file over a memoryview.
+    """
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._pos)
+        b[:n] = self._view[self._pos:self._pos+n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._pos = max(0, [offset, self._pos + offset, len(self._view) + offset][whence])
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+# Random access into compressed tarballs.
+#
+# A tar.gz is one long deflate stream, so getting at a member means decompressing everything before it.
+# The first time one is read, _TarIndex records where each member is in the uncompressed tar, and every
+# _INDEX_SPAN bytes or so a checkpoint: a place in the compressed file where decompression can start over.
+#  - for gzip, a deflate block boundary, which can be at any bit, plus the 32KiB of output before it,
+#    which the next blocks may refer back to (this is zlib's examples/zran.c). Python's zlib can't say where
+#    the blocks are, so the index is built with the system's libz, through ctypes; without that there are no checkpoints.
+#  - for xz, the start of each block, which the xz index at the end of the file lists anyway.
+#    xz only makes more than one block with -T or --block-size.
+#  - bzip2 gets none: its blocks are bit-aligned and hard to find, and they're only ~900KB of output.
+# It's kept next to the archive as archive.idx.
+
+_INDEX_SPAN = 2<<21
+_WINDOW = 2<<14 # how far back deflate can refer
+
+
+def _libz():
+    """
+    The system's zlib, through ctypes, or None.
+    """
+    global _libz_handle
+    if _libz_handle is None:
+        class ZStream(ctypes.Structure):
+            # z_stream from zlib.h
+            _fields_ = [('next_in', ctypes.c_void_p), ('avail_in', ctypes.c_uint), ('total_in', ctypes.c_ulong),
+                        ('next_out', ctypes.c_void_p), ('avail_out', ctypes.c_uint), ('total_out', ctypes.c_ulong),
+                        ('msg', ctypes.c_char_p), ('state', ctypes.c_void_p),
+                        ('zalloc', ctypes.c_void_p), ('zfree', ctypes.c_void_p), ('opaque', ctypes.c_void_p),
+                        ('data_type', ctypes.c_int), ('adler', ctypes.c_ulong), ('reserved', ctypes.c_ulong)]
+        try:
+            libz = ctypes.CDLL(ctypes.util.find_library('z') or ctypes.util.find_library('zlib1'))
+            libz.zlibVersion.restype = ctypes.c_char_p
+            libz.ZStream = ZStream
+            _libz_handle = libz
+        except (OSError, TypeError, AttributeError):
+            _libz_handle = False
+    return _libz_handle or None
+
+_libz_handle = None
+
+
+class _GzipIndexer(io.RawIOBase):
+    """
+    Decompresses a gzip file, like gzip.open(), but also notes down checkpoints (out, in, bits, window) about every span bytes:
+    decompression can pick up from bit `bits` before byte `in` of the file, which is byte `out` of the output,
+    given the `window` of output before it.
+
+    Checkpoints are only kept for single-member gzips (which is all tar.gz files in practice).
+    """
+    Z_BLOCK, Z_STREAM_END, Z_BUF_ERROR = 5, 1, -5
+
+    def __init__(self, f, libz, span=_INDEX_SPAN):
+        self._f = f
+        self._z = libz
+        self._span = span
+        self._strm = libz.ZStream()
+        if libz.inflateInit2_(ctypes.byref(self._strm), 32+15, libz.zlibVersion(), ctypes.sizeof(self._strm)) != 0: # 32: expect a gzip header
+            raise zlib.error("inflateInit2() failed")
+        self._input = None
+        self._output = ctypes.create_string_buffer(2<<16)
+        self._in = 0 # bytes of f consumed
+        self._out = 0 # bytes produced
+        self._window = bytearray()
+        self._eof = False
+        self.checkpoints = []
+        self.members = 1
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        strm = self._strm
+        while not self._eof:
+            if strm.avail_in == 0:
+                self._input = self._f.read(2<<15)
+                self._input_buf = ctypes.create_string_buffer(self._input, len(self._input))
+                strm.next_in = ctypes.addressof(self._input_buf)
+                strm.avail_in = len(self._input)
+            avail_in = strm.avail_in
+            strm.next_out = ctypes.addressof(self._output)
+            strm.avail_out = n = min(len(b), len(self._output))
+            ret = self._z.inflate(ctypes.byref(strm), self.Z_BLOCK)
+            if ret == self.Z_BUF_ERROR and not avail_in:
+                raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+            elif ret < 0 and ret != self.Z_BUF_ERROR:
+                raise zlib.error(f"Error {ret} while decompressing: {strm.msg}")
+            self._in += avail_in - strm.avail_in
+            produced = n - strm.avail_out
+            if produced:
+                output = ctypes.string_at(self._output, produced)
+                self._window += output
+                del self._window[:-_WINDOW]
+                self._out += produced
+
+            # 128: at a block boundary; 64: in the last block, so there are no more to come
+            if strm.data_type & 128 and not strm.data_type & 64 and self.members == 1 and self._out > 0 \
+               and self._out - (self.checkpoints[-1][0] if self.checkpoints else 0) >= self._span:
+                self.checkpoints.append((self._out, self._in, strm.data_type & 7, bytes(self._window)))
+
+            if ret == self.Z_STREAM_END:
+                # the end of a gzip member; there might be another after it
+                if strm.avail_in == 0 and not (rest := self._f.read(2<<15)):
+                    self._eof = True
+                else:
+                    if strm.avail_in == 0:
+                        self._input_buf = ctypes.create_string_buffer(rest, len(rest))
+                        strm.next_in, strm.avail_in = ctypes.addressof(self._input_buf), len(rest)
+                    self._z.inflateReset(ctypes.byref(strm))
+                    self.members += 1
+            if produced:
+                b[:produced] = output
+                return produced
+        return 0
+
+    def close(self):
+        if self._strm is not None:
+            self._z.inflateEnd(ctypes.byref(self._strm))
+            self._strm = None
+        super().close()
+
+
+def _inflate_primed(libz, f, in_, bits, window):
+    """
+    Yield the raw deflate stream in f decompressed from `bits` bits before byte in_, given the window of output before it.
+    """
+    strm = libz.ZStream()
+    if libz.inflateInit2_(ctypes.byref(strm), -15, libz.zlibVersion(), ctypes.sizeof(strm)) != 0:
+        raise zlib.error("inflateInit2() failed")
+    try:
+        f.seek(in_ - 1)
+        # the low bits of that byte belong to the block before; deflate fills each byte from the least significant bit
+        libz.inflatePrime(ctypes.byref(strm), bits, f.read(1)[0] >> (8 - bits))
+        libz.inflateSetDictionary(ctypes.byref(strm), window, len(window))
+        output = ctypes.create_string_buffer(2<<16)
+        while data := f.read(2<<16):
+            input = ctypes.create_string_buffer(data, len(data))
+            strm.next_in, strm.avail_in = ctypes.addressof(input), len(data)
+            while True:
+                strm.next_out, strm.avail_out = ctypes.addressof(output), len(output)
+                ret = libz.inflate(ctypes.byref(strm), 0) # Z_NO_FLUSH
+                if ret < 0 and ret != _GzipIndexer.Z_BUF_ERROR:
+                    raise zlib.error(f"Error {ret} while decompressing: {strm.msg}")
+                if produced := len(output) - strm.avail_out:
+                    yield ctypes.string_at(output, produced)
+                if ret == _GzipIndexer.Z_STREAM_END:
+                    return
+                if strm.avail_out: # it's taken all the input it can
+                    break
+    finally:
+        libz.inflateEnd(ctypes.byref(strm))
+
+
+def _xz_blocks(f):
+    """
+    The (uncompressed offset, compressed offset) of each block in the xz file f, and where the blocks end,
+    read from the index at the end of the file. Returns [], None if f is more than one xz stream.
+    https://tukaani.org/xz/xz-file-format.txt
+    """
+    def varint(data, i):
+        n = shift = 0
+        while True:
+            n |= (data[i] & 0x7F) << shift
+            shift += 7
+            i += 1
+            if not data[i-1] & 0x80:
+                return n, i
+
+    size = f.seek(0, io.SEEK_END)
+    f.seek(size - 12)
+    footer = f.read(12)
+    if footer[10:12] != b"YZ":
+        return [], None
+    index_size = (int.from_bytes(footer[4:8], "little") + 1) * 4
+    index_start = size - 12 - index_size
+    f.seek(index_start)
+    index = f.read(index_size)
+    count, i = varint(index, 1)
+    blocks, compressed, uncompressed = [], 12, 0
+    for _ in range(count):
+        unpadded, i = varint(index, i)
+        length, i = varint(index, i)
+        blocks.append((uncompressed, compressed))
+        compressed += (unpadded + 3) // 4 * 4
+        uncompressed += length
+    if compressed != index_start:
+        return [], None # there's stream padding, or more streams before this one
+    return blocks, index_start
+
+
+class _TarIndex:
+    """
+    Where everything in a (compressed) tarball is, so members can be read without decompressing the whole thing; see above.
+
+    .members are TarInfos, as if from tarfile.open(archive).getmembers(), and .extractfile() is like tarfile's.
+    """
+
+    _MAGIC = b"humbugga-tar-index 1\n"
+
+    @classmethod
+    def open(cls, archive):
+        """
+        Load archive's index, or if it doesn't have one yet (or the archive has changed since), make one.
+        """
+        archive = os.fspath(archive)
+        st = os.stat(archive)
+        try:
+            with open(archive + ".idx", "rb") as f:
+                if f.read(len(cls._MAGIC)) == cls._MAGIC:
+                    n = int.from_bytes(f.read(8), "little")
+                    meta = json.loads(f.read(n))
+                    if (meta['size'], meta['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+                        return cls(archive, meta, f.tell())
+        except (OSError, ValueError, KeyError):
+            pass
+        return cls._build(archive, st)
+
+    @classmethod
+    def _build(cls, archive, st):
+        with open(archive, "rb") as f:
+            magic = f.read(6)
+            f.seek(0)
+            checkpoints, windows = [], []
+            indexer = None
+            if magic[:2] == b"\x1f\x8b":
+                format = 'gz'
+                if (libz := _libz()) is not None:
+                    stream = indexer = _GzipIndexer(f, libz)
+                else:
+                    stream = gzip.GzipFile(fileobj=f)
+            elif magic == b"\xfd7zXZ\x00":
+                format = 'xz'
+                blocks, end = _xz_blocks(f)
+                f.seek(0)
+                # the first block starts where the file does
+                checkpoints = [(out, in_, 0, 0, 0, end) for out, in_ in blocks[1:]]
+                stream = lzma.LZMAFile(f)
+            elif magic[:3] == b"BZh":
+                format = 'bz2'
+                stream = bz2.BZ2File(f)
+            else:
+                format = 'tar'
+                stream = f
+
+            members = []
+            with tarfile.open(fileobj=io.BufferedReader(stream, buffer_size=2<<16) if indexer else stream, mode="r|") as tar:
+                for m in tar:
+                    members.append([m.name, m.type.decode('latin-1'), m.mode, m.size, m.mtime, m.offset_data, m.linkname])
+
+            if indexer is not None:
+                if indexer.members == 1:
+                    at = 0
+                    for out, in_, bits, window in indexer.checkpoints:
+                        window = zlib.compress(window)
+                        checkpoints.append((out, in_, bits, at, len(window), None))
+                        windows.append(window)
+                        at += len(window)
+                indexer.close()
+
+        meta = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'format': format, 'members': members, 'checkpoints': checkpoints}
+        header = json.dumps(meta).encode()
+        try:
+            tmp = f"{archive}.idx.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(cls._MAGIC + len(header).to_bytes(8, "little") + header)
+                f.writelines(windows)
+            os.replace(tmp, archive + ".idx")
+        except OSError: # e.g. a read-only shared cache: do without
+            return cls(archive, meta, None, windows)
+        return cls(archive, meta, len(cls._MAGIC) + 8 + len(header))
+
+    def __init__(self, archive, meta, windows_at, windows=None):
+        self.archive = archive
+        self.format = meta['format']
+        self.checkpoints = meta['checkpoints']
+        self._offsets = [c[0] for c in self.checkpoints] # for bisecting; bisect only takes key= from python 3.10
+        self._windows_at = windows_at
+        self._windows = windows # when there's no .idx to read them from
+        self.members = []
+        for name, type, mode, size, mtime, offset_data, linkname in meta['members']:
+            info = tarfile.TarInfo(name)
+            info.type, info.mode, info.size, info.mtime = type.encode('latin-1'), mode, size, mtime
+            info.offset_data, info.linkname = offset_data, linkname
+            self.members.append(info)
+        self._by_name = {posixpath.normpath(info.name): info for info in self.members}
+
+    def extractfile(self, info):
+        """
+        Open member info for reading, decompressing from the last checkpoint before it.
+        """
+        for _ in range(32):
+            if info.islnk():
+                info = self._by_name[posixpath.normpath(info.linkname)]
+            elif info.issym():
+                info = self._by_name[posixpath.normpath(posixpath.join(posixpath.dirname(info.name), info.linkname))]
+            else:
+                break
+        if not info.isreg():
+            raise IsADirectoryError(info.name) if info.isdir() else ValueError(f"Not a regular file: {info.name}")
+        return io.BufferedReader(_ChunkIO(self._read(info.offset_data, info.size)), buffer_size=2<<16)
+
+    def _read(self, start, size):
+        """
+        Yield the bytes start to start+size of the uncompressed tar.
+        """
+        f = open(self.archive, "rb")
+        try:
+            if self.format == 'tar':
+                f.seek(start)
+                chunks = iter(lambda: f.read(2<<16), b"")
+                pos = start
+            else:
+                i = bisect.bisect_right(self._offsets, start) - 1
+                if self.format == 'gz' and _libz() is None:
+                    while i >= 0 and self.checkpoints[i][2]: # mid-byte, which needs libz to resume from
+                        i -= 1
+                if i >= 0:
+                    pos, *checkpoint = self.checkpoints[i]
+                    chunks = self._resume(f, *checkpoint)
+                else:
+                    pos = 0
+                    stream = gzip.GzipFile(fileobj=f) if self.format == 'gz' else {'xz': lzma.LZMAFile, 'bz2': bz2.BZ2File}[self.format](f)
+                    chunks = iter(lambda: stream.read(2<<16), b"")
+            for chunk in chunks:
+                if pos + len(chunk) <= start:
+                    pos += len(chunk)
+                    continue
+                chunk = memoryview(chunk)[max(0, start-pos):start+size-pos]
+                pos = max(pos, start)
+                if chunk:
+                    yield chunk
+                    pos += len(chunk)
+                if pos >= start + size:
+                    return
+            if pos < start + size:
+                raise EOFError(f"{self.archive} ended early")
+        finally:
+            f.close()
+
+    def _resume(self, f, in_, bits, window_at, window_size, end):
+        """
+        Decompress f from a checkpoint.
+        """
+        if self.format == 'xz':
+            # a block can be decompressed on its own, given the stream header (which says which checksum the blocks use)
+            z = lzma.LZMADecompressor(lzma.FORMAT_XZ)
+            f.seek(0)
+            yield z.decompress(f.read(12))
+            f.seek(in_)
+            left = end - in_ # stop short of the xz index, which won't match the blocks the decompressor saw
+            while left > 0 and (data := f.read(min(left, 2<<16))):
+                left -= len(data)
+                yield z.decompress(data)
+            return
+
+        if self._windows is not None:
+            window = self._windows[[c[3] for c in self.checkpoints].index(window_at)]
+        else:
+            with open(self.archive + ".idx", "rb") as idx:
+                idx.seek(self._windows_at + window_at)
+                window = idx.read(window_size)
+        window = zlib.decompress(window)
+        if not bits:
+            z = zlib.decompressobj(wbits=-15, zdict=window) # raw deflate, picking up where the window leaves off
+            f.seek(in_)
+            while not z.eof and (data := f.read(2<<16)):
+                yield z.decompress(data)
+            return
+        # the block starts `bits` bits before byte in_. Python's zlib can only start on a byte, and shifting the
+        # rest of the file down to line it up only works until the next stored block, which is byte-aligned in the
+        # original; so feed those bits in with inflatePrime(), like zran.c does. _read() only picks these checkpoints with libz.
+        yield from _inflate_primed(_libz(), f, in_, bits, window)
+
+
+class _ChunkIO(io.RawIOBase):
+    """
+    A read-only file over an iterator of chunks of bytes.
+    """
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._chunk = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._chunk:
+            if (chunk := next(self._chunks, None)) is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def close(self):
+        self._chunks.close()
+        super().close()
+
+
+def _glob_regex(pattern):
+    """
+    Translate a pathlib-style glob pattern, where * doesn't cross /s but ** does, into a regex.
+    """
+    parts = pattern.split("/")
+    regex = ""
+    for i, part in enumerate(parts):
+        last = (i == len(parts)-1)
+        if part == "**":
+            regex += ".+" if last else "(?:[^/]+/)*"
+            continue
+        j = 0
+        while j < len(part):
+            c = part[j]
+            if c == "*":
+                regex += "[^/]*"
+            elif c == "?":
+                regex += "[^/]"
+            elif c == "[" and (k := part.find("]", j+2)) != -1:
+                regex += "[" + part[j+1:k].replace("!", "^", 1 if part[j+1] == "!" else 0) + "]"
+                j = k
+            else:
+                regex += re.escape(c)
+            j += 1
+        if not last:
+            regex += "/"
+    return re.compile(regex + r"\Z", re.S)
+
+
+class ArchivePath:
+    """
+    A read-only, pathlib-like path to something inside a zip or tar archive.
+
+    This is what path() returns for packages installed with install(..., virtual=True).
+    Supports /, open(), read_bytes(), read_text(), iterdir(), glob(), rglob(), exists(), is_dir(), is_file() and stat().
+    Members are read out of the archive when they are opened.
+
+    It is *not* a real path: pass it to its own .open(), not to open().
+    """
+
+    def __init__(self, archive, at=""):
+        self._archive = archive if isinstance(archive, _Archive) else _Archive.open(archive)
+        self.at = sanitize_path(at) if at else ""
+        if self.at == ".":
+            self.at = ""
+
+    def __truediv__(self, other):
+        return ArchivePath(self._archive, os.path.join(self.at, os.fspath(other)))
+
+    def joinpath(self, *other):
+        return ArchivePath(self._archive, os.path.join(self.at, *map(os.fspath, other)))
+
+    def __str__(self):
+        return os.path.join(self._archive.file, self.at)
+
+    def __repr__(self):
+        return f"ArchivePath({self._archive.file!r}, {self.at!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, ArchivePath) and (self._archive.file, self.at) == (other._archive.file, other.at)
+
+    def __hash__(self):
+        return hash((self._archive.file, self.at))
+
+    @property
+    def name(self):
+        return os.path.basename(self.at)
+
+    @property
+    def suffix(self):
+        return pathlib.PurePosixPath(self.name).suffix
+
+    @property
+    def stem(self):
+        return pathlib.PurePosixPath(self.name).stem
+
+    @property
+    def parent(self):
+        return ArchivePath(self._archive, os.path.dirname(self.at))
+
+    def exists(self):
+        return self.at == "" or self.at in self._archive.members
+
+    def is_dir(self):
+        return self.at == "" or self._archive.is_dir(self.at)
+
+    def is_file(self):
+        return self.exists() and not self.is_dir()
+
+    def stat(self):
+        if not self.exists():
+            raise FileNotFoundError(str(self))
+        if self.at == "":
+            return os.stat_result((stat.S_IFDIR | 0o555, 0, 0, 1, 0, 0, 0, 0, 0, 0))
+        return self._archive.stat(self.at)
+
+    def iterdir(self):
+        if not self.is_dir():
+            raise NotADirectoryError(str(self))
+        for name in sorted(self._archive.children.get(self.at, ())):
+            yield ArchivePath(self._archive, name)
+
+    def glob(self, pattern):
+        regex = _glob_regex(pattern)
+        prefix = self.at + "/" if self.at else ""
+        for name in sorted(self._archive.members):
+            if name.startswith(prefix) and regex.match(name[len(prefix):]):
+                yield ArchivePath(self._archive, name)
+
+    def rglob(self, pattern):
+        return self.glob("**/" + pattern)
+
+    def view(self):
+        """
+        The file's contents as a memoryview; for uncompressed zip members this is zero-copy.
+        """
+        if not self.is_file():
+            raise IsADirectoryError(str(self)) if self.exists() else FileNotFoundError(str(self))
+        return self._archive.view(self.at)
+
+    def open(self, mode='r', buffering=-1, encoding=None, errors=None, newline=None):
+        if mode not in ('r', 'rb', 'rt'):
+            raise ValueError(f"{self} is read-only")
+        if self.is_file() and not self._archive.is_stored(self.at):
+            f = self._archive.stream(self.at) # decompressed as it's read, rather than all at once
+        else:
+            f = io.BufferedReader(_ViewIO(self.view()), buffer_size=buffering if buffering > 0 else io.DEFAULT_BUFFER_SIZE)
+        if 'b' not in mode:
+            f = io.TextIOWrapper(f, encoding=encoding, errors=errors, newline=newline)
+        return f
+
+    def read_bytes(self):
+        return bytes(self.view())
+
+    def read_text(self, encoding=None, errors=None):
+        with self.open('r', encoding=encoding, errors=errors) as f:
+            return f.read()
+
+
+def _toplevel(archive):
+    """
+    If the archive holds a single top-level folder, like a polite package, return its name; otherwise None.
+    """
+    entries = _Archive.open(archive).children[""]
+    if len(entries) == 1 and (name := next(iter(entries))) in _Archive.open(archive).children:
+        return name
+
+# ---------------
+
+APP = None
+
+
+def _app():
+    """
+    The name of the app that packages are being installed for: humbugga.APP.
+    """
+    if APP is None:
+        raise ValueError("You should set humbugga.APP = 'your-app-name'; or, set humbugga.APP = '_auto' to take the app name from how it is called by the OS (sys.argv[0]).")
+    if APP == '_auto':
+        return os.path.basename(sys.argv[0])
+    return APP
+
+
+# like xdg.BaseDirectory.save_data_path() and save_cache_path(), but safe for several threads to call at once:
+# those check isdir() and then makedirs(), so the losers of a race get FileExistsError
+def _save_data_path(resource):
+    path = os.path.join(xdg.BaseDirectory.xdg_data_home, resource)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _save_cache_path(resource):
+    path = os.path.join(xdg.BaseDirectory.xdg_cache_home, resource)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _parse_checksum(checksum):
+    """
+    Split an 'algorithm:hexdigest' checksum into (algorithm, hexdigest), validating both.
+
+    (None, None) means no checksum.
+    """
+    if checksum is None:
+        return None, None
+
+    if ':' not in checksum:
+        raise ValueError(f"Invalid checksum: missing 'algorithm:' specifier: '{checksum}'")
+
+    algorithm, checksum = checksum.split(":", 1)
+    try:
+        C = hashlib.new(algorithm)
+    except ValueError:
+        raise ValueError(f"Invalid checksum: unknown algorithm {algorithm}")
+
+    if not (len(checksum) == len(C.hexdigest()) and all(c in hexdigits for c in checksum)):
+        raise ValueError(f"Invalid checksum: incorrect checksum format for '{algorithm}': {checksum}")
+
+    checksum = checksum.lower() # case-insensitive
+    return algorithm, checksum
+
+
+def _already_installed(url, pkg=None, members=None):
+    """
+    If url is what's installed (as pkg, if given), return the installed package's name; otherwise None.
+
+    A partial install only counts if it has all of members, which are glob patterns as in install().
+    """
+    if (pkg is not None and installed(pkg)) or (pkg is None and installed(url)):
+        p = _get(pkg or url)
+        if p['source'] == url and (p['members'] is None or (members is not None and set(members) <= set(p['members']))):
+            return p['name']
+
+
+# Read-only caches shared between users, e.g. one an admin has filled on a multi-user machine, or one on NFS.
+# Each is laid out like a user's own cache, i.e. it is $XDG_CACHE_HOME/$APP/humbugga for whoever filled it:
+#     XDG_CACHE_HOME=/var/cache python -c 'import humbugga; humbugga.APP="my-app"; humbugga.install(...)'
+# They're searched in order, after the user's own, before downloading anything; '{app}' stands for humbugga.APP.
+# Ones that don't exist are skipped.
+SHARED_CACHES = [p for p in os.environ.get('HUMBUGGA_SHARED_CACHES', '').split(os.pathsep) if p] + ['/var/cache/{app}/humbugga']
+
+
+def _cache_tiers():
+    """
+    The caches to look for a download in, in order: the user's own (which is the only one written to), then the SHARED_CACHES that exist.
+    """
+    tiers = [_save_cache_path(os.path.join(_app(),'humbugga'))]
+    for cache in SHARED_CACHES:
+        cache = cache.format(app=_app())
+        if os.path.isdir(cache) and not any(os.path.samefile(cache, tier) for tier in tiers):
+            tiers.append(cache)
+    return tiers
+
+
+def _cachedir(url, cache=None):
+    """
+    The folder in the cache (by default, the user's) that url gets downloaded into.
+    """
+    if cache is None:
+        cache = _save_cache_path(os.path.join(_app(),'humbugga'))
+    subcache = urlkey(url)
+    subcache = os.path.join(subcache[:2], subcache[2:4], subcache[4:])
+    return os.path.join(cache, subcache)
+
+
+def _objectpath(algorithm, digest, cache=None):
+    """
+    Where the file with the given checksum lives in the content-addressed part of the cache (by default, the user's).
+
+    Each url's folder in the cache holds a hardlink to one of these, so identical files
+    downloaded from different urls or mirrors are only stored, and only downloaded, once.
+    """
+    if cache is None:
+        cache = _save_cache_path(os.path.join(_app(),'humbugga'))
+    return os.path.join(cache, "objects", algorithm, digest[:2], digest[2:4], digest[4:])
+
+
+def _link(src, dst):
+    """
+    Hardlink src to dst. Where that's not allowed (across filesystems, or, with fs.protected_hardlinks,
+    to another user's file) make the cheapest copy that is; see _copy_file(). An existing dst is left alone.
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        return
+    except OSError:
+        pass
+    tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        _copy_file(src, tmp)
+        st = os.stat(src)
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns)) # so what _record_digest() noted about src holds for the copy too
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+_FICLONE = 0x40049409 # from linux/fs.h
+
+
+def _copy_file(src, dst):
+    """
+    Copy src to dst, without reading it through python if possible: the copy is a reflink that shares
+    src's blocks (on btrfs, XFS, bcachefs, ...) or else is done in the kernel by copy_file_range()
+    (which NFS 4.2 and SMB servers can even do on their end), and only falls back to shutil.copyfile().
+    """
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            return
+        except (ImportError, OSError): # not Linux, or a filesystem without reflinks
+            pass
+        size, copied = os.fstat(s.fileno()).st_size, 0
+        try:
+            while copied < size and (n := os.copy_file_range(s.fileno(), d.fileno(), min(size - copied, 1<<30), copied, copied)):
+                copied += n
+        except (AttributeError, OSError): # not Linux, or not between these filesystems
+            pass
+        if copied == size:
+            return
+    shutil.copyfile(src, dst)
+
+
+def _fetch_stored(url, algorithm, checksum):
+    """
+    If url, or a file with this checksum from any url, is already in one of the caches, link it into url's
+    folder in the user's cache and return it, without touching the network. Otherwise return None.
+
+    Without a checksum, this only looks for url in the shared caches; download() deals with the user's.
+    """
+    file = pathlib.Path(_cachedir(url)) / os.path.basename(urlparse(url).path)
+    if os.path.exists(file):
+        return None # let download() deal with what's already there
+    tiers = _cache_tiers()
+
+    if checksum is not None:
+        for cache in tiers:
+            if os.path.exists(obj := _objectpath(algorithm, checksum, cache)):
+                _link(obj, str(file))
+                _record_digest(file, algorithm, checksum)
+                return file
+
+    for cache in tiers[1:]:
+        shared = os.path.join(_cachedir(url, cache), os.path.basename(urlparse(url).path))
+        if not os.path.isfile(shared):
+            continue
+        # reading it back is still cheaper than downloading it
+        if checksum is not None and (_recorded_digest(shared, algorithm) or _hash_file(shared, algorithm).hexdigest()) != checksum:
+            continue # some other version of url
+        _link(shared, str(file))
+        # bring along what else is known about it, e.g. the HTTP validators that overwrite='update' needs
+        if record := {k: v for k, v in _load_record(shared).items() if k != 'partial'}:
+            _save_record(file, record)
+        if checksum is not None:
+            _record_digest(file, algorithm, checksum)
+        return file
+
+
+def _store(file, algorithm, digest):
+    """
+    Add a verified file to the content-addressed store.
+    """
+    _link(str(file), _objectpath(algorithm, digest))
+
+
+def _fetch(url, algorithm=None, checksum=None):
+    """
+    Download url to the cache, if it isn't there already, and check its checksum.
+
+    Returns the path to the cached file.
+    """
+    if (file := _fetch_cached(url, algorithm, checksum)) is not None:
+        return _fetch_checked(url, file, algorithm, checksum, checksum)
+    # the checksum is computed on the fly by download(), or looked up from a previous install if the file was already cached
+    if checksum is not None:
+        file, digest = download(url, _cachedir(url), algorithm=algorithm)
+    else:
+        file, digest = download(url, _cachedir(url)), None
+    return _fetch_checked(url, file, algorithm, checksum, digest)
+
+
+# _fetch() is split in two around its download, so humbugga.aio can do that part its own way
+
+def _fetch_cached(url, algorithm, checksum):
+    """
+    The first half of _fetch(): url's file from the store or the shared caches, already checked, or None if it needs downloading.
+    """
+    _annotate(cache='hit' if os.path.exists(os.path.join(_cachedir(url), os.path.basename(urlparse(url).path))) else 'miss')
+    if (file := _fetch_stored(url, algorithm, checksum)) is not None:
+        _annotate(cache='hit')
+    return file
+
+
+def _fetch_checked(url, file, algorithm, checksum, digest):
+    """
+    The second half of _fetch(): file, url's file in the cache, hashes to digest; check that against checksum.
+
+    If it's wrong, the file is thrown away and ValueError raised. Returns file.
+    """
+    if checksum is not None:
+        if digest != checksum:
+            _discard(file)
+            raise ValueError(f"Invalid checksum: {file}")
+        _record_digest(file, algorithm, digest)
+        _store(file, algorithm, digest)
+    else:
+        warnings.warn(f"Integrity check disabled for {url}.")
+    _touch(file)
+    return file
+
+
+def _discard(file):
+    """
+    Throw away a cached download that failed its checksum, so the next install() downloads it again
+    instead of finding it in the cache and failing the same way. Unless an installed package came from it.
+    """
+    if _db().execute("SELECT 1 FROM packages WHERE archive = ?", (os.fspath(file),)).fetchone() is not None:
+        return
+    for f in (file, f"{file}.json", f"{file}.idx"):
+        try:
+            os.unlink(f)
+        except FileNotFoundError:
+            pass
+
+
+def _touch(file):
+    """
+    Note that the cached file was just used, for clean() to evict the least recently used files first.
+    """
+    with _db() as db:
+        db.execute("""INSERT INTO cache (path, last_access) VALUES (?, ?)
+                      ON CONFLICT (path) DO UPDATE SET last_access=excluded.last_access""", (os.fspath(file), time.time()))
+
+
+# Locks, so that several processes (or threads) installing the same url or package don't trip over each other:
+# one of them downloads and unpacks it, and the rest wait and then find it installed.
+# They're fcntl locks on files in the data folder, so the OS drops them if the process holding one dies,
+# and they work across machines on NFS (if it runs lockd). Where there's no fcntl (Windows) they only work within one process.
+# The lock files are never deleted: deleting a lock file someone is waiting on lets two processes in at once.
+
+LOCK_TIMEOUT = None # seconds install() waits on another install of the same url or package before giving up; None waits forever
+_LOCK_WARN = 60 # seconds between "still waiting" warnings
+
+_thread_locks = {} # lock file -> threading.Lock, since fcntl locks don't keep out other threads of the same process
+_holders = {} # lock file -> who holds it, if it's this process
+_locks_lock = threading.Lock()
+
+
+class LockTimeout(TimeoutError):
+    """
+    Gave up waiting for another install of the same url or package.
+
+    .lockfile is the lock; .holder is what's known about who has it: {'pid', 'host', 'since', 'what'}, or {}.
+    """
+    def __init__(self, lockfile, holder, timeout):
+        self.lockfile = lockfile
+        self.holder = holder
+        super().__init__(f"Timed out after {timeout}s waiting for {lockfile}, held by {_describe_holder(holder)}")
+
+
+def _describe_holder(holder):
+    if not holder:
+        return "an unknown process"
+    description = f"pid {holder.get('pid')} on {holder.get('host')}"
+    if holder.get('what'):
+        description += f" ({holder['what']})"
+    if holder.get('since'):
+        description += f" since {time.ctime(holder['since'])}"
+    if holder.get('host') == socket.gethostname() and holder.get('pid') != os.getpid():
+        try:
+            os.kill(holder['pid'], 0)
+        except ProcessLookupError:
+            description += ", which isn't running anymore" # so the lock is wedged, e.g. on a network filesystem
+        except (OSError, TypeError):
+            pass
+    return description
+
+
+class _Lock:
+    """
+    A lock on one url or package, shared between threads and processes.
+
+    Use it as a context manager, or acquire() and release() it. Unlike threading.RLock it isn't reentrant,
+    but it can be released by a different thread than took it.
+    """
+    def __init__(self, kind, name, what=None):
+        locks = _save_data_path(os.path.join(_app(), 'humbugga', 'locks'))
+        self.file = os.path.join(locks, f"{kind}-{urlkey(name) if kind == 'url' else name}.lock")
+        self.what = what
+        self._fd = None
+        with _locks_lock:
+            self._thread_lock = _thread_locks.setdefault(self.file, threading.Lock())
+
+    def acquire(self, timeout=None):
+        """
+        Wait for the lock, for up to timeout seconds (by default, LOCK_TIMEOUT), warning every so often
+        about who has it. Raises LockTimeout if it doesn't come free.
+        """
+        if timeout is None:
+            timeout = LOCK_TIMEOUT
+        with _span('lock', lock=os.path.basename(self.file)):
+            start = warned = time.monotonic()
+            wait = 0.01
+            while True:
+                if self._thread_lock.acquire(timeout=wait):
+                    if (holder := self._try_lock()) is None:
+                        return self
+                    self._thread_lock.release()
+                    time.sleep(wait)
+                else:
+                    holder = _holders.get(self.file, {})
+
+                now = time.monotonic()
+                if timeout is not None and now - start >= timeout:
+                    raise LockTimeout(self.file, holder, timeout)
+                if now - warned >= _LOCK_WARN:
+                    warnings.warn(f"Waited {now - start:.0f}s so far for {self.file}, held by {_describe_holder(holder)}")
+                    warned = now
+                wait = min(wait*2, 1)
+
+    def _try_lock(self):
+        """
+        Try to take the file lock, with the thread lock already held. Returns None on success,
+        or else what the lock file says about who has it.
+        """
+        # only ever open the lock file with the thread lock held: closing *any* descriptor of a file drops
+        # all of this process's fcntl locks on it
+        fd = os.open(self.file, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (BlockingIOError, PermissionError): # EAGAIN or EACCES, depending on the OS: someone else has it
+            try:
+                holder = json.loads(os.read(fd, 4096) or b"{}")
+            except ValueError:
+                holder = {} # caught mid-write
+            os.close(fd)
+            return holder
+        except ImportError:
+            pass # no fcntl
+        except OSError as e:
+            # ENOLCK: a network filesystem without a lock daemon
+            warnings.warn(f"Can't lock {self.file} ({e}); other processes installing the same thing will race with this one.")
+        except BaseException:
+            os.close(fd)
+            raise
+
+        holder = {'pid': os.getpid(), 'host': socket.gethostname(), 'since': time.time(), 'what': self.what}
+        os.ftruncate(fd, 0)
+        os.write(fd, json.dumps(holder).encode())
+        self._fd = fd
+        _holders[self.file] = holder
+        return None
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        _holders.pop(self.file, None)
+        try:
+            os.ftruncate(fd, 0)
+        finally:
+            os.close(fd) # which drops the fcntl lock
+            self._thread_lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _unpack_install(url, file, pkg=None):
+    """
+    Unpack the cached archive file, which came from url, and install it as pkg.
+
+    Returns the package name.
+    """
+
+    # unpack
+    # *if* the folder contained a single folder, like a polite package, use that folder as its package name; but if it doesn't, use its archive name
+    # we unpack to a temporary folder *first* and then rename instead of deciding which mode to use and unpacking directly because zipfile lacks
+    # a clean API to determine what's in each folder: https://stackoverflow.com/questions/58888465/python-zipfile-get-top-level-directory-within-the-zipfile
+    # (plus this way avoids buggy partial installs)
+
+    subdata = _staging()
+    manifest = {}
+
+    # TODO: if we just don't do this we could maybe support non-archive files too, like a large image or something
+    try:
+        # files that are the same as in the previous version, or in any other installed package, are just linked.
+        # the old version stays where it is until the new one is swapped in, so this doesn't give up atomicity
+        unpack(file, subdata, manifest=manifest, reuse=_reusable(file, pkg))
+    except BaseException:
+        shutil.rmtree(subdata, ignore_errors=True)
+        raise
+
+    return _swap_install(url, file, subdata, pkg, manifest=manifest)
+
+
+def _installed_files(pkg=None):
+    """
+    Every file of every installed package, or just of pkg, as unpack()'s reuse= wants them, named as they are in their package.
+    """
+    return _db().execute("""SELECT packages.path || '/' || files.path, files.size, files.mtime_ns, files.digest, files.crc32, files.path
+                            FROM files JOIN packages ON files.package = packages.name
+                            WHERE NOT packages.virtual AND packages.path IS NOT NULL AND (? IS NULL OR packages.name = ?)""",
+                         (pkg, pkg)).fetchall()
+
+
+def _reusable(archive, pkg=None):
+    """
+    The installed files that unpacking archive, to install it as pkg, can link to instead of extracting again; see unpack().
+
+    Tarball members are hashed as they're read, so they're matched against every installed file.
+    Zip members are matched by name, size and CRC-32 first, so only against the version of the package they're replacing,
+    by where each file will be in the archive: under its top folder, if it has one, which _swap_install() will drop.
+    """
+    if not zipfile.is_zipfile(archive):
+        return _installed_files()
+    top = _toplevel(archive)
+    pkg = pkg or top or os.path.splitext(os.path.basename(archive))[0] # what _swap_install() will call it
+    return [(*entry, f"{top}/{name}" if top else name) for *entry, name in _installed_files(pkg)]
+
+
+def _staging():
+    """
+    Make a temporary folder to unpack a package into, next to where it will be installed.
+    """
+    data = pathlib.Path(_save_data_path(_app())) # TODO: consider .load_data_paths(APP)
+    return pathlib.Path(tempfile.mkdtemp(suffix=".part", dir=data))
+
+
+def _swap_install(url, file, subdata, pkg=None, manifest=None, nested=None, members=None):
+    """
+    Move the package unpacked into staging folder subdata into place as pkg, replacing any previous version.
+
+    file is the archive it came from. manifest is what unpack() made of subdata, if anything.
+    nested is whether the package is the single folder in subdata; by default, that's guessed from what's there.
+    members is for partial installs; see _record_install().
+    Returns the package name.
+    """
+    data = pathlib.Path(_save_data_path(_app())) # TODO: consider .load_data_paths(APP)
+
+    top = os.listdir(subdata)
+    if nested is None:
+        nested = len(top)==1 and os.path.isdir(subdata/top[0])
+    if nested:
+        if manifest is not None:
+            manifest = {name[len(top[0])+1:]: entry for name, entry in manifest.items()}
+        if pkg is None:
+            pkg = top[0]
+    elif pkg is None:
+        pkg = os.path.basename(file) # name for the pkg; used as a shortname, later; sort of janky that the *server* gets to pick this.
+        pkg, _ = os.path.splitext(pkg)
+
+    with _Lock('pkg', pkg, f"installing {url}"):
+        with _span('rename', url=url, pkg=pkg):
+            # uninstall the previous version
+            # at this point we know, either:
+            # - pkg is None and not installed(url) or
+            # - pkg is not None and installed(pkg) # -> need to uninstall
+            if installed(pkg):
+                _uninstall(pkg)
+            if nested:
+                os.rename(subdata/top[0], data/pkg) # this should be atomic since it's on the same filesystem since one is a subdir of the other.
+                os.rmdir(subdata)
+            else:
+                os.rename(subdata, data/pkg)
+
+        files = None
+        if manifest is not None:
+            # the mtimes are only final now: tarfile sets them after writing each file
+            files = [(name, size, os.stat(data/pkg/name).st_mtime_ns, digest, crc)
+                     for name, (size, digest, crc) in manifest.items()]
+        _record_install(url, pkg, file, files=files, members=members)
+
+    # TODO: maybe slip verify() into .path() to autoprotect everything.
+
+    return pkg
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    A read-only file that reads chunks out of a queue.put() by another thread, until it gets None.
+    """
+    def __init__(self, queue):
+        self._queue = queue
+        self._chunk = b""
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._chunk and not self._eof:
+            self._chunk = self._queue.get()
+            if self._chunk is None:
+                self._chunk, self._eof = b"", True
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+
+def _stream_install(url, algorithm=None, checksum=None, pkg=None, progress=True):
+    """
+    Download the tarball at url and unpack it at the same time.
+
+    The download is fed to the cache file (and the checksum) and to tarfile's stream mode in parallel,
+    so network, decompression and writing out files all overlap, and the archive is never read back.
+    If the checksum turns out wrong at the end, the unpacked files are thrown away.
+
+    Returns the package name.
+    """
+    if (file := _fetch_cached(url, algorithm, checksum)) is not None:
+        return _unpack_install(url, _fetch_checked(url, file, algorithm, checksum, checksum), pkg)
+
+    chunks = queue.Queue(maxsize=64) # bounded, so a slow disk pushes back on the network instead of filling up memory
+    stop = threading.Event()
+    result = {}
+
+    def sink(chunk):
+        while True:
+            if stop.is_set():
+                raise InterruptedError("Unpacking failed")
+            try:
+                chunks.put(memoryview(chunk), timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def fetch():
+        try:
+            if checksum is not None:
+                result['file'], result['digest'] = download(url, _cachedir(url), progress=progress, algorithm=algorithm, sink=sink)
+            else:
+                result['file'] = download(url, _cachedir(url), progress=progress, sink=sink)
+        except BaseException as e:
+            result['error'] = e
+        finally:
+            chunks.put(None)
+
+    subdata = _staging()
+    manifest = {}
+    fetcher = threading.Thread(target=contextvars.copy_context().run, args=(fetch,), daemon=True)
+    fetcher.start()
+    reader = _ChunkReader(chunks)
+    try:
+        try:
+            # this overlaps the download's 'transfer' span; whichever of them takes longer is what held the install up
+            with _span('unpack', stream=True) as span, \
+                 tarfile.open(fileobj=io.BufferedReader(reader, buffer_size=(2<<19)), mode="r|*") as tar:
+                _extract_tar(tar, subdata, manifest=manifest)
+                # tarfile stops at the end-of-archive marker; let the download finish whatever comes after it
+                while tar.fileobj.read(2<<19):
+                    pass
+                if span:
+                    span.set(files=len(manifest), bytes=sum(size for size, _, _ in manifest.values()))
+        except BaseException:
+            stop.set()
+            if not reader._eof:
+                # drain, so the download isn't stuck on a full queue
+                while chunks.get() is not None:
+                    pass
+            fetcher.join()
+            if 'error' in result:
+                raise result['error'] # a broken download makes for a broken tarball; report the cause
+            if checksum is not None and result['digest'] != checksum:
+                _discard(result['file']) # and a corrupt one might not even be a tarball
+                raise ValueError(f"Invalid checksum: {result['file']}")
+            raise
+        finally:
+            fetcher.join()
+
+        if 'error' in result:
+            raise result['error']
+        file = _fetch_checked(url, result['file'], algorithm, checksum, result.get('digest'))
+    except BaseException:
+        shutil.rmtree(subdata, ignore_errors=True)
+        raise
+
+    return _swap_install(url, file, subdata, pkg, manifest=manifest)
+
+
+def _virtual_install(url, file, pkg=None):
+    """
+    Install the cached archive file, which came from url, as pkg without unpacking it:
+    path(pkg) will read out of the archive directly.
+
+    Returns the package name.
+    """
+    root = _toplevel(file)
+    if pkg is None:
+        pkg = root if root is not None else os.path.splitext(os.path.basename(file))[0]
+
+    with _Lock('pkg', pkg, f"installing {url}"):
+        if installed(pkg):
+            _uninstall(pkg)
+        _record_install(url, pkg, file, virtual=True, root=root)
+
+    return pkg
+
+
+def _partial_install(url, algorithm, checksum, pkg, members, progress=True):
+    """
+    Install only the files in the archive at url that match the glob patterns members; see _select_members().
+
+    If the archive isn't cached already, and it's a zip, only the parts of it that are needed are downloaded;
+    see _zip_ranges(). Tarballs have to be downloaded whole, but still only the matching files are unpacked.
+    If url is partially installed already, this adds members to it.
+
+    Returns the package name.
+    """
+    if (pkg is not None and installed(pkg)) or (pkg is None and installed(url)):
+        if (p := _get(pkg or url))['source'] == url and p['members'] is not None:
+            members, pkg = sorted({*p['members'], *members}), p['name']
+
+    file = pathlib.Path(_cachedir(url)) / os.path.basename(urlparse(url).path)
+    found = None
+    if file.suffix == '.zip' and not os.path.exists(file) and _fetch_stored(url, algorithm, checksum) is None:
+        try:
+            found = _zip_ranges(url, file, members, progress=progress)
+        except _NoRanges:
+            warnings.warn(f"{urlparse(url).netloc} stopped sending byte ranges, or {url} has changed. Downloading all of it.")
+            for stale in (f"{file}.sparse.zip", f"{file}.sparse.zip.json"):
+                if os.path.exists(stale):
+                    os.unlink(stale)
+
+    if found is not None:
+        archive, names, top = found
+        _annotate(cache='miss')
+        if checksum is not None:
+            warnings.warn(f"Can't check {url} against its checksum without downloading all of it; only the files installed from it are checked, against their CRC-32s.")
+        _touch(archive)
+    else:
+        archive = _fetch(url, algorithm, checksum)
+        top, names = _select_members(_archive_names(archive), members)
+    if not names:
+        raise ValueError(f"Nothing in {url} matches {members}")
+
+    subdata = _staging()
+    manifest = {}
+    try:
+        unpack(archive, subdata, progress=progress, manifest=manifest, reuse=_reusable(archive, pkg), members=names)
+    except BaseException:
+        shutil.rmtree(subdata, ignore_errors=True)
+        raise
+
+    return _swap_install(url, archive, subdata, pkg, manifest=manifest, nested=top is not None, members=members)
+
+
+def _archive_names(archive):
+    """
+    The names of everything in archive, as it lists them, except that folders always end in /.
+    """
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as z:
+            return z.namelist()
+    with tarfile.open(archive) as tar:
+        return [member.name + ("/" if member.isdir() else "") for member in tar]
+
+
+def _select_members(names, patterns):
+    """
+    Out of the names in an archive, pick the files that match any of the glob patterns.
+
+    Like path(pkg), the patterns are relative to the archive's top-level folder, if it has one.
+    A pattern that matches a folder takes everything in it.
+    Returns (the top-level folder or None, {names}).
+    """
+    tops = {name.split("/", 1)[0] for name in names}
+    top = tops.pop() if len(tops) == 1 and all("/" in name for name in names) else None
+    regexes = [_glob_regex(pattern.strip("/")) for pattern in patterns]
+    selected = set()
+    for name in names:
+        if name.endswith("/"):
+            continue
+        parts = (name[len(top)+1:] if top is not None else name).split("/")
+        if any(regex.match("/".join(parts[:i])) for regex in regexes for i in range(1, len(parts)+1)):
+            selected.add(name)
+    return top, selected
+
+
+_RANGE_GAP = 2<<17 # wanted byte ranges closer together than this are fetched in one request, gap and all
+
+
+def _zip_ranges(url, file, patterns, progress=True):
+    """
+    Download just enough of the zip at url to unpack the files matching patterns (see _select_members()):
+    the central directory at its end, which says where everything is, and then those files' byte ranges.
+
+    They're written at their offsets into file.sparse.zip, which is otherwise holes, and which zipfile
+    can read as if it were the whole archive so long as only those files are read from it.
+    Which ranges it has are kept in its .json record, so asking for more files later only fetches those.
+
+    Returns (file.sparse.zip, the names of the matching files, the archive's top-level folder or None),
+    or None if the server doesn't do byte ranges.
+    Raises _NoRanges if url changes in the meantime.
+    """
+    sparse = f"{file}.sparse.zip"
+    record = _load_record(sparse)
+    if 'ranges' not in record or not os.path.exists(sparse):
+        with _request('HEAD', url, allow_redirects=True) as resp:
+            resp.raise_for_status()
+            size = resp.headers.get('Content-Length', None)
+            if resp.headers.get('Accept-Ranges', 'none').lower() != 'bytes' or size is None:
+                return None
+            size = int(size)
+            record = {'size': size, 'http': _validators(resp, size), 'ranges': []}
+        os.makedirs(os.path.dirname(sparse), exist_ok=True)
+        with open(sparse, "wb") as f:
+            f.truncate(size)
+        _save_record(sparse, record)
+    size = record['size']
+
+    def read(start, end):
+        _fetch_ranges(url, sparse, record, [(start, end)], progress=False)
+        with open(sparse, "rb") as f:
+            f.seek(start)
+            return f.read(end-start)
+
+    # the end of central directory record is the last 22 bytes, unless there's a comment (of up to 64KiB) after it.
+    # https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT section 4.3.16
+    tail = max(0, size - 22 - (2<<15))
+    data = read(tail, size)
+    if (eocd := data.rfind(b"PK\x05\x06")) == -1:
+        raise zipfile.BadZipFile(f"{url} isn't a zip")
+    cd_size, cd_offset = int.from_bytes(data[eocd+12:eocd+16], "little"), int.from_bytes(data[eocd+16:eocd+20], "little")
+    if 0xFFFFFFFF in (cd_size, cd_offset) and (locator := data.rfind(b"PK\x06\x07", 0, eocd)) != -1:
+        # zip64: the real numbers are in the zip64 end of central directory record, which the locator points to (4.3.14, 4.3.15)
+        eocd64 = int.from_bytes(data[locator+8:locator+16], "little")
+        data = read(eocd64, eocd64+56)
+        cd_size, cd_offset = int.from_bytes(data[40:48], "little"), int.from_bytes(data[48:56], "little")
+    _fetch_ranges(url, sparse, record, [(cd_offset, min(cd_offset+cd_size, size))], progress=False)
+
+    with zipfile.ZipFile(sparse) as z:
+        infos = z.infolist()
+    top, names = _select_members([info.filename for info in infos], patterns)
+
+    # each member is its local header followed by its data, which runs up to the next member, or the central directory
+    offsets = sorted({info.header_offset for info in infos} | {cd_offset})
+    ends = dict(zip(offsets, offsets[1:]))
+    _fetch_ranges(url, sparse, record, [(info.header_offset, ends[info.header_offset]) for info in infos if info.filename in names],
+                  progress=progress)
+    return sparse, names, top
+
+
+def _fetch_ranges(url, sparse, record, wanted, progress=True):
+    """
+    Download whatever sparse doesn't have yet of the byte ranges wanted ([(start, end)], end exclusive) of url.
+
+    record is sparse's record, as kept by _zip_ranges(); it's updated as the ranges arrive, so a download
+    that's interrupted picks up where it left off. Ranges are merged where they're close, and fetched concurrently.
+    Every request carries If-Range:, so if url has changed since sparse was started, _NoRanges is raised.
+    """
+    missing = _coalesce(_subtract(wanted, record['ranges']), _RANGE_GAP)
+    if not missing:
+        return
+    headers = {'If-Range': if_range} if (if_range := _if_range(record.get('http', {}))) else {}
+    lock = threading.Lock()
+    _expect(sum(end-start for start, end in missing))
+
+    def arrived(start, end):
+        if end > start:
+            with lock:
+                record['ranges'] = _coalesce(record['ranges'] + [[start, end]], 0)
+                _save_record(sparse, record)
+
+    def fetch(span):
+        attempt = 0
+        while True:
+            try:
+                return fetch_once(span)
+            except Exception as e:
+                if not _is_transient(e):
+                    raise
+                _backoff(attempt, url, e) # and then carry on from wherever it got to
+                attempt += 1
+
+    def fetch_once(span):
+        start, end = span
+        with _request('GET', url, headers={'Range': f'bytes={start:d}-{end-1:d}', **headers}, stream=True) as resp:
+            resp.raise_for_status()
+            if resp.status_code != 206 or (resp_range := resp.headers.get('Content-Range', None)) is None:
+                raise _NoRanges(url)
+            _, range_region, range_size = tokenize_content_range(resp_range)
+            if range_region is None or range_region[0] != start or (range_size is not None and range_size != record['size']):
+                raise ValueError(f"Range mismatch: we requested {start}-{end-1} of {record['size']} but the server sent {resp_range}")
+            pos = start
+            with open(sparse, "r+b") as f:
+                f.seek(start)
+                try:
+                    for chunk in resp.iter_content(chunk_size=(2<<15)):
+                        chunk = chunk[:end-pos]
+                        pos += f.write(chunk)
+                        bar.update(len(chunk))
+                        _transferred(len(chunk))
+                        if pos >= end:
+                            break
+                finally:
+                    f.flush()
+                    arrived(start, pos)
+                    span[0] = pos # so a retry resumes from here
+        if pos < end:
+            raise ValueError(f"Short read: {url} ended at byte {pos} of {start}-{end-1}")
+
+    with _span('transfer', url=url, ranges=len(missing)), tqdm.tqdm(
+        desc=os.path.basename(urlparse(url).path),
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        total=sum(end-start for start, end in missing),
+        disable=not progress,
+    ) as bar, concurrent.futures.ThreadPoolExecutor(max_workers=min(len(missing), _transport['connections'])) as pool:
+        for future in concurrent.futures.as_completed([pool.submit(contextvars.copy_context().run, fetch, [start, end])
+                                                       for start, end in missing]):
+            future.result()
+
+
+def _subtract(ranges, have):
+    """
+    The parts of byte ranges [(start, end)] that aren't in have, which is sorted and non-overlapping.
+    """
+    left = []
+    for start, end in ranges:
+        for a, b in have:
+            if b <= start or a >= end:
+                continue
+            if a > start:
+                left.append((start, a))
+            start = max(start, b)
+            if start >= end:
+                break
+        if start < end:
+            left.append((start, end))
+    return left
+
+
+def _coalesce(ranges, gap):
+    """
+    Sort byte ranges [(start, end)] and merge the ones less than gap bytes apart.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start - merged[-1][1] <= gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _record_install(url, pkg, archive, virtual=False, root=None, files=None, members=None):
+    """
+    Write the record of pkg having been installed from url, out of the cached file archive.
+
+    For virtual installs, root is the folder in the archive that is the package.
+    files is the manifest of what was installed, as [(path, size, mtime_ns, digest, crc32)], for verify().
+    For partial installs, members is the list of glob patterns that were installed.
+    """
+    with _span('metadata', url=url, pkg=pkg, files=len(files) if files is not None else 0):
+        data = pathlib.Path(_save_data_path(_app())) # TODO: consider .load_data_paths(APP)
+        checksum = _recorded_checksum(archive)
+        now = time.time()
+        with _db() as db:
+            db.execute("""INSERT INTO packages (name, source, urlkey, checksum, size, path, archive, virtual, root, members, installed_at, updated_at)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                          ON CONFLICT (name) DO UPDATE SET
+                              source=excluded.source, urlkey=excluded.urlkey, checksum=excluded.checksum, size=excluded.size,
+                              path=excluded.path, archive=excluded.archive, virtual=excluded.virtual, root=excluded.root,
+                              members=excluded.members, updated_at=excluded.updated_at""",
+                       (pkg, url, urlkey(url), checksum, os.path.getsize(archive), None if virtual else str(data/pkg),
+                        os.fspath(archive), int(virtual), root, None if members is None else json.dumps(members), now, now))
+            db.execute("DELETE FROM files WHERE package = ?", (pkg,))
+            if files is not None:
+                db.executemany("INSERT INTO files (package, path, size, mtime_ns, digest, crc32) VALUES (?, ?, ?, ?, ?, ?)",
+                               [(pkg, *f) for f in files])
+        _bump_generation()
+
+
+def _recorded_checksum(file):
+    """
+    The verified checksum of file, as 'algorithm:hexdigest', if _record_digest() has one; otherwise None.
+    """
+    try:
+        with open(str(file)+".json") as r:
+            digests = json.load(r).get('digests', {})
+    except (OSError, ValueError):
+        return None
+    for algorithm in sorted(digests, key=lambda a: a != 'sha256'): # prefer sha256
+        if _recorded_digest(file, algorithm) is not None:
+            return f"{algorithm}:{digests[algorithm]}"
+
+
+_tarballs = ('.tar.gz', '.tgz', '.tar.xz', '.tar.bz2')
+
+
+def install(url=None, checksum=None, pkg=None, virtual=False, stream=False, members=None, transforms=None):
+    """
+    Download, check and unpack the package at url, if it isn't already installed.
+
+    checksum: 'algorithm:hexdigest', e.g. 'sha256:c06db2...'
+    pkg: the name to install under; by default this is taken from the archive.
+    virtual: if True, don't unpack the archive; path(pkg) gives an ArchivePath that reads
+             files out of the cached archive as they're opened.
+    stream: if True, and url is a tarball, unpack it while it downloads, instead of downloading it first.
+            zips can't be unpacked until their table of contents, at the end, has arrived, so this is ignored for them.
+    members: only install the files matching these glob patterns (like ['atlas/*.nii.gz']; relative to the package,
+             like path(pkg) is). For a zip, only those files are downloaded, if the server does byte ranges.
+             Installing more members later adds to the package.
+    transforms: transforms (registered with @humbugga.transform, by name or the function itself) to make artifacts
+                of the package with, once it's installed, unless they're made already; see artifact().
+
+    Returns the installed package name.
+
+    With no url, installs everything declared with requires(), concurrently.
+    """
+
+    # TODO:
+    # - if given pkg= then we can support versioning:
+    # - check metadata/"pkg"/pkg/source; is it the same as URL? if not, download the new one
+    #   - probably wanna be careful to not *uninstall* the old one until the new one is downloaded and checksummed
+
+    # 1. Check if url is already installed. If so, skip.
+    # 2. If not, download it
+    #   -> check the *cache* first, and check for partially downloaded files too.
+    #   -> there 
+    #  downloading means:
+    #  1. do
+    #  2. check the checksum
+    #  
+    # why is the flow so tangly here?
+    # download:
+    # -> if the file doesn't exist in the cache, call download()
+        # -> difficult case: there's more than one cache to check
+    # -> assert the file does exist in the cache now (or else download() gave an exception)
+    # -> check its checksum (if bad give an exception)
+       # -> if no checksum: assume good?
+    # 
+    # 3. unpack and install
+    # -> 
+    # -> write to the database
+    #   -> catch: there's more than one database to check
+
+    # how do I know if I file is installed from its URL?
+    # -> by looking in the database for something marked from this specific URL
+
+    # the error messages could be better
+
+    # 
+
+    if url is None:
+        return _manifest.install()
+
+    # argument parsing
+    # TODO: validate url? or should we just leave that up to requests?
+    algorithm, checksum = _parse_checksum(checksum)
+    if isinstance(members, str):
+        members = [members]
+    if members is not None and virtual:
+        raise ValueError("members= can't be used with virtual=True; a virtual install reads whatever it needs from the archive anyway")
+    transforms = [_transform(t) for t in transforms or ()]
+    if members is not None and transforms:
+        raise ValueError("transforms= can't be used with members=; artifacts are made from whole packages")
+
+    with _span('install', url=url, **({'pkg': pkg} if pkg is not None else {})) as span:
+        pkg = _install(url, algorithm, checksum, pkg, virtual, stream, members)
+        span.set(pkg=pkg)
+        _apply_transforms(pkg, transforms)
+    return pkg
+
+
+def _install(url, algorithm, checksum, pkg, virtual, stream, members):
+    """
+    The rest of install(), once its arguments are sorted out.
+    """
+    # skip if installed
+    if (installed_pkg := _already_installed(url, pkg, members)) is not None:
+        warnings.warn(f"{url} already installed.")
+        _annotate(cache='installed')
+        return installed_pkg
+
+    # only one process at a time downloads and unpacks url; the rest wait here, and then find it installed
+    with _Lock('url', url, f"installing {url}"):
+        if (installed_pkg := _already_installed(url, pkg, members)) is not None:
+            _annotate(cache='installed') # by whoever we were waiting on
+            return installed_pkg
+
+        if members is not None:
+            return _partial_install(url, algorithm, checksum, pkg, members)
+
+        if stream and not virtual and urlparse(url).path.endswith(_tarballs):
+            return _stream_install(url, algorithm, checksum, pkg)
+
+        # download the package to the cache
+        file = _fetch(url, algorithm, checksum)
+
+        if virtual:
+            return _virtual_install(url, file, pkg)
+        return _unpack_install(url, file, pkg)
+
+
+class InstallError(Exception):
+    """
+    Some packages in a batch install failed.
+
+    .errors maps each failed url to its exception; .installed maps each url that succeeded to its package name.
+    """
+    def __init__(self, errors, installed):
+        self.errors = errors
+        self.installed = installed
+        super().__init__("Failed to install: " + "; ".join(f"{url}: {e!r}" for url, e in errors.items()))
+
+
+class Manifest:
+    """
+    The set of packages an app requires.
+
+    Build it up with .requires(), which can be chained, and then .install() them all at once:
+
+        humbugga.requires(url1, checksum1).requires(url2, checksum2, pkg='two')
+        humbugga.install()
+    """
+
+    def __init__(self):
+        self.packages = [] # [(url, checksum, pkg, transforms), ...]
+
+    def requires(self, url, checksum=None, pkg=None, transforms=None):
+        _parse_checksum(checksum) # fail now rather than halfway through install()
+        transforms = [_transform(t) for t in transforms or ()]
+        if pkg is not None and any(pkg == pkg_ and url != url_ for url_, _, pkg_, _ in self.packages):
+            raise ValueError(f"Package {pkg} is already required from a different url")
+        if not any(url == url_ for url_, _, _, _ in self.packages):
+            self.packages.append((url, checksum, pkg, transforms))
+        return self
+
+    def install(self, jobs=4):
+        """
+        Install every required package.
+
+        Up to `jobs` packages download at a time. As each download finishes it is unpacked, and then transformed,
+        while the others carry on downloading.
+
+        Returns {url: pkg} for all packages. If any failed, the rest are still installed,
+        and then InstallError is raised.
+        """
+        results, errors = {}, {}
+
+        # each package is timed as an 'install' span, like install() does, that's opened in fetch() and closed in
+        # unpack(); both run in the package's own copy of the context, so whatever they time nests inside it
+        def fetch(url, checksum, pkg, span):
+            span.__enter__()
+            try:
+                algorithm, checksum = _parse_checksum(checksum)
+                if (installed_pkg := _already_installed(url, pkg)) is not None:
+                    _annotate(cache='installed')
+                    return installed_pkg, None, None
+                # like install(), hold url's lock from before downloading until it's unpacked
+                lock = _Lock('url', url, f"installing {url}").acquire()
+                try:
+                    if (installed_pkg := _already_installed(url, pkg)) is None:
+                        return None, _fetch(url, algorithm, checksum), lock # unpack() releases it
+                except BaseException:
+                    lock.release()
+                    raise
+                lock.release()
+                _annotate(cache='installed') # by whoever we were waiting on
+                return installed_pkg, None, None
+            except BaseException as e:
+                span.__exit__(type(e), e, e.__traceback__)
+                raise
+
+        def unpack(url, file, pkg, lock, transforms, span):
+            try:
+                if file is not None:
+                    try:
+                        pkg = _unpack_install(url, file, pkg)
+                    finally:
+                        lock.release()
+                span.set(pkg=pkg)
+                _apply_transforms(pkg, transforms)
+            except BaseException as e:
+                span.__exit__(type(e), e, e.__traceback__)
+                raise
+            span.__exit__(None, None, None)
+            return pkg
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as downloads, \
+             concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as unpacks:
+            fetching = {}
+            for url, checksum, pkg, transforms in self.packages:
+                context = contextvars.copy_context()
+                span = _span('install', url=url, **({'pkg': pkg} if pkg is not None else {}))
+                fetching[downloads.submit(context.run, fetch, url, checksum, pkg, span)] = url, pkg, transforms, context, span
+            unpacking = {}
+            for future in concurrent.futures.as_completed(fetching):
+                url, pkg, transforms, context, span = fetching[future]
+                try:
+                    installed_pkg, file, lock = future.result()
+                except Exception as e:
+                    errors[url] = e
+                    continue
+                # even with nothing to unpack, unpack() has the span to close
+                unpacking[unpacks.submit(context.run, unpack, url, file, installed_pkg or pkg, lock, transforms, span)] = url
+
+            for future in concurrent.futures.as_completed(unpacking):
+                url = unpacking[future]
+                try:
+                    results[url] = future.result()
+                except Exception as e:
+                    errors[url] = e
+
+        if errors:
+            raise InstallError(errors, results)
+        return results
+
+
+_manifest = Manifest()
+
+
+def requires(url, checksum=None, pkg=None, transforms=None):
+    """
+    Declare that the app needs the package at url (and its artifacts from transforms);
+    install() with no arguments installs everything declared.
+
+    Returns the manifest, so calls can be chained: humbugga.requires(...).requires(...)
+    """
+    return _manifest.requires(url, checksum, pkg, transforms)
+
+
+# Background installs.
+# prefetch() queues an install and returns straight away, and a few worker threads work through the queue,
+# highest priority first. path(pkg) only waits if pkg itself is queued or being installed; if it's still queued,
+# it's installed right then, in the thread that asked, instead of waiting its turn.
+# The workers are daemon threads, so they don't keep the process alive; an install cut off by the process exiting
+# is picked up where it left off next time, like any other interrupted install.
+
+PREFETCH_JOBS = 2 # how many packages prefetch() installs at once
+
+_prefetch_queue = [] # heap of (-priority, seq, Prefetch); entries for ones that have already started are skipped
+_prefetch_seq = itertools.count()
+_in_flight = {} # url, urlkey(url) and pkg, if given -> its Prefetch, until it finishes
+_prefetch_workers = 0
+_prefetch_cv = threading.Condition()
+
+
+class Prefetch:
+    """
+    A package being installed in the background, as returned by prefetch().
+    """
+    def __init__(self, url, args, priority):
+        self.url = url
+        self.pkg = args['pkg'] # as given; result() is the name it's installed under
+        self.priority = priority
+        self._args = args
+        self._state = 'queued'
+        self._future = concurrent.futures.Future()
+        self._lock = threading.Lock()
+        self._bytes, self._total = 0, None
+
+    def done(self):
+        """
+        Whether it's finished, successfully or not.
+        """
+        return self._future.done()
+
+    def progress(self):
+        """
+        {'state': 'queued', 'installing', 'done' or 'failed', 'bytes': downloaded so far, 'total': the size of the download, if known}
+
+        A package that's already in the cache, or installed, gets to 'done' without downloading anything.
+        """
+        with self._lock:
+            return {'state': self._state, 'bytes': self._bytes, 'total': self._total}
+
+    def result(self, timeout=None):
+        """
+        Wait for it to finish, and return the installed package's name, or raise whatever install() raised.
+
+        If it hasn't started yet, it's installed now, in this thread, and timeout doesn't apply.
+        """
+        if self._claim():
+            self._run()
+        return self._future.result(timeout)
+
+    def prioritize(self, priority):
+        """
+        Raise its priority to priority, if that's higher, and it hasn't started yet.
+        """
+        with _prefetch_cv:
+            if self._state == 'queued' and priority > self.priority:
+                self.priority = priority
+                heapq.heappush(_prefetch_queue, (-priority, next(_prefetch_seq), self)) # the old entry gets skipped
+
+    def __repr__(self):
+        return f"<Prefetch {self.url} {self._state}>"
+
+    def _claim(self):
+        # take it off the queue, if nobody else has already; whoever does, runs it
+        with _prefetch_cv:
+            if self._state != 'queued':
+                return False
+            self._state = 'installing'
+            return True
+
+    def _run(self):
+        token = _prefetching.set(self)
+        try:
+            pkg = install(self.url, **self._args)
+        except BaseException as e:
+            self._finish('failed')
+            self._future.set_exception(e)
+        else:
+            self._finish('done')
+            self._future.set_result(pkg)
+        finally:
+            _prefetching.reset(token)
+
+    def _finish(self, state):
+        # before the future is resolved, so whoever's waiting on it doesn't then find it still in flight
+        with _prefetch_cv:
+            self._state = state
+            for key in [key for key, handle in _in_flight.items() if handle is self]:
+                del _in_flight[key]
+
+
+def _prefetch_worker():
+    global _prefetch_workers
+    while True:
+        with _prefetch_cv:
+            while _prefetch_queue:
+                handle = heapq.heappop(_prefetch_queue)[2]
+                if handle._claim():
+                    break
+            else:
+                _prefetch_workers -= 1
+                return
+        handle._run()
+
+
+def prefetch(url=None, checksum=None, pkg=None, priority=0, virtual=False, stream=False, members=None, transforms=None):
+    """
+    Start installing the package at url in the background, and return a Prefetch for it straight away.
+
+    The arguments are as for install(). Queued packages with a higher priority are installed first,
+    PREFETCH_JOBS at a time. Prefetching a url that's already queued or being installed returns the same
+    Prefetch, with its priority raised to priority if that's higher.
+
+    path() waits for a package that's in flight, if it's asked for by url, or by pkg if that was given here:
+
+        humbugga.prefetch(url2, checksum2, pkg='atlas')   # needed later
+        humbugga.install(url1, checksum1)                 # needed now
+        ...
+        humbugga.path('atlas')                            # waits, if it isn't done yet
+
+    With no url, prefetches everything declared with requires(), and returns {url: Prefetch}.
+    """
+    global _prefetch_workers
+
+    if url is None:
+        return {url_: prefetch(url_, checksum_, pkg_, priority, transforms=transforms_)
+                for url_, checksum_, pkg_, transforms_ in _manifest.packages}
+
+    _parse_checksum(checksum) # fail now rather than in the background
+    if members is not None and virtual:
+        raise ValueError("members= can't be used with virtual=True; a virtual install reads whatever it needs from the archive anyway")
+    transforms = [_transform(t) for t in transforms or ()]
+    if members is not None and transforms:
+        raise ValueError("transforms= can't be used with members=; artifacts are made from whole packages")
+
+    with _prefetch_cv:
+        if (handle := _in_flight.get(url)) is not None:
+            handle.prioritize(priority)
+            return handle
+        handle = Prefetch(url, {'checksum': checksum, 'pkg': pkg, 'virtual': virtual, 'stream': stream, 'members': members,
+                                'transforms': transforms}, priority)
+        for key in (url, urlkey(url), pkg):
+            if key is not None:
+                _in_flight[key] = handle
+        heapq.heappush(_prefetch_queue, (-priority, next(_prefetch_seq), handle))
+        if _prefetch_workers < PREFETCH_JOBS:
+            _prefetch_workers += 1
+            threading.Thread(target=_prefetch_worker, name="humbugga prefetch", daemon=True).start()
+    return handle
+
+
+def _await_prefetch(pkg):
+    """
+    If pkg is queued or being installed by prefetch(), wait for it (or install it now, if it hasn't started).
+    """
+    if (handle := _in_flight.get(pkg)) is not None and handle is not _prefetching.get():
+        handle.result()
+
+
+def urlkey(url):
+    """
+    Get an encoded key from a URL
+    This is used to index downloads on disk safely.
+    """
+    return hashlib.sha256(url.encode("utf-8")).hexdigest() # uhhh is this what I want? this seems kind of nasty
+
+
+
+# one entry per version of the index; _db() brings an index up to date by running the ones it's missing
+_SCHEMA = ["""
+CREATE TABLE packages (
+    name TEXT PRIMARY KEY,     -- what the package is installed as
+    source TEXT NOT NULL,      -- the url it was installed from
+    urlkey TEXT NOT NULL,      -- urlkey(source)
+    checksum TEXT,             -- 'algorithm:hexdigest' of the archive, if it was verified
+    size INTEGER,              -- of the archive
+    path TEXT,                 -- where it is unpacked, or NULL for virtual installs
+    archive TEXT,              -- the cached archive it came from
+    virtual INTEGER NOT NULL DEFAULT 0,
+    root TEXT,                 -- for virtual installs, the folder inside the archive that is the package
+    installed_at REAL,
+    updated_at REAL
+);
+CREATE INDEX packages_urlkey ON packages (urlkey);
+CREATE INDEX packages_checksum ON packages (checksum);
+""", """
+CREATE TABLE files (
+    package TEXT NOT NULL,     -- packages.name
+    path TEXT NOT NULL,        -- relative to the package, /-separated
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL, -- when it was last verified, so verify() knows it can skip it
+    digest TEXT NOT NULL,      -- 'algorithm:hexdigest'
+    crc32 INTEGER,
+    PRIMARY KEY (package, path)
+) WITHOUT ROWID;
+""", """
+CREATE TABLE cache (
+    path TEXT PRIMARY KEY,     -- a file in the download cache
+    last_access REAL NOT NULL  -- when install() last used it
+) WITHOUT ROWID;
+""", """
+ALTER TABLE packages ADD COLUMN members TEXT; -- for partial installs, the JSON list of glob patterns that were installed
+"""]
+
+_db_local = threading.local()
+
+
+def _db():
+    """
+    Get this thread's connection to the package index, creating the index if needed.
+
+    The index is a sqlite database in WAL mode, so any number of processes can read it while one writes.
+    Use the connection as a context manager to get a transaction.
+    """
+    metadata = pathlib.Path(_save_data_path(os.path.join(_app(), 'humbugga')))
+    file = str(metadata/"index.sqlite")
+
+    # per process too: a forked child (say, a DataLoader worker) mustn't use its parent's connection.
+    # The parent's stay in here, unused, rather than being closed from the child.
+    connections = _db_local.__dict__.setdefault('connections', {})
+    key = (os.getpid(), file)
+    if key in connections:
+        return connections[key]
+
+    db = sqlite3.connect(file, timeout=60)
+    db.row_factory = sqlite3.Row
+    # switching to WAL needs the database to itself, and sqlite doesn't wait for that, so retry by hand
+    for retry in range(600):
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            break
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) or retry == 599:
+                raise
+            time.sleep(0.1)
+    db.execute("PRAGMA synchronous=NORMAL") # in WAL mode this is still safe against corruption; a crash can only lose the last few commits
+
+    # (metadata/pkgs would still be there if a migration committed but didn't get to clean up)
+    if db.execute("PRAGMA user_version").fetchone()[0] < len(_SCHEMA) or (metadata/"pkgs").is_dir():
+        db.isolation_level = None
+        db.execute("BEGIN IMMEDIATE") # only one process gets to set up the index
+        try:
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+            for v in range(version, len(_SCHEMA)):
+                for statement in _SCHEMA[v].split(";"): # not executescript(), which would commit our transaction early
+                    if statement.strip():
+                        db.execute(statement)
+            _migrate(db, metadata)
+            db.execute(f"PRAGMA user_version = {len(_SCHEMA)}")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.isolation_level = ""
+        _retire_old_metadata(metadata) # only now that what was in them is safely in the index
+
+    connections[key] = db
+    return db
+
+
+def _migrate(db, metadata):
+    """
+    Import packages recorded in the old metadata/pkgs/<pkg>/source files into the index.
+
+    Packages already in the index are left alone, so this can be run again after a migration that didn't finish.
+    """
+    try:
+        pkgs = os.listdir(metadata/"pkgs")
+    except FileNotFoundError:
+        return # nothing to import, or another process has just done it
+    data = pathlib.Path(_save_data_path(_app()))
+    for pkg in pkgs:
+        try:
+            with open(metadata/"pkgs"/pkg/"source") as s:
+                source = s.readline().strip()
+            st = os.stat(metadata/"pkgs"/pkg/"source")
+        except OSError:
+            continue # half-written; nothing to salvage
+        archive, root, virtual = None, None, False
+        if (metadata/"pkgs"/pkg/"archive").exists():
+            with open(metadata/"pkgs"/pkg/"archive") as a:
+                archive = a.readline().rstrip("\n")
+                root = a.readline().rstrip("\n") or None
+            virtual = True
+        else:
+            cached = os.path.join(_cachedir(source), os.path.basename(urlparse(source).path))
+            archive = cached if os.path.exists(cached) else None
+        db.execute("""INSERT OR IGNORE INTO packages (name, source, urlkey, checksum, size, path, archive, virtual, root, installed_at, updated_at)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                   (pkg, source, urlkey(source),
+                    _recorded_checksum(archive) if archive else None, os.path.getsize(archive) if archive and os.path.exists(archive) else None,
+                    None if virtual else str(data/pkg), archive, int(virtual), root, st.st_mtime, st.st_mtime))
+
+
+def _retire_old_metadata(metadata):
+    """
+    Remove the old metadata/pkgs and metadata/sources trees, once _migrate() has committed them to the index.
+
+    Each is renamed aside first, so that it's gone in one step; a crash partway through deleting it
+    can't leave a half-deleted pkgs/ behind, to be imported again.
+    """
+    for old in ("pkgs", "sources"):
+        try:
+            os.rename(metadata/old, metadata/f".{old}.{os.getpid()}.{threading.get_ident()}.migrated")
+        except FileNotFoundError:
+            pass
+    for aside in metadata.glob(".*.migrated"): # including any a crash left behind
+        shutil.rmtree(aside, ignore_errors=True)
+
+
+# _get() is on the hot path -- people call path(pkg) / "file" once per sample in a training loop --
+# so lookups are memoized in-process. Anything that changes the index bumps a generation file next to it
+# (after committing), and the memo is thrown out whenever that file's stat changes, so a steady-state
+# lookup costs one stat() and a dict hit, and installs by other processes are still seen.
+_lookups = {} # {generation file: (stamp, {pkg: row or None})}
+_lookup_stats = {'hits': 0, 'misses': 0}
+_lookup_lock = threading.Lock()
+
+
+def _generation_file():
+    # not _save_data_path(), which would mkdir on every lookup
+    return os.path.join(xdg.BaseDirectory.xdg_data_home, _app(), 'humbugga', 'generation')
+
+
+def _generation(file):
+    try:
+        st = os.stat(file)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _bump_generation():
+    """
+    Invalidate every process's memoized lookups. Call this after committing a change to the index.
+    """
+    file = _generation_file()
+    # mtimes are only as fine as the kernel's clock tick, and inodes get reused, so it's the size that
+    # really marks a new generation: every bump grows the file by a byte (O_APPEND, so bumps can't collide)
+    with open(file, "ab") as g:
+        g.write(b".")
+        size = g.tell()
+    if size >= 4096:
+        # start over, in a new file; to ever see this stamp again would take another 4096 bumps within one tick
+        tmp = f"{file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        open(tmp, "wb").close()
+        os.replace(tmp, file)
+
+
+def lookup_stats():
+    """
+    Hit and miss counts of the in-process memo behind path(), installed() and friends, and how many lookups are in it.
+    """
+    with _lookup_lock:
+        return dict(_lookup_stats, entries=sum(len(memo) for _, memo in _lookups.values()))
+
+
+def _get(pkg):
+    """
+    Find if pkg is installed
+
+    pkg can be:
+    - the installed pkg name
+    - the source url
+    - the *encoded* source url
+        # check both by URL
+        # XXX is there a risk of namespace collisions here? could someone exploit it by crafting a URL to look a certain way?
+
+    Returns the package's row in the index, as a dict; 'encoded_url' is an alias of 'urlkey'.
+    """
+    file = _generation_file()
+    stamp = _generation(file) # before querying, so a change committed mid-query invalidates what we memoize
+    with _lookup_lock:
+        if (cached := _lookups.get(file)) is None or cached[0] != stamp:
+            cached = _lookups[file] = (stamp, {})
+        memo = cached[1]
+        if pkg in memo:
+            _lookup_stats['hits'] += 1
+            p = memo[pkg]
+            if p is None:
+                raise KeyError(f'{pkg} is not installed')
+            return dict(p)
+        _lookup_stats['misses'] += 1
+
+    p = _query(pkg)
+    with _lookup_lock:
+        memo[pkg] = p
+        if p is not None:
+            memo[p['name']] = p # a name always finds its own row
+    if p is None:
+        raise KeyError(f'{pkg} is not installed')
+    return dict(p)
+
+
+def _query(pkg):
+    # a name wins over a url; if a url was installed more than once, the latest install wins
+    row = _db().execute("""SELECT * FROM packages WHERE name = ? OR urlkey = ? OR urlkey = ?
+                           ORDER BY name = ? DESC, updated_at DESC LIMIT 1""",
+                        (pkg, pkg, urlkey(pkg), pkg)).fetchone()
+    if row is None:
+        return None
+    p = dict(row)
+    p['encoded_url'] = p['urlkey']
+    p['virtual'] = bool(p['virtual'])
+    p['members'] = None if p['members'] is None else json.loads(p['members'])
+    return p
+
+
+def installed(pkg):
+    """
+    """
+    try:
+         _get(pkg)
+         return True
+    except KeyError:
+        return False
+
+
+# archives used this recently might be in the middle of being installed by some other thread or process
+_IN_USE = 600
+
+
+def clean(max_size=None, unused=True, stale=24*3600, dry_run=False):
+    """
+    Erase cache
+
+    Evicts cached archives, least recently used first, until the cache is down to max_size bytes
+    (by default, evicts all of them). Archives that installed packages came from are kept, as is anything
+    install() used in the last few minutes.
+    Also clears out .part files and unpacking folders left behind by downloads and installs that
+    died more than `stale` seconds ago, and the artifacts of archives no installed package came from.
+    The artifacts of installed packages count towards max_size.
+
+    unused: if True, keep the archives and artifacts of installed packages. If False, erase those too,
+            except for the archives of virtual installs, which still need them.
+    dry_run: don't delete anything, just report what would be.
+
+    Returns {'evicted': [(path, size)], 'partials': [(path, size)], 'staging': [(path, size)],
+             'artifacts': [(path, size)], 'freed': bytes, 'size': bytes left in the cache}.
+    """
+    cache = _save_cache_path(os.path.join(_app(), 'humbugga'))
+    now = time.time()
+    report = {'evicted': [], 'partials': [], 'staging': [], 'artifacts': [], 'freed': 0, 'size': 0}
+
+    def inode(file):
+        try:
+            st = os.stat(file)
+        except OSError:
+            return None
+        return st.st_dev, st.st_ino
+
+    db = _db()
+    keep = {inode(archive) for archive, virtual in db.execute("SELECT archive, virtual FROM packages WHERE archive IS NOT NULL")
+            if unused or virtual}
+    accessed = dict(db.execute("SELECT path, last_access FROM cache"))
+
+    # archives are grouped by inode: the same file can be hardlinked from several urls' folders and the object store
+    entries = {}
+    for folder, _, names in os.walk(cache):
+        for name in names:
+            file = os.path.join(folder, name)
+            try:
+                st = os.lstat(file)
+            except FileNotFoundError:
+                continue
+            if name.endswith(('.part', '.part.json', '.tmp')):
+                if now - st.st_mtime > stale:
+                    report['partials'].append((file, st.st_size))
+                else:
+                    report['size'] += st.st_size # a download in progress
+                continue
+            if name.endswith('.json') and _is_record(file):
+                if not os.path.exists(file[:-len('.json')]) and not os.path.exists(file[:-len('.json')]+'.part'):
+                    report['partials'].append((file, st.st_size)) # the record of something long gone
+                else:
+                    report['size'] += st.st_size
+                continue
+            if name.endswith('.idx'): # a _TarIndex
+                if not os.path.exists(file[:-len('.idx')]):
+                    report['partials'].append((file, st.st_size))
+                else:
+                    report['size'] += st.st_size
+                continue
+            size = st.st_size
+            if name.endswith('.sparse.zip') and hasattr(st, 'st_blocks'):
+                size = min(size, st.st_blocks * 512) # only the parts partial installs needed are there; see _zip_ranges()
+            entry = entries.setdefault((st.st_dev, st.st_ino), {'paths': [], 'size': size, 'last_access': st.st_mtime})
+            entry['paths'].append(file)
+            entry['last_access'] = max(entry['last_access'], accessed.get(file, 0))
+
+    # artifacts are kept in folders by archive checksum, so once no installed package has that checksum, nothing wants them
+    staging = []
+    artifacts = _save_cache_path(os.path.join(_app(), 'humbugga-artifacts'))
+    checksums = {checksum.replace(':', '-') for checksum, in db.execute("SELECT checksum FROM packages WHERE checksum IS NOT NULL")}
+    for checksum in os.listdir(artifacts):
+        for name in os.listdir(os.path.join(artifacts, checksum)):
+            for version in os.listdir(os.path.join(artifacts, checksum, name)):
+                folder = os.path.join(artifacts, checksum, name, version)
+                mtime, size = _usage(folder)
+                if version.endswith('.tmp'): # from _build_artifact()
+                    if now - mtime > stale:
+                        staging.append((folder, size))
+                    else:
+                        report['size'] += size
+                elif checksum not in checksums and now - mtime >= _IN_USE:
+                    report['artifacts'].append((folder, size))
+                else:
+                    entries[('artifact', folder)] = {'paths': [folder], 'size': size, 'last_access': mtime, 'artifact': True}
+                    if unused and checksum in checksums:
+                        keep.add(('artifact', folder))
+
+    report['size'] += sum(entry['size'] for entry in entries.values())
+    for key, entry in sorted(entries.items(), key=lambda e: e[1]['last_access']):
+        if max_size is not None and report['size'] <= max_size:
+            break
+        if key in keep or now - entry['last_access'] < _IN_USE:
+            continue
+        if entry.get('artifact'):
+            report['artifacts'].append((entry['paths'][0], entry['size']))
+            report['size'] -= entry['size']
+            continue
+        # the space only comes back once every link to it is gone
+        report['evicted'] += [(file, entry['size'] if i == 0 else 0) for i, file in enumerate(entry['paths'])]
+        report['freed'] += entry['size']
+        report['size'] -= entry['size']
+        for file in entry['paths']:
+            for extra in (file+'.json', file+'.idx'):
+                if os.path.exists(extra):
+                    size = os.path.getsize(extra)
+                    report['partials'].append((extra, size))
+                    report['size'] -= size
+
+    data = _save_data_path(_app())
+    for name in os.listdir(data):
+        folder = os.path.join(data, name)
+        if name.startswith('tmp') and name.endswith('.part') and os.path.isdir(folder): # from _staging()
+            mtime, size = _usage(folder)
+            if now - mtime > stale:
+                report['staging'].append((folder, size))
+    report['staging'] += staging
+
+    report['freed'] += sum(size for _, size in report['partials'] + report['staging'] + report['artifacts'])
+
+    if dry_run:
+        return report
+
+    for file, _ in report['evicted'] + report['partials']:
+        try:
+            os.unlink(file)
+        except FileNotFoundError:
+            pass
+    for folder, _ in report['staging'] + report['artifacts']:
+        shutil.rmtree(folder, ignore_errors=True)
+    with _db() as db:
+        db.executemany("DELETE FROM cache WHERE path = ?", [(file,) for file, _ in report['evicted']])
+    # and tidy up the xx/yy/... and <checksum>/<transform> folders that are empty now
+    for root in (cache, artifacts):
+        for folder, _, _ in sorted(os.walk(root), key=lambda w: -len(w[0])):
+            if folder != root:
+                try:
+                    os.rmdir(folder)
+                except OSError:
+                    pass
+
+    return report
+
+
+def _usage(folder):
+    """
+    The latest mtime of anything in folder (or of folder itself), and the total size of the files in it.
+    """
+    mtime, size = os.stat(folder).st_mtime, 0
+    for parent, _, names in os.walk(folder):
+        for n in names:
+            try:
+                st = os.lstat(os.path.join(parent, n))
+            except FileNotFoundError:
+                continue
+            mtime, size = max(mtime, st.st_mtime), size + st.st_size
+    return mtime, size
+
+
+def _is_record(file):
+    """
+    Whether file is one of the file.json records that download() and _record_digest() keep, rather than a download.
+    """
+    record = _load_record(file[:-len('.json')])
+    return isinstance(record, dict) and bool(record) and set(record) <= {'size', 'mtime_ns', 'digests', 'http', 'partial', 'ranges'}
+
+
+def uninstall(pkg):
+    """
+    pkg: either the package name or the pkg's original source url
+    """
+    with _Lock('pkg', _get(pkg)['name'], f"uninstalling {pkg}"):
+        _uninstall(pkg)
+
+
+def _uninstall(pkg):
+    p = _get(pkg)
+
+    if not p['virtual']:
+        shutil.rmtree(p['path'])
+    with _db() as db:
+        db.execute("DELETE FROM packages WHERE name = ?", (p['name'],))
+        db.execute("DELETE FROM files WHERE package = ?", (p['name'],))
+    _bump_generation()
+
+
+def path(pkg):
+    """
+    Get the path to the given package.
+
+    This is analogous to importlib.resources in python. It is a lot simpler though, because our packages only ever have one root folder.
+
+    For packages installed with virtual=True this is an ArchivePath into the cached archive instead of a pathlib.Path.
+
+    If pkg is still being installed by prefetch(), this waits for it, and raises whatever its install() raised.
+    """
+    # this is in *most* 
+    if _in_flight:
+        _await_prefetch(pkg)
+    p = _get(pkg)
+    if p['virtual']:
+        return ArchivePath(p['archive'], p['root'] or "")
+    return pathlib.Path(p['path'])
+
+
+def open_member(pkg, name):
+    """
+    Open file name in pkg for reading, in binary.
+
+    For packages installed with virtual=True from a tarball, this decompresses only from the checkpoint
+    nearest before the file, not the whole archive up to it; see "Reading From Tarballs" in the README.
+    Like path(), it waits for pkg if prefetch() is still installing it.
+    """
+    if _in_flight:
+        _await_prefetch(pkg)
+    p = _get(pkg)
+    if p['virtual']:
+        member = ArchivePath(p['archive'], p['root'] or "") / name
+        if not member.is_file():
+            raise IsADirectoryError(str(member)) if member.exists() else FileNotFoundError(str(member))
+        return member.open('rb')
+    return open(pathlib.Path(p['path']) / name, 'rb')
+
+
+def verify(pkg, full=False, jobs=None):
+    """
+    Check pkg's installed files against the manifest recorded when it was installed.
+
+    Files whose size and mtime haven't changed are trusted without reading them, unless full=True;
+    only the rest are re-hashed, spread over `jobs` threads (default: one per cpu).
+    For virtual installs, the archive itself is checked instead.
+
+    Returns {path: 'missing' or 'modified'} for everything that's wrong; so, empty if pkg is intact.
+    """
+    p = _get(pkg)
+
+    if p['virtual']:
+        archive = p['archive']
+        if not os.path.exists(archive):
+            return {archive: 'missing'}
+        if p['size'] is not None and os.path.getsize(archive) != p['size']:
+            return {archive: 'modified'}
+        if p['checksum'] is not None:
+            algorithm, checksum = p['checksum'].split(':', 1)
+            digest = None if full else _recorded_digest(archive, algorithm)
+            if digest is None:
+                digest = _hash_file(archive, algorithm).hexdigest()
+            if digest != checksum:
+                return {archive: 'modified'}
+        return {}
+
+    root = pathlib.Path(p['path'])
+    files = _db().execute("SELECT path, size, mtime_ns, digest FROM files WHERE package = ?", (p['name'],)).fetchall()
+    if not files:
+        raise ValueError(f"{p['name']} has no file manifest to verify against; reinstall it to get one.")
+
+    problems = {}
+    suspects = [] # (path, size, digest, mtime_ns) to re-hash
+
+    # the stat()s are latency-bound on a network filesystem, so they go over the pool too, in batches
+    def check(batch):
+        for path, size, mtime_ns, digest in batch:
+            try:
+                st = os.stat(root/path)
+            except FileNotFoundError:
+                problems[path] = 'missing'
+                continue
+            if st.st_size != size:
+                problems[path] = 'modified'
+            elif full or st.st_mtime_ns != mtime_ns:
+                suspects.append((path, size, digest, st.st_mtime_ns))
+
+    refreshed = []
+
+    def rehash(suspect):
+        path, size, digest, mtime_ns = suspect
+        if _manifest_entry(root/path)[1] != digest:
+            problems[path] = 'modified'
+        elif mtime_ns is not None:
+            refreshed.append((mtime_ns, p['name'], path))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        for future in [pool.submit(check, files[i:i+256]) for i in range(0, len(files), 256)]:
+            future.result()
+        # biggest first, so one huge file doesn't get started last and hold everything up
+        for future in [pool.submit(rehash, s) for s in sorted(suspects, key=lambda s: -s[1])]:
+            future.result()
+
+    if refreshed:
+        # the contents are still right, so remember the new mtimes and skip these files next time.
+        # the stat() was taken before hashing, so a file that changed while being hashed gets re-hashed next time
+        with _db() as db:
+            db.executemany("UPDATE files SET mtime_ns = ? WHERE package = ? AND path = ?", refreshed)
+
+    return problems
+
+
+# Derived artifacts.
+# A transform turns an installed package into something quicker to load -- glove's 5GB of text into a numpy
+# matrix and a vocabulary, say -- so that's done once per machine instead of by every process that uses it.
+# What it makes is cached in $XDG_CACHE_HOME/$APP/humbugga-artifacts/<archive checksum>/<transform>/<version>/,
+# so it's only made again if the package's archive or the transform's version changes. It's made in a temporary
+# folder and renamed into place, under a lock, so processes that want it at the same time make it once between them.
+# clean() removes the artifacts of archives no installed package came from; they're made again if they're wanted after all.
+
+_transforms = {} # name -> function, from @transform
+
+
+def transform(name, version=1):
+    """
+    Register a function as the transform called name, for install(..., transforms=[...]) and artifact():
+
+        @humbugga.transform('glove-npy', version=2)
+        def glove_npy(src, out):
+            ... # read the package at src (what path(pkg) gives), and write files into the empty folder out
+
+    Bump version whenever the function changes what it makes, so what the old one made isn't used any more.
+    """
+    if not re.fullmatch(r"[\w.-]+", name) or not re.fullmatch(r"[\w.-]+", str(version)):
+        raise ValueError(f"Invalid transform: name and version can only have letters, digits, '_', '-' and '.': {name!r}, {version!r}")
+
+    def register(f):
+        f.transform_name, f.transform_version = name, str(version)
+        _transforms[name] = f
+        return f
+    return register
+
+
+def _transform(t):
+    """
+    Look up a transform given by name, or check that a function is one.
+    """
+    if isinstance(t, str):
+        try:
+            return _transforms[t]
+        except KeyError:
+            raise KeyError(f"No transform called {t}; register one with @humbugga.transform({t!r})") from None
+    if not hasattr(t, 'transform_name'):
+        raise ValueError(f"{t!r} is not a transform; decorate it with @humbugga.transform(name, version)")
+    return t
+
+
+def _artifact_folder(pkg, name):
+    """
+    Where the versions of the artifact called name of pkg's archive go.
+    """
+    p = _get(pkg)
+    if p['members'] is not None:
+        raise ValueError(f"{p['name']} is a partial install; artifacts are made from whole packages")
+    checksum = p['checksum']
+    if checksum is None:
+        # installed without a checksum, so hash the archive, once, and remember it
+        if p['archive'] is None or not os.path.exists(p['archive']):
+            raise ValueError(f"{p['name']} was installed without a checksum, and its archive is no longer cached, so its artifacts can't be found")
+        checksum = f"sha256:{_hash_file(p['archive'], 'sha256').hexdigest()}"
+        _record_digest(p['archive'], 'sha256', checksum.split(':', 1)[1])
+        with _db() as db:
+            db.execute("UPDATE packages SET checksum = ? WHERE name = ? AND archive = ?", (checksum, p['name'], p['archive']))
+        _bump_generation()
+    return os.path.join(_save_cache_path(os.path.join(_app(), 'humbugga-artifacts')), checksum.replace(':', '-'), name)
+
+
+def _build_artifact(pkg, t):
+    """
+    Make pkg's artifact with transform t, unless it's already made. Returns its folder.
+    """
+    parent = _artifact_folder(pkg, t.transform_name)
+    folder = os.path.join(parent, t.transform_version)
+    if os.path.isdir(folder):
+        return pathlib.Path(folder)
+    key = f"{os.path.basename(os.path.dirname(parent))}-{t.transform_name}-{t.transform_version}"
+    with _Lock('artifact', key, f"making {t.transform_name} for {pkg}"):
+        if os.path.isdir(folder): # someone else made it while we waited
+            return pathlib.Path(folder)
+        os.makedirs(parent, exist_ok=True)
+        with _span('transform', pkg=pkg, transform=t.transform_name, version=t.transform_version):
+            tmp = tempfile.mkdtemp(prefix=f"{t.transform_version}.", suffix=".tmp", dir=parent)
+            try:
+                t(path(pkg), pathlib.Path(tmp))
+                os.rename(tmp, folder)
+            except BaseException:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+    return pathlib.Path(folder)
+
+
+def _apply_transforms(pkg, transforms):
+    """
+    Make whichever of pkg's artifacts from transforms aren't made yet, concurrently.
+    """
+    if len(transforms) <= 1:
+        for t in transforms:
+            _build_artifact(pkg, t)
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(transforms)) as pool:
+        for future in [pool.submit(contextvars.copy_context().run, _build_artifact, pkg, t) for t in transforms]:
+            future.result()
+
+
+def artifact(pkg, name):
+    """
+    The folder holding what the transform called name made from pkg, as a pathlib.Path.
+
+    If the transform is registered in this process (with @transform), this makes the artifact if it's not made yet,
+    or was made by a different version. If it isn't, it returns the most recently made version, or raises KeyError.
+    """
+    if _in_flight:
+        _await_prefetch(pkg)
+    if (t := _transforms.get(name)) is not None:
+        return _build_artifact(pkg, t)
+    parent = _artifact_folder(pkg, name)
+    versions = [os.path.join(parent, v) for v in (os.listdir(parent) if os.path.isdir(parent) else ()) if not v.endswith('.tmp')]
+    if not versions:
+        raise KeyError(f"No {name} artifact for {pkg}, and no transform called {name} registered to make one")
+    return pathlib.Path(max(versions, key=os.path.getmtime))
+
+
+def list(): # XXX namespace collision oops
+    """
+    Get the list of packages installed for the current app.
+    """
+    return [name for name, in _db().execute("SELECT name FROM packages ORDER BY name")]
+
 
 if __name__ == '__main__':
     # usage demos:
@@ -0,0 +1,393 @@
+"""
+asyncio versions of humbugga's install(), download() and path().
+
+    import humbugga.aio
+    pkg = await humbugga.aio.install('https://github.com/sct-data/PAM50/releases/download/r20201104/PAM50-r20201104.zip', pkg='PAM50')
+
+Downloads happen on the event loop, so many of them can run at once, e.g. with asyncio.gather().
+Anything that hits the disk hard (catching a checksum up on a resumed file, unpack(), the metadata) runs in the default executor.
+
+These share the cache layout and the metadata with the synchronous API, so a package installed
+by one is installed for the other.
+
+Cancelling a download leaves its .part file behind, and the next download() or install() of the same url resumes it.
+Connections that fail, drop or go quiet are retried, and resumed, like the synchronous API's; see humbugga.configure_transport().
+"""
+
+import asyncio
+import contextvars
+import functools
+import hashlib
+import http.client
+import io
+import os.path
+import pathlib
+import ssl
+import warnings
+from urllib.parse import urlparse, urljoin
+
+from tqdm import tqdm
+
+import humbugga
+from humbugga import tokenize_content_range, resp_attachment_filename
+
+
+class _Response:
+    """
+    Just enough of an HTTP/1.1 response for download().
+
+    .status, .headers (case-insensitive) and .url are like requests.Response's.
+    """
+
+    def __init__(self, method, url, status, headers, reader, writer):
+        self.method = method
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self._reader = reader
+        self._writer = writer
+
+    def raise_for_status(self):
+        if 400 <= self.status:
+            raise OSError(f"HTTP {self.status} for {self.url}")
+
+    async def iter_content(self, chunk_size=(2<<19)):
+        reader = self._reader
+        if self.method == 'HEAD' or self.status in (204, 304) or 100 <= self.status < 200:
+            return
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await _timely(reader.readline())).split(b";")[0], 16)
+                if size == 0:
+                    while (await _timely(reader.readline())) not in (b"\r\n", b"\n", b""):
+                        pass # trailers
+                    return
+                while size > 0:
+                    chunk = await _timely(reader.readexactly(min(size, chunk_size)))
+                    size -= len(chunk)
+                    yield chunk
+                await _timely(reader.readline())
+        elif (length := self.headers.get('Content-Length')) is not None:
+            length = int(length)
+            while length > 0:
+                chunk = await _timely(reader.read(min(length, chunk_size)))
+                if not chunk:
+                    raise ConnectionError(f"Connection closed with {length} bytes of {self.url} left")
+                length -= len(chunk)
+                yield chunk
+        else:
+            while chunk := await _timely(reader.read(chunk_size)):
+                yield chunk
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def _timely(aw):
+    """
+    aw, but giving up with asyncio.TimeoutError if the server goes quiet for longer than humbugga's transport allows.
+    """
+    return asyncio.wait_for(aw, humbugga._transport['timeout'])
+
+
+def _is_transient(e):
+    # like humbugga._is_transient(): a failed, dropped or stalled connection, which is worth retrying
+    return isinstance(e, (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError))
+
+
+async def _backoff(attempt, url, e):
+    """
+    Like humbugga._backoff(), without blocking the event loop.
+    """
+    delay = humbugga._retry_delay(attempt, url, e)
+    with humbugga._span('retry', url=url, attempt=attempt+1, reason=type(e).__name__):
+        await asyncio.sleep(delay)
+
+
+async def _request(method, url, headers={}, max_redirects=10):
+    """
+    Make an HTTP request, following redirects, timed like humbugga._request().
+
+    Failed connections, and statuses worth trying again, are retried like the synchronous transport does;
+    past that, the last response is returned, for raise_for_status().
+    Every request gets its own connection, which is closed with the response.
+    """
+    with humbugga._span('head' if method == 'HEAD' else 'connect', url=url) as span:
+        for attempt in range(humbugga._transport['retries']+1):
+            try:
+                resp = await _follow(method, url, headers, max_redirects)
+            except Exception as e:
+                if not _is_transient(e):
+                    raise
+                await _backoff(attempt, url, e)
+                continue
+            if resp.status not in humbugga._RETRY_STATUSES or attempt == humbugga._transport['retries']:
+                break
+            await resp.close()
+            await _backoff(attempt, url, OSError(f"HTTP {resp.status}"))
+        span.set(status=resp.status, retries=attempt)
+    return resp
+
+
+async def _follow(method, url, headers, max_redirects):
+    for _ in range(max_redirects+1):
+        u = urlparse(url)
+        if u.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported url: {url}")
+        port = u.port or (443 if u.scheme == 'https' else 80)
+        reader, writer = await _timely(asyncio.open_connection(
+            u.hostname, port,
+            ssl=ssl.create_default_context() if u.scheme == 'https' else None))
+
+        target = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        host = u.hostname if u.port is None else f"{u.hostname}:{u.port}"
+        request = [f"{method} {target} HTTP/1.1", f"Host: {host}",
+                   "User-Agent: humbugga", "Accept-Encoding: identity", "Connection: close"]
+        request += [f"{k}: {v}" for k, v in headers.items()]
+        writer.write(("\r\n".join(request) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = b""
+        try:
+            status_line = await _timely(reader.readline())
+            _, status, *_ = status_line.decode("latin-1").split(" ", 2)
+            status = int(status)
+            head = await _timely(reader.readuntil(b"\r\n\r\n"))
+        except (ValueError, asyncio.IncompleteReadError):
+            writer.close()
+            raise ConnectionError(f"Invalid HTTP response from {u.netloc}: {status_line!r}")
+        except BaseException:
+            writer.close()
+            raise
+        resp_headers = http.client.parse_headers(io.BytesIO(head))
+
+        resp = _Response(method, url, status, resp_headers, reader, writer)
+        if status in (301, 302, 303, 307, 308) and 'Location' in resp_headers:
+            await resp.close()
+            url = urljoin(url, resp_headers['Location'])
+            if status == 303:
+                method = 'GET'
+            continue
+        return resp
+    raise ConnectionError(f"Too many redirects: {url}")
+
+
+def _run(f, *args, **kwargs):
+    """
+    Run f(*args, **kwargs) in the default executor, inside the current span, if any.
+    """
+    return asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, functools.partial(f, *args, **kwargs))
+
+
+async def _hash_file(file, algorithm, C=None):
+    return await _run(humbugga._hash_file, file, algorithm, C)
+
+
+async def download(url, path, remote_filenames=False, progress=True, overwrite='skip', algorithm=None):
+    """
+    Download the file from url to folder path
+
+    Like humbugga.download(), but doesn't block the event loop. Segmented downloads aren't supported.
+    """
+    path = pathlib.Path(path)
+
+    filename = None
+    if remote_filenames:
+        async with await _request('HEAD', url) as resp:
+            resp.raise_for_status()
+            filename = resp_attachment_filename(resp)
+    if filename is None:
+        filename = os.path.basename(urlparse(url).path)
+
+    target_file = (path/filename)
+    partial_file = pathlib.Path(str(path/filename)+(".part"))
+
+    if os.path.exists(target_file):
+        if overwrite == True:
+            pass
+        elif overwrite == 'skip':
+            if algorithm is not None:
+                digest = humbugga._recorded_digest(target_file, algorithm) or (await _hash_file(target_file, algorithm)).hexdigest()
+                return target_file, digest
+            return target_file
+        elif overwrite == False:
+            raise ValueError(f"File exists: {target_file}. Pass overwrite=True to redownload, or overwrite='skip' to ignore this.")
+        else:
+            raise ValueError(f"Invalid parameter: overwrite={overwrite}")
+
+    if os.path.exists(str(partial_file)+".json"):
+        # a segmented download from the synchronous API; only it knows how to finish that
+        return await _run(humbugga.download, url, path, progress=progress, overwrite=overwrite, algorithm=algorithm)
+
+    os.makedirs(path, exist_ok=True)
+    with open(partial_file, "ab") as f:
+        # like humbugga.download(): only resume a .part if we know which version of the file it is, and then
+        # only if the server still has that version, so two versions never get spliced together
+        validators = humbugga._load_record(target_file).get('partial') if f.tell() > 0 else None
+        if f.tell() > 0 and not validators:
+            warnings.warn(f"Nothing recorded about which version of {url} {partial_file} is. Starting over.")
+            f.truncate(0)
+            f.seek(0)
+
+        attempt = 0
+        try:
+            while True:
+                C = hashlib.new(algorithm) if algorithm is not None else None
+                if f.tell() > 0:
+                    headers = {'Range': f'bytes={f.tell():d}-'}
+                    if if_range := humbugga._if_range(validators):
+                        headers['If-Range'] = if_range
+                    if C is not None:
+                        await _hash_file(partial_file, algorithm, C)
+                else:
+                    headers = {}
+
+                try:
+                    with humbugga._span('transfer', url=url) as span:
+                        async with await _request('GET', url, headers) as resp:
+                            range_size = None
+
+                            if resp.status == 416 and f.tell() > 0 and (resp_range := resp.headers.get('Content-Range', None)) is not None:
+                                # "bytes */size": we asked to start past the end. if it's right at the end, we already have all of it
+                                _, _, range_size = tokenize_content_range(resp_range)
+                                if range_size == f.tell():
+                                    break
+                            resp.raise_for_status()
+
+                            if (resp_range := resp.headers.get('Content-Range', None)) is not None:
+                                _, range_region, range_size = tokenize_content_range(resp_range)
+                                if validators and validators.get('size') not in (None, range_size):
+                                    # no usable If-Range, but the size gives it away
+                                    warnings.warn(f"{url} has changed since this download started. Starting over.")
+                                    f.truncate(0)
+                                    f.seek(0)
+                                    validators = None
+                                    continue
+                            elif (range_size := resp.headers.get('Content-Length', None)) is not None:
+                                if f.tell() > 0:
+                                    # the server doesn't do ranges, or the file changed under If-Range:
+                                    warnings.warn(f"{urlparse(resp.url).netloc} didn't resume {url}. Starting over.")
+                                    f.truncate(0)
+                                    f.seek(0) # truncate() doesn't move the position, and tell() is what we check the server against
+                                    if C is not None:
+                                        C = hashlib.new(algorithm)
+                                range_size = int(range_size)
+                                range_region = 0, range_size-1
+                            else:
+                                range_region = None
+
+                            if range_region is not None and range_region[0] != f.tell():
+                                raise ValueError(f"Range mismatch: we requested {f.tell()}- but the server tried to write to {range_region}")
+
+                            if f.tell() == 0:
+                                # remember which version of the file this is, for resuming it
+                                validators = humbugga._validators(resp, range_size)
+                                await _run(humbugga._record_validators, target_file, 'partial', validators)
+
+                            with tqdm(
+                                desc=filename,
+                                unit="B",
+                                unit_scale=True,
+                                unit_divisor=1024,
+                                initial=range_region[0] if range_region else 0,
+                                total=range_size,
+                                disable=not progress,
+                            ) as bar:
+                                async for chunk in resp.iter_content():
+                                    write = _run(f.write, chunk)
+                                    try:
+                                        await asyncio.shield(write)
+                                    except asyncio.CancelledError:
+                                        # let the write land before the file gets closed, so the .part is consistent for resuming
+                                        await write
+                                        raise
+                                    if C is not None:
+                                        C.update(chunk)
+                                    bar.update(len(chunk))
+                                    span.add('bytes', len(chunk))
+                    break
+                except Exception as e:
+                    if not _is_transient(e):
+                        raise
+                    await _backoff(attempt, url, e) # and then resume from wherever we got to
+                    attempt += 1
+        except BaseException:
+            f.flush()
+            if f.tell() == 0:
+                os.unlink(partial_file) # nothing worth resuming, e.g. a 404
+            raise
+
+        f.flush()
+        if os.stat(partial_file).st_size == range_size or range_size is None:
+            await _run(humbugga._finish_download, partial_file, target_file)
+        else:
+            C = None
+
+    if algorithm is not None:
+        return target_file, (C.hexdigest() if C is not None else None)
+    return target_file
+
+
+async def install(url, checksum=None, pkg=None, virtual=False):
+    """
+    Download, check and unpack the package at url, if it isn't already installed.
+
+    Like humbugga.install(). Returns the installed package name.
+    """
+    algorithm, checksum = humbugga._parse_checksum(checksum)
+    with humbugga._span('install', url=url, **({'pkg': pkg} if pkg is not None else {})) as span:
+        pkg = await _install(url, algorithm, checksum, pkg, virtual)
+        span.set(pkg=pkg)
+    return pkg
+
+
+async def _install(url, algorithm, checksum, pkg, virtual):
+    if (installed_pkg := await _run(humbugga._already_installed, url, pkg)) is not None:
+        warnings.warn(f"{url} already installed.")
+        humbugga._annotate(cache='installed')
+        return installed_pkg
+
+    # hold url's lock like humbugga.install() does; it's taken on the executor, since waiting on it blocks
+    lock = humbugga._Lock('url', url, f"installing {url}")
+    acquiring = _run(lock.acquire)
+    try:
+        await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        acquiring.add_done_callback(lambda f: f.exception() is None and lock.release())
+        raise
+    try:
+        if (installed_pkg := await _run(humbugga._already_installed, url, pkg)) is not None:
+            humbugga._annotate(cache='installed')
+            return installed_pkg
+
+        # humbugga._fetch(), with the download done here
+        if (file := await _run(humbugga._fetch_cached, url, algorithm, checksum)) is not None:
+            digest = checksum
+        elif checksum is not None:
+            file, digest = await download(url, humbugga._cachedir(url), algorithm=algorithm)
+        else:
+            file, digest = await download(url, humbugga._cachedir(url)), None
+        file = await _run(humbugga._fetch_checked, url, file, algorithm, checksum, digest)
+
+        if virtual:
+            return await _run(humbugga._virtual_install, url, file, pkg)
+        return await _run(humbugga._unpack_install, url, file, pkg)
+    finally:
+        lock.release()
+
+
+async def path(pkg):
+    """
+    Get the path to the given package.
+    """
+    return await _run(humbugga.path, pkg)
@@ -0,0 +1,59 @@
+"""
+Fixtures the tests share: a private data and cache folder for humbugga, and a local server to install from.
+"""
+
+import hashlib
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, os.path.join(HERE, "..", "benchmarks"))
+import humbugga
+from server import serve
+
+
+@pytest.fixture
+def isolated(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    monkeypatch.setattr(humbugga.xdg.BaseDirectory, "xdg_cache_home", str(tmp_path / "cache"))
+    monkeypatch.setattr(humbugga.xdg.BaseDirectory, "xdg_data_home", str(tmp_path / "data"))
+    monkeypatch.setattr(humbugga, "APP", "humbugga-test")
+    monkeypatch.setattr(humbugga, "SHARED_CACHES", [])
+    humbugga._lookups.clear()
+    return tmp_path
+
+
+@pytest.fixture
+def www(tmp_path):
+    """
+    The folder server serves.
+    """
+    folder = tmp_path / "www"
+    folder.mkdir()
+    return folder
+
+
+@pytest.fixture
+def server(www, monkeypatch):
+    """
+    benchmarks/server.py, serving www; change how it behaves with server.reset(ranges=False, ...).
+    """
+    monkeypatch.setitem(humbugga._transport, 'backoff', 0.01) # retries are part of what's tested; don't wait on them
+    with serve(www) as server:
+        yield server
+
+
+@pytest.fixture
+def publish(www, server):
+    """
+    publish(name, data): put data in www, and return its url and checksum.
+    """
+    def publish(name, data):
+        with open(www / name, "wb") as f:
+            f.write(data)
+        return f"{server.url}/{name}", "sha256:" + hashlib.sha256(data).hexdigest()
+    return publish
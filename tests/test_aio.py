@@ -0,0 +1,149 @@
+"""
+humbugga.aio against a local server.
+
+    python -m pytest tests/
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import random
+import warnings
+import zipfile
+
+import pytest
+
+import humbugga
+import humbugga.aio
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        yield
+
+
+@pytest.fixture
+def data():
+    return random.Random(0).randbytes(3 << 20)
+
+
+def zipped(files):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as z:
+        for name, contents in files.items():
+            z.writestr(name, contents)
+    return out.getvalue()
+
+
+async def cancel_partway(url, folder, partial_file, at):
+    """
+    Start downloading url, and cancel it once at bytes of it are in partial_file.
+    """
+    task = asyncio.ensure_future(humbugga.aio.download(url, folder, progress=False, algorithm='sha256'))
+    while not (os.path.exists(partial_file) and os.path.getsize(partial_file) >= at):
+        assert not task.done()
+        await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+def test_install(isolated, publish):
+    url, checksum = publish("pkg.zip", zipped({"pkg/data.txt": "hello"}))
+    pkg = asyncio.run(humbugga.aio.install(url, checksum))
+    assert pkg == "pkg"
+    assert (asyncio.run(humbugga.aio.path(pkg)) / "data.txt").read_text() == "hello"
+    assert humbugga.installed(pkg) # by the synchronous API too
+    assert asyncio.run(humbugga.aio.install(url, checksum)) == pkg
+
+
+def test_resume_after_cancel(isolated, publish, server, data, tmp_path):
+    url, _ = publish("file.bin", data)
+    folder = tmp_path / "out"
+    server.reset(bandwidth=2 << 20)
+    asyncio.run(cancel_partway(url, folder, folder / "file.bin.part", 1 << 20))
+    assert not os.path.exists(folder / "file.bin")
+    had = os.path.getsize(folder / "file.bin.part")
+
+    server.reset()
+    file, digest = asyncio.run(humbugga.aio.download(url, folder, progress=False, algorithm='sha256'))
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert server.stats['bytes'] < len(data) - had // 2 # only the rest was downloaded (give or take what the cancelled one was still being sent)
+    assert not os.path.exists(folder / "file.bin.part")
+
+
+def test_resume_without_ranges(isolated, publish, server, data, tmp_path):
+    url, _ = publish("file.bin", data)
+    folder = tmp_path / "out"
+    server.reset(bandwidth=2 << 20)
+    asyncio.run(cancel_partway(url, folder, folder / "file.bin.part", 1 << 20))
+
+    server.reset(ranges=False)
+    file, digest = asyncio.run(humbugga.aio.download(url, folder, progress=False, algorithm='sha256'))
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+
+
+def test_resume_changed_file(isolated, publish, server, data, tmp_path):
+    url, _ = publish("file.bin", data)
+    folder = tmp_path / "out"
+    server.reset(bandwidth=2 << 20)
+    asyncio.run(cancel_partway(url, folder, folder / "file.bin.part", 1 << 20))
+
+    # If-Range: doesn't match any more, so the server sends all of the new version, which replaces what we had
+    changed = data[::-1]
+    publish("file.bin", changed)
+    server.reset()
+    file, digest = asyncio.run(humbugga.aio.download(url, folder, progress=False, algorithm='sha256'))
+    assert open(file, "rb").read() == changed
+    assert digest == hashlib.sha256(changed).hexdigest()
+
+
+def test_bad_checksum(isolated, publish):
+    good = zipped({"pkg/data.txt": "good"})
+    _, checksum = publish("pkg.zip", good)
+    url, _ = publish("pkg.zip", zipped({"pkg/data.txt": "tampered"}))
+    with pytest.raises(ValueError, match="Invalid checksum"):
+        asyncio.run(humbugga.aio.install(url, checksum))
+    assert os.listdir(humbugga._cachedir(url)) == []
+    assert not humbugga.installed("pkg")
+
+    publish("pkg.zip", good)
+    pkg = asyncio.run(humbugga.aio.install(url, checksum))
+    assert (humbugga.path(pkg) / "data.txt").read_text() == "good"
+
+
+def test_resume_finished_part(isolated, publish, server, data, tmp_path):
+    # all of it made it into the .part, but the download was cancelled before it was moved into place: the server says 416
+    url, _ = publish("file.bin", data)
+    folder = tmp_path / "out"
+    server.reset(bandwidth=2 << 20)
+    asyncio.run(cancel_partway(url, folder, folder / "file.bin.part", 1 << 20))
+    with open(folder / "file.bin.part", "wb") as f:
+        f.write(data)
+
+    server.reset()
+    file, digest = asyncio.run(humbugga.aio.download(url, folder, progress=False, algorithm='sha256'))
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+
+
+def test_dropped_connection_is_resumed(isolated, publish, server, data, tmp_path):
+    url, _ = publish("file.bin", data)
+    server.reset(fail_after=1 << 20)
+    file, digest = asyncio.run(humbugga.aio.download(url, tmp_path / "out", progress=False, algorithm='sha256'))
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert server.stats['requests'] == 2
+    assert server.stats['bytes'] == len(data)
+
+
+def test_unavailable_is_retried(isolated, publish, server):
+    url, checksum = publish("pkg.zip", zipped({"pkg/data.txt": "hello"}))
+    server.reset(unavailable=2)
+    assert asyncio.run(humbugga.aio.install(url, checksum)) == "pkg"
+    assert server.stats['requests'] == 3
@@ -0,0 +1,61 @@
+"""
+clean(), on what install() leaves in the cache.
+
+    python -m pytest tests/
+"""
+
+import pytest
+
+import humbugga
+from test_install import tarball
+
+
+@pytest.fixture
+def upper(monkeypatch):
+    """
+    A transform that upper-cases the package's data.txt.
+    """
+    monkeypatch.setattr(humbugga, "_transforms", {})
+    monkeypatch.setattr(humbugga, "_IN_USE", 0) # nothing's in the middle of being installed here
+
+    @humbugga.transform('upper')
+    def upper(src, out):
+        (out / "data.txt").write_bytes((src / "data.txt").read_bytes().upper())
+    return upper
+
+
+def install(publish, name, data):
+    url, checksum = publish(f"{name}.tar.gz", tarball({f"{name}/data.txt": data}))
+    pkg = humbugga.install(url, checksum, transforms=['upper'])
+    return pkg, humbugga.artifact(pkg, 'upper')
+
+
+def test_artifacts_of_uninstalled_packages(isolated, publish, upper):
+    a, a_artifact = install(publish, "a", b"a" * 1000)
+    b, b_artifact = install(publish, "b", b"b" * 1000)
+    humbugga.uninstall(a)
+
+    report = humbugga.clean(dry_run=True)
+    assert report['artifacts'] == [(str(a_artifact), 1000)]
+    assert a_artifact.exists()
+
+    report = humbugga.clean()
+    assert report['artifacts'] == [(str(a_artifact), 1000)]
+    assert report['freed'] >= 1000
+    assert not a_artifact.parent.parent.exists() # the whole <checksum>/ folder
+    assert (b_artifact / "data.txt").read_bytes() == b"B" * 1000
+
+
+def test_artifacts_count_towards_max_size(isolated, publish, upper):
+    a, a_artifact = install(publish, "a", b"a" * 100_000)
+
+    report = humbugga.clean(max_size=0, dry_run=True)
+    assert report['size'] >= 100_000 # an installed package's artifact is kept, like its archive
+    assert report['artifacts'] == []
+
+    report = humbugga.clean(max_size=50_000, unused=False)
+    assert report['artifacts'] == [(str(a_artifact), 100_000)]
+    assert report['size'] <= 50_000
+    assert not a_artifact.exists()
+    # and it's made again when it's wanted
+    assert (humbugga.artifact(a, 'upper') / "data.txt").read_bytes() == b"A" * 100_000
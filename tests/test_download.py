@@ -0,0 +1,178 @@
+"""
+download() against a local server that drops connections, ignores byte ranges, and so on.
+
+    python -m pytest tests/
+"""
+
+import hashlib
+import os
+import random
+import warnings
+
+import pytest
+
+import humbugga
+
+
+@pytest.fixture
+def data():
+    return random.Random(0).randbytes(3 << 20)
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        yield
+
+
+def test_resume_without_ranges_uses_the_full_response(isolated, publish, server, data, tmp_path):
+    # the connection drops, and the server answers the resume with all of the file: that's the download, start to finish
+    url, _ = publish("file.bin", data)
+    server.reset(ranges=False, fail_after=1 << 20)
+    file, digest = humbugga.download(url, tmp_path / "out", progress=False, algorithm='sha256')
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert server.stats['requests'] == 2
+
+
+def test_resume_without_ranges_with_a_sink(isolated, publish, server, data, tmp_path):
+    # what was passed on to the sink can't be taken back, so this one can't start over
+    url, _ = publish("file.bin", data)
+    server.reset(ranges=False, fail_after=1 << 20)
+    with pytest.raises(ConnectionError, match="byte ranges"):
+        humbugga.download(url, tmp_path / "out", progress=False, sink=lambda chunk: None)
+
+
+@pytest.mark.parametrize("conditional", [True, False], ids=["304", "ignored"])
+def test_update(isolated, publish, server, tmp_path, conditional):
+    server.reset(conditional=conditional)
+    url, _ = publish("file.bin", b"version 1")
+    file = humbugga.download(url, tmp_path / "out", progress=False)
+
+    # unchanged: one request, and nothing downloaded if the server answers 304
+    server.reset(conditional=conditional)
+    assert humbugga.download(url, tmp_path / "out", progress=False, overwrite='update') == file
+    assert server.stats['requests'] == 1
+    if conditional:
+        assert server.stats['bytes'] == 0
+    assert open(file, "rb").read() == b"version 1"
+
+    # changed: still one request, whose answer is the new version
+    publish("file.bin", b"version 2, which is longer")
+    server.reset(conditional=conditional)
+    file, digest = humbugga.download(url, tmp_path / "out", progress=False, overwrite='update', algorithm='sha256')
+    assert open(file, "rb").read() == b"version 2, which is longer"
+    assert digest == hashlib.sha256(b"version 2, which is longer").hexdigest()
+    assert server.stats['requests'] == 1
+    assert not os.path.exists(f"{file}.part")
+
+
+def test_resume_single_stream(isolated, publish, server, data, tmp_path, monkeypatch):
+    url, _ = publish("file.bin", data)
+    folder = tmp_path / "out"
+    monkeypatch.setitem(humbugga._transport, 'retries', 0) # so the dropped connection is the end of it, for now
+    server.reset(fail_after=1 << 20)
+    with pytest.raises(Exception):
+        humbugga.download(url, folder, progress=False)
+    assert os.path.getsize(folder / "file.bin.part") == 1 << 20
+    assert 'partial' in humbugga._load_record(folder / "file.bin")
+
+    server.reset()
+    file, digest = humbugga.download(url, folder, progress=False, algorithm='sha256')
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert server.stats['bytes'] == len(data) - (1 << 20)
+    assert 'http' in humbugga._load_record(file) and 'partial' not in humbugga._load_record(file)
+
+
+def test_unidentified_part_is_started_over(isolated, publish, server, data, tmp_path):
+    # e.g. left by an older version of humbugga: there's no telling whether it's the same version of the file
+    url, _ = publish("file.bin", data)
+    folder = tmp_path / "out"
+    folder.mkdir()
+    with open(folder / "file.bin.part", "wb") as f:
+        f.write(b"x" * 1000)
+    file, digest = humbugga.download(url, folder, progress=False, algorithm='sha256')
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize("drop", [False, True], ids=["", "dropped"])
+def test_segmented(isolated, publish, server, data, tmp_path, drop):
+    url, _ = publish("file.bin", data)
+    server.reset(fail_after=100_000 if drop else None)
+    file, digest = humbugga.download(url, tmp_path / "out", progress=False, segments=4, algorithm='sha256')
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert server.stats['requests'] == 1 + 4 + drop # a HEAD, the segments, and resuming the one that dropped
+    assert not os.path.exists(f"{file}.part") and not os.path.exists(f"{file}.part.json")
+
+
+def interrupt_segmented(url, folder, server, monkeypatch):
+    """
+    Start a segmented download of url, and have it give up partway, leaving its .part and .part.json behind.
+    """
+    with monkeypatch.context() as m:
+        m.setitem(humbugga._transport, 'retries', 0)
+        server.reset(fail_after=100_000)
+        with pytest.raises(Exception):
+            humbugga.download(url, folder, progress=False, segments=4)
+    assert os.path.exists(folder / "file.bin.part.json")
+
+
+def test_segmented_resume(isolated, publish, server, data, tmp_path, monkeypatch):
+    url, _ = publish("file.bin", data)
+    folder = tmp_path / "out"
+    interrupt_segmented(url, folder, server, monkeypatch)
+
+    # the plan in .part.json is picked up again, even without segments=
+    server.reset()
+    file, digest = humbugga.download(url, folder, progress=False, algorithm='sha256')
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert server.stats['bytes'] < len(data)
+    assert not os.path.exists(folder / "file.bin.part.json")
+
+
+def test_segmented_without_ranges(isolated, publish, server, data, tmp_path):
+    url, _ = publish("file.bin", data)
+    server.reset(ranges=False)
+    file, digest = humbugga.download(url, tmp_path / "out", progress=False, segments=4, algorithm='sha256')
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert not os.path.exists(f"{file}.part.json")
+
+
+@pytest.mark.parametrize("how", ["no-ranges", "changed"])
+def test_segmented_resume_falls_back(isolated, publish, server, data, tmp_path, monkeypatch, how):
+    # resuming a segmented download, but the server has stopped sending ranges, or If-Range: says the file's changed
+    url, _ = publish("file.bin", data)
+    folder = tmp_path / "out"
+    interrupt_segmented(url, folder, server, monkeypatch)
+
+    if how == "changed":
+        data = data[::-1]
+        publish("file.bin", data)
+    server.reset(ranges=how != "no-ranges")
+    file, digest = humbugga.download(url, folder, progress=False, algorithm='sha256')
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert not os.path.exists(folder / "file.bin.part.json")
+
+
+def test_segmented_after_single_stream(isolated, publish, server, data, tmp_path, monkeypatch):
+    # a single stream that got partway is kept, and only the rest is split into segments
+    url, _ = publish("file.bin", data)
+    folder = tmp_path / "out"
+    with monkeypatch.context() as m:
+        m.setitem(humbugga._transport, 'retries', 0)
+        server.reset(fail_after=1 << 20)
+        with pytest.raises(Exception):
+            humbugga.download(url, folder, progress=False)
+
+    server.reset()
+    file, digest = humbugga.download(url, folder, progress=False, segments=4, algorithm='sha256')
+    assert open(file, "rb").read() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert server.stats['bytes'] == len(data) - (1 << 20)
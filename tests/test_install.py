@@ -0,0 +1,105 @@
+"""
+Installing from a local server.
+
+    python -m pytest tests/
+"""
+
+import io
+import os
+import tarfile
+import zipfile
+import zlib
+
+import pytest
+
+import humbugga
+
+
+def tarball(files):
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode="w:gz") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("stream", [False, True], ids=["fetch", "stream"])
+def test_bad_checksum_is_not_kept(isolated, publish, stream):
+    good = tarball({"pkg/data.txt": b"good"})
+    _, checksum = publish("pkg.tar.gz", good)
+    url, _ = publish("pkg.tar.gz", tarball({"pkg/data.txt": b"tampered"}))
+
+    with pytest.raises(ValueError, match="Invalid checksum"):
+        humbugga.install(url, checksum, stream=stream)
+    assert os.listdir(humbugga._cachedir(url)) == []
+    assert not humbugga.installed("pkg")
+
+    # once upstream is fixed, installing works, rather than failing on what's left in the cache
+    publish("pkg.tar.gz", good)
+    pkg = humbugga.install(url, checksum, stream=stream)
+    assert (humbugga.path(pkg) / "data.txt").read_bytes() == b"good"
+
+
+def forge_crc32(data, crc):
+    """
+    data with 4 bytes appended so that its CRC-32 is crc. A CRC is affine in its input, so this is linear algebra over GF(2).
+    """
+    base = zlib.crc32(data + bytes(4))
+    columns = [zlib.crc32(data + (1 << bit).to_bytes(4, "little")) ^ base for bit in range(32)]
+    # solve for the bits of x with xor of columns[bit] == base ^ crc, by gaussian elimination
+    rows = [(column, 1 << bit) for bit, column in enumerate(columns)]
+    pivots = []
+    for b in range(32):
+        for i, (column, x) in enumerate(rows):
+            if column >> b & 1:
+                pivot = rows.pop(i)
+                rows = [(c ^ pivot[0], y ^ pivot[1]) if c >> b & 1 else (c, y) for c, y in rows]
+                pivots = [(c ^ pivot[0], y ^ pivot[1]) if c >> b & 1 else (c, y) for c, y in pivots]
+                pivots.append(pivot)
+                break
+    target, x = base ^ crc, 0
+    for column, y in pivots:
+        if target & (column & -column):
+            target ^= column
+            x ^= y
+    assert target == 0
+    forged = data + x.to_bytes(4, "little")
+    assert zlib.crc32(forged) == crc
+    return forged
+
+
+def zipped(files):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for name, data in files.items():
+            z.writestr(name, data)
+    return out.getvalue()
+
+
+def test_upgrade_links_unchanged_files(isolated, publish):
+    url, checksum = publish("v1.zip", zipped({"pkg/same.txt": b"same" * 1000, "pkg/changed.txt": b"one"}))
+    pkg = humbugga.install(url, checksum)
+    same = os.stat(humbugga.path(pkg) / "same.txt").st_ino
+
+    url, checksum = publish("v2.zip", zipped({"pkg/same.txt": b"same" * 1000, "pkg/changed.txt": b"two"}))
+    assert humbugga.install(url, checksum) == pkg
+    assert os.stat(humbugga.path(pkg) / "same.txt").st_ino == same
+    assert (humbugga.path(pkg) / "changed.txt").read_bytes() == b"two"
+    assert humbugga.verify(pkg, full=True) == {}
+
+
+@pytest.mark.parametrize("upgrade", [True, False], ids=["same-package", "other-package"])
+def test_crc32_collision_is_not_linked(isolated, publish, upgrade):
+    original = b"the original contents " * 100
+    forged = forge_crc32((b"something else entirely" * 96)[:2196], zlib.crc32(original))
+    assert len(forged) == len(original) and forged != original
+
+    url, checksum = publish("a.zip", zipped({"pa/data.bin": original}))
+    humbugga.install(url, checksum)
+    url, checksum = publish("b.zip", zipped({"pb/data.bin": forged}))
+    pkg = humbugga.install(url, checksum, pkg="pa" if upgrade else None)
+
+    assert (humbugga.path(pkg) / "data.bin").read_bytes() == forged
+    assert humbugga.verify(pkg, full=True) == {}
@@ -0,0 +1,56 @@
+"""
+Reading members of a virtual tar.gz install, which resumes decompression from the checkpoints in its index.
+
+    python -m pytest tests/
+"""
+
+import io
+import random
+import tarfile
+
+import pytest
+
+import humbugga
+
+
+def incompressible_tarball(path, seed, count=60):
+    # like a folder of .nii.gz or images: gzip stores most of it as-is, in stored blocks, which are byte-aligned;
+    # with a little text here and there, so the blocks around them aren't
+    rng = random.Random(seed)
+    with tarfile.open(path, "w:gz") as tar:
+        for i in range(count):
+            data = rng.randbytes(rng.randint(100_000, 600_000)) + b"hello world " * rng.randint(0, 20_000)
+            info = tarfile.TarInfo(f"pkg/m{i:02d}.nii.gz")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("libz", [True, False], ids=["libz", "no-libz"])
+def test_virtual_targz_members(isolated, monkeypatch, seed, libz):
+    if not libz:
+        monkeypatch.setattr(humbugga, "_libz_handle", False)
+    archive = str(isolated / f"incompressible-{seed}.tar.gz")
+    incompressible_tarball(archive, seed)
+
+    pkg = humbugga._virtual_install(f"http://example.com/incompressible-{seed}.tar.gz", archive)
+    assert len(humbugga._TarIndex.open(archive).checkpoints) > 1 or not libz
+
+    with tarfile.open(archive) as tar:
+        for member in tar.getmembers():
+            name = member.name.split("/", 1)[1]
+            with humbugga.open_member(pkg, name) as f:
+                assert f.read() == tar.extractfile(member).read(), name
+            assert (humbugga.path(pkg) / name).read_bytes() == tar.extractfile(member).read(), name
+
+
+def test_mid_byte_checkpoints_are_exercised(isolated):
+    # the bug was in resuming from a checkpoint that's not on a byte boundary; make sure the archives above have some
+    bits = []
+    for seed in range(4):
+        archive = str(isolated / f"incompressible-{seed}.tar.gz")
+        incompressible_tarball(archive, seed)
+        bits += [c[2] for c in humbugga._TarIndex.open(archive).checkpoints]
+    if humbugga._libz() is None:
+        pytest.skip("no libz, so no checkpoints")
+    assert any(bits)
@@ -0,0 +1,58 @@
+"""
+Reading files out of virtual installs of zips.
+
+    python -m pytest tests/
+"""
+
+import tracemalloc
+import zipfile
+
+import humbugga
+
+
+def install_zip(isolated, name, files, compression=zipfile.ZIP_DEFLATED):
+    archive = isolated / name
+    with zipfile.ZipFile(archive, "w", compression=compression) as z:
+        for member, data in files.items():
+            z.writestr(f"pkg/{member}", data)
+    return humbugga._virtual_install(f"http://example.com/{name}", str(archive), pkg=name.split(".")[0])
+
+
+def test_compressed_member_is_streamed(isolated):
+    pkg = install_zip(isolated, "big.zip", {"big.txt": b"a line of text\n" * 2_000_000}) # 30MB, deflated to ~60KB
+    tracemalloc.start()
+    try:
+        with (humbugga.path(pkg) / "big.txt").open() as f:
+            assert f.readline() == "a line of text\n"
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 2<<20
+
+
+def test_stored_member_is_a_view(isolated):
+    pkg = install_zip(isolated, "stored.zip", {"data.bin": b"x" * 1000}, compression=zipfile.ZIP_STORED)
+    view = (humbugga.path(pkg) / "data.bin").view()
+    assert bytes(view) == b"x" * 1000
+    with (humbugga.path(pkg) / "data.bin").open('rb') as f:
+        assert f.read() == b"x" * 1000
+
+
+def test_open_archives_are_bounded(isolated, monkeypatch):
+    monkeypatch.setattr(humbugga, "_OPEN_ARCHIVES", 2)
+    monkeypatch.setattr(humbugga._Archive, "_cache", {})
+    roots = [humbugga.path(install_zip(isolated, f"p{i}.zip", {"data.txt": f"{i}"})) for i in range(4)]
+    assert len(humbugga._Archive._cache) == 2
+    assert roots[0]._archive._zip is None # closed
+    # but still usable, by whoever kept hold of it
+    assert [(root / "data.txt").read_text() for root in roots] == ["0", "1", "2", "3"]
+
+
+def test_replaced_archive_is_closed(isolated, monkeypatch):
+    monkeypatch.setattr(humbugga._Archive, "_cache", {})
+    pkg = install_zip(isolated, "p.zip", {"data.txt": "old"})
+    old = humbugga.path(pkg)._archive
+    assert (humbugga.path(pkg) / "data.txt").read_text() == "old"
+    install_zip(isolated, "p.zip", {"data.txt": "new, and longer"})
+    assert (humbugga.path(pkg) / "data.txt").read_text() == "new, and longer"
+    assert old._zip is None and list(humbugga._Archive._cache.values()) != [old]